@@ -1,26 +1,63 @@
 from flask import Flask
 from database.models import db
+from database import audit, engine, migrations
+from database.explain import explain_queries_command
+from database.credentials import rotate_credentials_command
+from app.holdings import check_holdings_command
+from app.cost_basis import cost_basis_command
+from app.prices import load_prices_command
+from app import coinbase_clients, data_versions, identity, jobs, json_provider, logs, metrics, prices
 from app.routes.main import main_bp
 from app.routes.auth import auth_bp
 from app.routes.coinbase import coinbase_bp
 from app.routes.fidelity import fidelity_bp
 from app.routes.settings import settings_bp
+from app.routes.jobs import jobs_bp
+from app.routes.api import api_bp
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     app.config.from_pyfile('../config.py')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///crypto.db'
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', 'sqlite:///crypto.db')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.setdefault('IMPORT_BATCH_SIZE', 1000)
+    app.config.setdefault('IMPORT_CHUNK_SIZE', 50000)
+    app.config.setdefault('COINBASE_SYNC_CONCURRENCY', 8)
+    app.config.setdefault('COINBASE_PAGE_LIMIT', 100)
+    app.config.setdefault('CHART_MAX_POINTS', 365)
+    app.config.setdefault('COST_BASIS_METHOD', 'fifo')
+    if config:
+        app.config.update(config)
 
+    logs.init_app(app)
+    json_provider.init_app(app)
     db.init_app(app)
+    engine.init_app(app, db)
+    audit.init_app(app, db)
 
     with app.app_context():
         db.create_all()
+        migrations.upgrade()
+
+    # Registered first so request timings include loading the user
+    metrics.init_app(app, db)
+    identity.init_app(app)
+    coinbase_clients.init_app(app)
+    jobs.init_app(app)
+    prices.init_app(app)
+    data_versions.init_app(app)
+    app.cli.add_command(explain_queries_command)
+    app.cli.add_command(check_holdings_command)
+    app.cli.add_command(cost_basis_command)
+    app.cli.add_command(load_prices_command)
+    app.cli.add_command(rotate_credentials_command)
 
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(coinbase_bp, url_prefix='/coinbase')
     app.register_blueprint(fidelity_bp, url_prefix='/fidelity')
     app.register_blueprint(settings_bp)
+    app.register_blueprint(jobs_bp, url_prefix='/jobs')
+    app.register_blueprint(api_bp, url_prefix='/api')
 
     return app
\ No newline at end of file
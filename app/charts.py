@@ -0,0 +1,147 @@
+# Balance-over-time series for the transaction charts. The running balance is
+# computed by the database from the daily holdings series; the result is then
+# downsampled so the chart payload stays bounded however long the history is.
+# Each kept day is also valued with the as-of prices of the price store.
+from flask import current_app
+from sqlalchemy import func, select
+import numpy as np
+from database.models import db, DailyHolding
+from app.prices import day_numbers, price_series, value_series
+
+DEFAULT_MAX_POINTS = 365
+
+RESOLUTIONS = ('auto', 'day', 'week', 'month')
+
+
+def balance_series(user_id, source, currency=None):
+    """(day, balance) rows, one per day with activity, oldest first.
+
+    The balance is a running ``SUM() OVER (ORDER BY day)`` of the daily nets,
+    so both sources share the stored sign convention (sells already negative).
+    """
+    series = DailyHolding.__table__.c
+    daily_net = func.sum(series.net)
+    query = (
+        select(series.day, func.sum(daily_net).over(order_by=series.day))
+        .where(series.user_id == user_id, series.source == source)
+        .group_by(series.day)
+        .order_by(series.day)
+    )
+    if currency:
+        query = query.where(series.currency == currency)
+    return [(day, float(balance)) for day, balance in db.session.execute(query)]
+
+
+def currency_series(user_id, source, currencies=None):
+    """{currency: [(day, balance), ...]} for several currencies in one query."""
+    series = DailyHolding.__table__.c
+    query = (
+        select(series.currency, series.day, series.balance)
+        .where(series.user_id == user_id, series.source == source)
+        .order_by(series.currency, series.day)
+    )
+    if currencies:
+        query = query.where(series.currency.in_(currencies))
+    grouped = {}
+    for currency, day, balance in db.session.execute(query):
+        grouped.setdefault(currency, []).append((day, balance))
+    return grouped
+
+
+def _bucket(day, resolution):
+    if resolution == 'week':
+        year, week, _ = day.isocalendar()
+        return year, week
+    if resolution == 'month':
+        return day.year, day.month
+    return day
+
+
+def last_per_bucket(rows, resolution):
+    # The end-of-bucket balance is the last row that falls into each bucket
+    buckets = {}
+    for day, balance in rows:
+        buckets[_bucket(day, resolution)] = (day, balance)
+    return list(buckets.values())
+
+
+def lttb(rows, threshold):
+    """Largest-Triangle-Three-Buckets downsampling to ``threshold`` points.
+
+    Keeps the first and last point and, per bucket, the point forming the
+    largest triangle with its neighbours, which preserves peaks and dips.
+    """
+    if threshold >= len(rows) or threshold < 3:
+        return list(rows)
+
+    xs = [day.toordinal() for day, _ in rows]
+    ys = [balance for _, balance in rows]
+    sampled = [rows[0]]
+    every = (len(rows) - 2) / (threshold - 2)
+    selected = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(rows))
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((xs[selected] - avg_x) * (ys[j] - ys[selected])
+                       - (xs[selected] - xs[j]) * (avg_y - ys[selected]))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(rows[best])
+        selected = best
+    sampled.append(rows[-1])
+    return sampled
+
+
+def downsample(rows, resolution='auto', max_points=DEFAULT_MAX_POINTS):
+    if resolution == 'auto':
+        # Finest calendar resolution that fits, then LTTB if even months do not
+        for candidate in ('day', 'week', 'month'):
+            bucketed = last_per_bucket(rows, candidate)
+            if len(bucketed) <= max_points:
+                return bucketed
+        return lttb(bucketed, max_points)
+    return lttb(last_per_bucket(rows, resolution), max_points)
+
+
+def chart_data(user_id, source, currency=None, resolution='auto'):
+    """Chart.js labels, quantities and market values for the transactions pages."""
+    if resolution not in RESOLUTIONS:
+        resolution = 'auto'
+    max_points = current_app.config.get('CHART_MAX_POINTS', DEFAULT_MAX_POINTS)
+    rows = downsample(balance_series(user_id, source, currency), resolution, max_points)
+    days = [day for day, _ in rows]
+    return {
+        'labels': [day.isoformat() for day in days],
+        'values': [balance for _, balance in rows],
+        'market_values': value_series(user_id, source, days, currency).round(2).tolist(),
+    }
+
+
+def currency_chart_data(user_id, source, currencies=None, resolution='auto'):
+    """Per-currency labels, quantities and market values, from one query.
+
+    The stored end-of-day balances are downsampled per currency; each kept
+    point is valued with the currency's as-of price.
+    """
+    if resolution not in RESOLUTIONS:
+        resolution = 'auto'
+    max_points = current_app.config.get('CHART_MAX_POINTS', DEFAULT_MAX_POINTS)
+    charts = {}
+    for currency, rows in currency_series(user_id, source, currencies).items():
+        rows = downsample(rows, resolution, max_points)
+        balances = np.array([balance for _, balance in rows])
+        prices = price_series(user_id, source, currency).as_of(day_numbers([day for day, _ in rows]))
+        charts[currency] = {
+            'labels': [day.isoformat() for day, _ in rows],
+            'values': balances.tolist(),
+            'market_values': [None if value != value else value for value in (balances * prices).round(2).tolist()],
+        }
+    return charts
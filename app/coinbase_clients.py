@@ -0,0 +1,103 @@
+# Pool of authenticated Coinbase clients. Each client owns a requests session,
+# so reusing clients across syncs keeps their keep-alive connections (and TLS
+# sessions) instead of handshaking again for every job.
+from collections import namedtuple
+from contextlib import contextmanager
+from flask import current_app
+from coinbase.wallet.client import Client
+from database.models import credential_cipher
+from app.lru import LRUCache
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Encrypted credentials as stored on the user; they double as the pool key, so
+# a credential change can never be served a client built from the old ones
+Credentials = namedtuple('Credentials', ['user_id', 'api_key', 'api_secret'])
+
+
+def credentials_for(user):
+    return Credentials(user.id, user.coinbase_api_key, user.coinbase_api_secret)
+
+
+def _close(client):
+    try:
+        client.session.close()
+    except Exception as e:
+        logger.debug(f"Error closing Coinbase client session: {e}")
+
+
+class ClientPool:
+    """Idle Coinbase clients, bounded in number and idle time.
+
+    A client is checked out by one thread at a time because requests sessions
+    are not thread-safe; a sync running N workers grows the user's share of
+    the pool to N clients. Decrypted credentials are cached alongside, so the
+    secrets are decrypted once per credential change rather than per client.
+    """
+
+    def __init__(self, maxsize=32, ttl=600, base_api_uri=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.base_api_uri = base_api_uri
+        # (credentials, serial) -> client, one entry per idle client
+        self._idle = LRUCache(maxsize, ttl)
+        self._plaintext = LRUCache(maxsize, ttl)
+        self._serial = itertools.count()
+
+    def _checkout(self, credentials):
+        for stale in self._idle.expire():
+            _close(stale)
+        client = self._idle.take(lambda key: key[0] == credentials)
+        if client is not None:
+            return client
+
+        plaintext = self._plaintext.get(credentials)
+        if plaintext is None:
+            cipher = credential_cipher()
+            plaintext = (cipher.decrypt(credentials.api_key.encode()).decode(),
+                         cipher.decrypt(credentials.api_secret.encode()).decode())
+            self._plaintext.put(credentials, plaintext)
+        return Client(*plaintext, base_api_uri=self.base_api_uri)
+
+    def _checkin(self, credentials, client):
+        # Beyond maxsize the least recently returned clients are dropped
+        for stale in self._idle.put((credentials, next(self._serial)), client):
+            _close(stale)
+
+    @contextmanager
+    def client(self, credentials):
+        client = self._checkout(credentials)
+        try:
+            yield client
+        finally:
+            self._checkin(credentials, client)
+
+    def invalidate(self, user_id):
+        self._plaintext.discard(lambda key: key.user_id == user_id)
+        for client in self._idle.discard(lambda key: key[0].user_id == user_id):
+            _close(client)
+
+    def clear(self):
+        self._plaintext.clear()
+        for client in self._idle.clear():
+            _close(client)
+
+
+def client_pool():
+    return current_app.extensions['coinbase_clients']
+
+
+def invalidate_clients(user_id):
+    client_pool().invalidate(user_id)
+
+
+def init_app(app):
+    app.config.setdefault('COINBASE_CLIENT_POOL_SIZE', 32)
+    app.config.setdefault('COINBASE_CLIENT_TTL', 600)
+    # None uses the real API; point it at benchmarks.fake_coinbase for offline runs
+    app.config.setdefault('COINBASE_API_URL', None)
+    app.extensions['coinbase_clients'] = ClientPool(app.config['COINBASE_CLIENT_POOL_SIZE'],
+                                                    app.config['COINBASE_CLIENT_TTL'],
+                                                    app.config['COINBASE_API_URL'])
@@ -0,0 +1,186 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from flask import current_app
+from database.engine import serialized_write
+from database.models import db, User, CoinbaseSyncCursor
+from app.coinbase_clients import client_pool, credentials_for
+from app.importers import ImportResult, bulk_insert_transactions, signed_amount, transaction_row, update_statuses
+from datetime import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PAGE_LIMIT = 100
+
+# Statuses a Coinbase transaction never leaves; anything else may still settle
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'canceled')
+
+
+@dataclass
+class AccountSync:
+    account_id: str
+    name: str
+    cursor: str = None
+    fetched: int = 0
+    new: int = 0
+    updated: int = 0
+    pages: int = 0
+    seconds: float = 0.0
+    error: str = None
+
+
+def paginate(fetch, *args, limit=DEFAULT_PAGE_LIMIT, **params):
+    # Follow Coinbase cursor pagination until the last page; yields one page at a time
+    params['limit'] = limit
+    while True:
+        page = fetch(*args, **params)
+        yield page['data']
+        pagination = page.pagination
+        if not pagination or not pagination.get('next_starting_after'):
+            return
+        params['starting_after'] = pagination['next_starting_after']
+
+
+def _fetch_account(clients, credentials, account, limit, cursor):
+    sync = AccountSync(account_id=account['id'], name=account.get('name') or account['id'], cursor=cursor)
+    transactions = []
+    started = time.perf_counter()
+    # Oldest first, so the last transaction fetched becomes the next watermark
+    params = {'order': 'asc'}
+    if cursor:
+        params['starting_after'] = cursor
+    try:
+        with clients.client(credentials) as client:
+            try:
+                for page in paginate(client.get_transactions, account['id'], limit=limit, **params):
+                    sync.pages += 1
+                    transactions.extend(page)
+            except Exception as e:
+                if not cursor or sync.pages:
+                    raise
+                # The watermark transaction is gone on Coinbase's side; fall back to a full fetch
+                logger.warning(f"Coinbase cursor {cursor} for account {sync.account_id} rejected ({e}); refetching")
+                sync.cursor = None
+                for page in paginate(client.get_transactions, account['id'], limit=limit, order='asc'):
+                    sync.pages += 1
+                    transactions.extend(page)
+    except Exception as e:
+        sync.error = str(e)
+    sync.fetched = len(transactions)
+    sync.seconds = time.perf_counter() - started
+    return sync, transactions
+
+
+def _advance_cursor(cursors, user_id, sync, transactions):
+    cursor = cursors.get(sync.account_id)
+    if cursor is None:
+        cursor = CoinbaseSyncCursor(user_id=user_id, account_id=sync.account_id)
+        db.session.add(cursor)
+    # The watermark stays before the first transaction that may still change,
+    # so the next incremental sync fetches it again with its new status
+    final = next((index for index, tx in enumerate(transactions) if tx.get('status') not in FINAL_STATUSES),
+                 len(transactions))
+    if final:
+        newest = transactions[final - 1]
+        cursor.last_tx_id = newest['id']
+        cursor.last_created_at = datetime.strptime(newest['created_at'], '%Y-%m-%dT%H:%M:%SZ')
+    cursor.last_synced_at = datetime.utcnow()
+    cursor.last_fetched = sync.fetched
+    cursor.last_new = sync.new
+
+
+def transaction_rows(transactions, user_id, result):
+    rows = []
+    for tx in transactions:
+        try:
+            tx_type = tx['type']
+            amount = signed_amount(tx_type, float(tx['amount']['amount']))
+            rows.append(transaction_row(
+                tx['id'], user_id, tx_type, amount, tx['amount']['currency'],
+                datetime.strptime(tx['created_at'], '%Y-%m-%dT%H:%M:%SZ'),
+                'coinbase', status=tx['status'],
+            ))
+        except Exception as e:
+            result.record_failure(tx.get('id'), f"{type(e).__name__}: {e}")
+    return rows
+
+
+def sync_transactions(progress, user_id, full=False):
+    """Fetch new transactions of every Coinbase account concurrently and store them.
+
+    Each account resumes after its CoinbaseSyncCursor, so an up-to-date account
+    costs one empty page request; ``full=True`` ignores the cursors and
+    refetches everything. Accounts are fetched on COINBASE_SYNC_CONCURRENCY
+    threads, each checking out its own pooled client, and all writes share
+    one transaction.
+    """
+    credentials = credentials_for(db.session.get(User, user_id))
+    clients = client_pool()
+    concurrency = current_app.config.get('COINBASE_SYNC_CONCURRENCY', DEFAULT_CONCURRENCY)
+    limit = current_app.config.get('COINBASE_PAGE_LIMIT', DEFAULT_PAGE_LIMIT)
+    started = time.perf_counter()
+
+    with clients.client(credentials) as client:
+        accounts = [account for page in paginate(client.get_accounts, limit=limit) for account in page]
+    cursors = {cursor.account_id: cursor for cursor in CoinbaseSyncCursor.query.filter_by(user_id=user_id)}
+
+    syncs = []
+    fetched = []
+    executor = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(accounts))),
+                                  thread_name_prefix='coinbase-sync')
+    try:
+        futures = []
+        for account in accounts:
+            cursor = None if full or account['id'] not in cursors else cursors[account['id']].last_tx_id
+            futures.append(executor.submit(_fetch_account, clients, credentials, account, limit, cursor))
+        for future in as_completed(futures):
+            sync, transactions = future.result()
+            syncs.append(sync)
+            fetched.append((sync, transactions))
+            progress.update(rows_parsed=sum(s.fetched for s in syncs))
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    result = ImportResult()
+    with serialized_write('coinbase sync'):
+        for sync, transactions in fetched:
+            account_result = ImportResult()
+            rows = transaction_rows(transactions, user_id, account_result)
+            account_result += bulk_insert_transactions(rows)
+            sync.new = account_result.inserted
+            sync.updated = update_statuses(rows)
+            result += account_result
+            if not sync.error:
+                _advance_cursor(cursors, user_id, sync, transactions)
+        db.session.commit()
+    progress.update(rows_parsed=result.total, inserted=result.inserted,
+                    skipped=result.skipped, failed=result.failed)
+
+    for sync in sorted(syncs, key=lambda s: s.seconds, reverse=True):
+        mode = 'incremental' if sync.cursor else 'full'
+        if sync.error:
+            logger.error(f"Coinbase account {sync.name} ({sync.account_id}) {mode} sync failed after "
+                         f"{sync.seconds:.2f}s: {sync.error}")
+        else:
+            logger.info(f"Coinbase account {sync.name} ({sync.account_id}) {mode} sync: fetched {sync.fetched}, "
+                        f"new {sync.new}, updated {sync.updated}, {sync.pages} pages in {sync.seconds:.2f}s")
+
+    if result.failed:
+        logger.warning(f"Coinbase sync for user {user_id}: {result.failure_summary()}")
+
+    failed_accounts = [sync for sync in syncs if sync.error]
+    message = (f'Successfully imported {result.inserted} new of {result.total} fetched transactions from Coinbase '
+               f'({len(accounts)} accounts in {time.perf_counter() - started:.1f}s')
+    if syncs:
+        slowest = max(syncs, key=lambda s: s.seconds)
+        message += f', slowest {slowest.name} {slowest.seconds:.2f}s'
+    message += ').'
+    if failed_accounts:
+        message += f' {len(failed_accounts)} accounts failed: ' + ', '.join(s.name for s in failed_accounts)
+    return message
+
+
+def reset_cursors(user_id):
+    CoinbaseSyncCursor.query.filter_by(user_id=user_id).delete()
@@ -0,0 +1,362 @@
+from sqlalchemy import bindparam, func, select
+from database.engine import serialized_write
+from database.models import db, CostBasisLot, CostBasisState, Holding, Transaction, SETTLED_STATUS
+from app.holdings import ZERO_TOLERANCE
+from flask import current_app
+import click
+import heapq
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('fifo', 'lifo', 'hifo')
+
+# Disposals of these types move coins out without selling them: their lots
+# leave at cost and no gain is realized
+TRANSFER_TYPES = ('send', 'withdrawal', 'transfer')
+
+# Convert rows are stored as '<id>_sell' / '<id>_buy' pairs (see app/importers/schemas.py)
+CONVERT_BUY_SUFFIX = '_buy'
+CONVERT_SELL_SUFFIX = '_sell'
+
+PARTNER_BATCH_SIZE = 500
+
+
+def default_method():
+    return current_app.config['COST_BASIS_METHOD']
+
+
+def _series_rows(user_id, source, currency, after_id=0):
+    # Columns as NumPy arrays, in replay order: (timestamp, id)
+    t = Transaction.__table__.c
+    rows = db.session.execute(
+        select(t.id, t.timestamp, t.type, t.amount, t.price_at_transaction, t.coinbase_tx_id)
+        .where(t.user_id == user_id, t.source == source, t.currency == currency, t.id > after_id,
+               t.status == SETTLED_STATUS)
+        .order_by(t.timestamp, t.id)
+    ).all()
+    if not rows:
+        return None
+    ids, timestamps, types, amounts, prices, tx_ids = zip(*rows)
+    return {
+        'id': np.array(ids, dtype='int64'),
+        'timestamp': list(timestamps),
+        'type': types,
+        'amount': np.array(amounts, dtype='float64'),
+        'price': np.array(prices, dtype='float64'),
+        'tx_id': tx_ids,
+    }
+
+
+def _convert_costs(user_id, tx_ids):
+    # Total USD value of the sell half of each Convert, keyed by the buy half's id
+    partners = {tx_id[:-len(CONVERT_BUY_SUFFIX)] + CONVERT_SELL_SUFFIX: tx_id for tx_id in tx_ids}
+    costs = {}
+    names = list(partners)
+    for start in range(0, len(names), PARTNER_BATCH_SIZE):
+        batch = names[start:start + PARTNER_BATCH_SIZE]
+        for tx_id, amount, price in db.session.execute(
+            select(Transaction.coinbase_tx_id, Transaction.amount, Transaction.price_at_transaction)
+            .where(Transaction.user_id == user_id, Transaction.coinbase_tx_id.in_(batch))
+        ):
+            if price is not None:
+                costs[partners[tx_id]] = abs(amount) * price
+    return costs
+
+
+def unit_costs(user_id, series):
+    """Cost per unit of every row: its price, or for the buy half of a Convert
+    the value given up in the sell half. Unknown costs count as zero."""
+    amounts, prices = series['amount'], series['price']
+    costs = np.where(np.isnan(prices), 0.0, prices)
+    missing = np.flatnonzero(np.isnan(prices) & (amounts > 0))
+    converts = [i for i in missing.tolist() if series['tx_id'][i].endswith(CONVERT_BUY_SUFFIX)]
+    if converts:
+        values = _convert_costs(user_id, [series['tx_id'][i] for i in converts])
+        for i in converts:
+            value = values.get(series['tx_id'][i])
+            if value is not None:
+                costs[i] = value / amounts[i]
+    return costs
+
+
+def _match_fifo(lot_qty, lot_cost, quantity):
+    # Cumulative quantities turn FIFO into pointer arithmetic: disposals consume
+    # the acquisition stream in order, never past what was acquired so far
+    acquired = np.where(quantity > 0, quantity, 0.0)
+    disposed = np.where(quantity < 0, -quantity, 0.0)
+    opening = lot_qty[:len(lot_qty) - np.count_nonzero(acquired)].sum()
+    available = opening + np.cumsum(acquired)
+    wanted = np.cumsum(disposed)
+    # Shortfalls are unmatched and stay unmatched when later lots arrive
+    shortfall = np.minimum.accumulate(np.minimum(available - wanted, 0.0))
+    consumed = wanted + shortfall
+    matched = np.diff(consumed, prepend=0.0)
+
+    lot_ends = np.cumsum(lot_qty)
+    lot_starts = lot_ends - lot_qty
+    cost_curve = np.concatenate(([0.0], np.cumsum(lot_qty * lot_cost)))
+    cost = np.diff(np.interp(consumed, np.concatenate(([0.0], lot_ends)), cost_curve), prepend=0.0)
+    end = consumed[-1] if len(consumed) else 0.0
+    remaining = np.clip(lot_ends - np.maximum(lot_starts, end), 0.0, None)
+    return cost, disposed - matched, remaining
+
+
+def _match_ordered(method, lot_qty, lot_cost, quantity, n_open):
+    # LIFO takes the newest open lot, HIFO the most expensive; both need a loop
+    remaining = lot_qty.tolist()
+    lot_costs = lot_cost.tolist()
+    cost = np.zeros(len(quantity))
+    unmatched = np.zeros(len(quantity))
+    if method == 'lifo':
+        pool = list(range(n_open))
+        push, peek, pop = pool.append, (lambda: pool[-1]), pool.pop
+    else:
+        pool = [(-lot_costs[i], i) for i in range(n_open)]
+        heapq.heapify(pool)
+        push = lambda i: heapq.heappush(pool, (-lot_costs[i], i))
+        peek = lambda: pool[0][1]
+        pop = lambda: heapq.heappop(pool)
+
+    next_lot = n_open
+    for k, q in enumerate(quantity.tolist()):
+        if q > 0:
+            push(next_lot)
+            next_lot += 1
+            continue
+        need = -q
+        total = 0.0
+        while need > 0 and pool:
+            i = peek()
+            if remaining[i] <= need:
+                take = remaining[i]
+                remaining[i] = 0.0
+                pop()
+            else:
+                take = need
+                remaining[i] -= need
+            total += take * lot_costs[i]
+            need -= take
+        cost[k] = total
+        unmatched[k] = max(need, 0.0)
+    return cost, unmatched, np.array(remaining, dtype='float64')
+
+
+def match_lots(method, lot_qty, lot_cost, quantity):
+    """Match disposals against lots.
+
+    ``lot_qty``/``lot_cost`` are the open lots in acquisition order followed by
+    every acquisition (quantity > 0) in ``quantity``, the signed amounts in
+    replay order. Returns the cost of each disposal, the quantity of each
+    disposal left unmatched and the remaining quantity of every lot.
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown cost basis method {method}')
+    if method == 'fifo':
+        return _match_fifo(lot_qty, lot_cost, quantity)
+    return _match_ordered(method, lot_qty, lot_cost, quantity, len(lot_qty) - int(np.count_nonzero(quantity > 0)))
+
+
+def _open_lots(state):
+    lots = CostBasisLot.__table__.c
+    return db.session.execute(
+        select(lots.id, lots.transaction_id, lots.acquired_at, lots.quantity, lots.unit_cost)
+        .where(lots.state_id == state.id)
+        .order_by(lots.acquired_at, lots.transaction_id)
+    ).all()
+
+
+def _replay(state, series, opening, user_id):
+    # Match ``series`` on top of the ``opening`` lots and write the changes
+    costs = unit_costs(user_id, series)
+    quantity = series['amount']
+    buys = np.flatnonzero(quantity > 0)
+    lot_qty = np.concatenate(([lot.quantity for lot in opening], quantity[buys]))
+    lot_cost = np.concatenate(([lot.unit_cost for lot in opening], costs[buys]))
+
+    cost, unmatched, remaining = match_lots(state.method, lot_qty, lot_cost, quantity)
+    unmatched[unmatched <= ZERO_TOLERANCE * np.maximum(1.0, -quantity)] = 0.0
+
+    priced = ~np.isnan(series['price'])
+    sales = (quantity < 0) & priced & ~np.isin(np.char.lower(np.array(series['type'], dtype=str)), TRANSFER_TYPES)
+    sold = np.where(sales, -quantity - unmatched, 0.0)
+    proceeds = float(np.dot(sold[sales], series['price'][sales]))
+    cost_of_sold = float(cost[sales].sum())
+    state.proceeds += proceeds
+    state.cost_of_sold += cost_of_sold
+    state.realized_gain += proceeds - cost_of_sold
+    state.unmatched_quantity += float(unmatched.sum())
+
+    # Only a market price; a unit cost would value the lots at their own cost
+    if priced.any():
+        state.last_price = float(series['price'][np.flatnonzero(priced)[-1]])
+    state.tx_count += len(quantity)
+    state.max_transaction_id = max(state.max_transaction_id, int(series['id'].max()))
+    last_timestamp = series['timestamp'][-1]
+    if state.last_timestamp is None or last_timestamp > state.last_timestamp:
+        state.last_timestamp = last_timestamp
+
+    tolerance = ZERO_TOLERANCE * np.maximum(1.0, lot_qty)
+    table = CostBasisLot.__table__
+    spent = [lot.id for lot, left, tol in zip(opening, remaining.tolist(), tolerance.tolist()) if left <= tol]
+    changed = [{'lot_id': lot.id, 'quantity': left}
+               for lot, left, tol in zip(opening, remaining.tolist(), tolerance.tolist())
+               if left > tol and left != lot.quantity]
+    if spent:
+        db.session.execute(table.delete().where(table.c.id.in_(spent)))
+    if changed:
+        db.session.execute(
+            table.update().where(table.c.id == bindparam('lot_id')).values(quantity=bindparam('quantity')),
+            changed,
+        )
+    new_lots = [
+        {'state_id': state.id, 'transaction_id': int(series['id'][i]), 'acquired_at': series['timestamp'][i],
+         'quantity': left, 'unit_cost': float(costs[i])}
+        for i, left, tol in zip(buys.tolist(), remaining[len(opening):].tolist(), tolerance[len(opening):].tolist())
+        if left > tol
+    ]
+    if new_lots:
+        db.session.execute(table.insert(), new_lots)
+
+
+def _reset(state):
+    db.session.execute(CostBasisLot.__table__.delete().where(CostBasisLot.state_id == state.id))
+    state.tx_count = 0
+    state.max_transaction_id = 0
+    state.last_timestamp = None
+    state.last_price = None
+    state.proceeds = state.cost_of_sold = state.realized_gain = state.unmatched_quantity = 0.0
+
+
+def _refresh_currency(state, user_id, source, currency, expected_count):
+    if state.tx_count:
+        # Appends continue from the stored lots; anything landing before the
+        # replayed history (or a count that no longer adds up) replays the currency
+        series = _series_rows(user_id, source, currency, state.max_transaction_id)
+        appended = series is not None and state.tx_count + len(series['amount']) == expected_count
+        if appended and min(series['timestamp']) >= state.last_timestamp:
+            _replay(state, series, _open_lots(state), user_id)
+            return 'appended'
+        _reset(state)
+    series = _series_rows(user_id, source, currency)
+    if series is not None:
+        _replay(state, series, [], user_id)
+    return 'replayed'
+
+
+def _stale(user_id, source, method):
+    counts = dict(
+        db.session.query(Holding.currency, Holding.settled_count).filter_by(user_id=user_id, source=source)
+        .filter(Holding.settled_count > 0)
+    )
+    states = {state.currency: state for state in
+              CostBasisState.query.filter_by(user_id=user_id, source=source, method=method)}
+    stale = {currency: count for currency, count in counts.items()
+             if currency not in states or states[currency].tx_count != count}
+    removed = [state for currency, state in states.items() if currency not in counts]
+    return stale, states, removed
+
+
+def refresh_cost_basis(user_id, source, method=None):
+    """Bring the stored lots of every currency up to date with its transactions.
+
+    Currencies whose transaction count still matches are skipped without
+    touching the writer queue. Returns {currency: 'appended' | 'replayed'}.
+    """
+    method = method or default_method()
+    stale, _, removed = _stale(user_id, source, method)
+    if not stale and not removed:
+        return {}
+    refreshed = {}
+    with serialized_write('cost basis'):
+        # Re-read under the writer lock; another request may have refreshed meanwhile
+        stale, states, removed = _stale(user_id, source, method)
+        for state in removed:
+            _reset(state)
+            db.session.delete(state)
+        for currency, count in sorted(stale.items()):
+            state = states.get(currency)
+            if state is None:
+                state = CostBasisState(user_id=user_id, source=source, currency=currency, method=method)
+                _reset(state)
+                db.session.add(state)
+                db.session.flush()
+            refreshed[currency] = _refresh_currency(state, user_id, source, currency, count)
+        db.session.commit()
+    logger.debug(f"Cost basis ({method}) for user {user_id} {source}: {refreshed}")
+    return refreshed
+
+
+def clear_cost_basis(user_id, source, method=None, currency=None):
+    # Caller commits, like clear_holdings
+    states = CostBasisState.query.filter_by(user_id=user_id, source=source)
+    if method is not None:
+        states = states.filter_by(method=method)
+    if currency is not None:
+        states = states.filter_by(currency=currency)
+    state_ids = states.with_entities(CostBasisState.id).scalar_subquery()
+    db.session.execute(CostBasisLot.__table__.delete().where(CostBasisLot.state_id.in_(state_ids)))
+    states.delete(synchronize_session=False)
+
+
+def cost_basis_summary(user_id, source, method=None, prices=None):
+    """Per-currency cost basis and gains from the stored lots.
+
+    ``prices`` maps currency to a current unit price; without it, currencies
+    are valued at the last price seen in their own transactions. Currencies
+    with no price have no market value and no unrealized gain.
+    """
+    method = method or default_method()
+    lots = CostBasisLot.__table__.c
+    open_lots = (
+        select(lots.state_id, func.sum(lots.quantity).label('quantity'),
+               func.sum(lots.quantity * lots.unit_cost).label('cost'))
+        .group_by(lots.state_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(CostBasisState, open_lots.c.quantity, open_lots.c.cost)
+        .outerjoin(open_lots, open_lots.c.state_id == CostBasisState.id)
+        .where(CostBasisState.user_id == user_id, CostBasisState.source == source, CostBasisState.method == method)
+        .order_by(CostBasisState.currency)
+    ).all()
+
+    summary = []
+    for state, quantity, cost in rows:
+        quantity = quantity or 0.0
+        cost = cost or 0.0
+        price = state.last_price if prices is None else prices.get(state.currency)
+        market_value = quantity * price if price is not None else None
+        summary.append({
+            'currency': state.currency,
+            'quantity': quantity,
+            'cost_basis': cost,
+            'average_cost': cost / quantity if quantity > ZERO_TOLERANCE else None,
+            'price': price,
+            'market_value': market_value,
+            'unrealized_gain': market_value - cost if market_value is not None else None,
+            'proceeds': state.proceeds,
+            'realized_gain': state.realized_gain,
+            'unmatched_quantity': state.unmatched_quantity,
+        })
+    return summary
+
+
+@click.command('cost-basis')
+@click.option('--user-id', type=int, required=True)
+@click.option('--source', type=click.Choice(['coinbase', 'fidelity']), default='coinbase')
+@click.option('--method', type=click.Choice(METHODS), help='Defaults to COST_BASIS_METHOD.')
+@click.option('--rebuild', is_flag=True, help='Drop the stored lots and replay every transaction.')
+def cost_basis_command(user_id, source, method, rebuild):
+    """Print open lots and realized gains per currency."""
+    method = method or default_method()
+    if rebuild:
+        with serialized_write('cost basis'):
+            clear_cost_basis(user_id, source, method)
+            db.session.commit()
+    refresh_cost_basis(user_id, source, method)
+    for row in cost_basis_summary(user_id, source, method):
+        unrealized = f"{row['unrealized_gain']:.2f}" if row['unrealized_gain'] is not None else '-'
+        click.echo(f"{row['currency']:<8} qty {row['quantity']:.8f}  cost {row['cost_basis']:.2f}  "
+                   f"unrealized {unrealized}  realized {row['realized_gain']:.2f}")
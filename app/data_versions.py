@@ -0,0 +1,119 @@
+# Per-user data versions for conditional GETs. Every write path bumps the
+# version of the scopes it changes in the same transaction, so a page built
+# from those scopes can be identified by their versions alone: a matching
+# If-None-Match (or If-Modified-Since) is answered with 304 before the view
+# runs any balance, pagination or chart query.
+from datetime import datetime
+from functools import wraps
+from flask import current_app, g, make_response, request, session
+from sqlalchemy import select
+from werkzeug.http import is_resource_modified
+from database.engine import UPSERT_DIALECTS
+from database.models import db, DataVersion
+import hashlib
+import time
+
+
+def user_scope(user_id, source):
+    return f'{source}:{user_id}'
+
+
+def prices_scope(source):
+    # Prices loaded for every user of a source; transaction prices are
+    # covered by the user's own scope
+    return f'prices:{source}'
+
+
+def bump(scopes):
+    """Increment the version of every scope; the caller commits."""
+    scopes = sorted(set(scopes))
+    if not scopes:
+        return
+    now = datetime.utcnow()
+    table = DataVersion.__table__
+    dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['scope'],
+            set_={'version': table.c.version + 1, 'updated_at': stmt.excluded.updated_at},
+        )
+        db.session.execute(stmt, [{'scope': scope, 'version': 1, 'updated_at': now} for scope in scopes])
+        return
+    for scope in scopes:
+        updated = db.session.execute(
+            table.update().where(table.c.scope == scope).values(version=table.c.version + 1, updated_at=now)
+        ).rowcount
+        if not updated:
+            db.session.execute(table.insert().values(scope=scope, version=1, updated_at=now))
+
+
+def bump_users(keys):
+    # keys: (user_id, source) pairs
+    bump(user_scope(user_id, source) for user_id, source in keys)
+
+
+def versions(scopes):
+    # {scope: (version, updated_at)}; scopes never written are left out
+    table = DataVersion.__table__.c
+    return {
+        scope: (version, updated_at) for scope, version, updated_at in db.session.execute(
+            select(table.scope, table.version, table.updated_at).where(table.scope.in_(scopes)))
+    }
+
+
+def etag_for(user_id, scopes, known):
+    # The salt changes with every deploy (ETAG_SALT) or process start, since
+    # the same data can render differently after an upgrade
+    parts = [current_app.config['ETAG_SALT'], str(user_id)]
+    parts.extend(f'{scope}={known.get(scope, (0, None))[0]}' for scope in scopes)
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:20]
+
+
+def _last_modified(known):
+    # HTTP dates have whole seconds: a write later in the same second would
+    # keep the date, so it is only sent once that second is over
+    latest = max(updated_at for _, updated_at in known.values())
+    if latest.replace(microsecond=0) >= datetime.utcnow().replace(microsecond=0):
+        return None
+    return latest
+
+
+def conditional(scopes):
+    """Serve a GET view with a data-version ETag and Last-Modified.
+
+    ``scopes(user_id, **view_args)`` names the scopes the page is built from.
+    Pages with flashed messages are rendered normally and not cached, since
+    the messages are part of the body.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method != 'GET' or g.user is None or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            names = sorted(scopes(g.user.id, **kwargs))
+            known = versions(names)
+            etag = etag_for(g.user.id, names, known)
+            last_modified = _last_modified(known) if len(known) == len(names) else None
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if session.get('_flashes') or response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Always revalidate: the version check is what keeps the page fresh
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapped
+    return decorator
+
+
+def init_app(app):
+    app.config.setdefault('ETAG_SALT', str(time.time_ns()))
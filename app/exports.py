@@ -0,0 +1,89 @@
+# Transaction exports. CSV is streamed: rows go from a server-side cursor
+# through a small buffer (optionally gzip-compressed) straight into the
+# response, so an export holds one batch in memory and never touches the disk.
+# The columnar .npz backup is the compact, typed alternative.
+from flask import Response, current_app, stream_with_context
+from sqlalchemy import select
+from database.models import db, Transaction
+from app.importers import columnar_bytes
+from datetime import datetime
+import csv
+import io
+import zlib
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Transaction columns in the order of CsvSchema.required_columns, then the status column
+EXPORT_FIELDS = (
+    Transaction.coinbase_tx_id,
+    Transaction.timestamp,
+    Transaction.type,
+    Transaction.currency,
+    Transaction.amount,
+    Transaction.price_at_transaction,
+    Transaction.status,
+)
+
+
+def has_transactions(user_id, source):
+    return db.session.query(
+        select(Transaction.id).filter_by(user_id=user_id, source=source).exists()
+    ).scalar()
+
+
+def csv_lines(user_id, schema, extra_columns=(), batch_size=None):
+    """Yield the backup CSV for one source, one encoded batch at a time."""
+    batch_size = batch_size or current_app.config.get('EXPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(schema.required_columns + [schema.status_column] + list(extra_columns))
+    padding = [''] * len(extra_columns)
+
+    rows = db.session.execute(
+        select(*EXPORT_FIELDS)
+        .filter_by(user_id=user_id, source=schema.source)
+        .order_by(Transaction.timestamp, Transaction.id)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for partition in rows.partitions():
+        for tx_id, timestamp, tx_type, currency, amount, price, status in partition:
+            writer.writerow([tx_id, timestamp.isoformat(), tx_type, currency, amount, price, status, *padding])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_response(user_id, schema, prefix, extra_columns=(), compress=False):
+    filename = f"{prefix}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    body = csv_lines(user_id, schema, extra_columns)
+    mimetype = 'text/csv'
+    if compress:
+        body = gzipped(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
+
+
+def columnar_response(user_id, source, prefix):
+    # npz is a zip archive, so it is built in memory and sent in one piece
+    filename = f"{prefix}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.npz"
+    return Response(
+        columnar_bytes(user_id, source),
+        mimetype='application/octet-stream',
+        headers={'Content-Disposition': f'attachment; filename={filename}'},
+    )
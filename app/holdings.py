@@ -0,0 +1,314 @@
+from collections import defaultdict
+from datetime import date
+from sqlalchemy import bindparam, func, select
+from database.engine import UPSERT_DIALECTS
+from database.models import db, DailyHolding, Holding, SETTLED_STATUS
+from database.migrations import daily_holding_totals, holding_totals
+from app.data_versions import bump_users
+import click
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Balances closer to zero than this are treated as fully sold
+ZERO_TOLERANCE = 1e-12
+
+
+def aggregate_deltas(changes):
+    # changes: (user_id, source, currency, amount, timestamp, added, settled), where
+    # added counts new transactions and settled (-1, 0 or 1) moves the amount
+    deltas = defaultdict(lambda: [0.0, 0, 0])
+    for user_id, source, currency, amount, _, added, settled in changes:
+        delta = deltas[(user_id, source, currency)]
+        delta[0] += amount * settled
+        delta[1] += added
+        delta[2] += settled
+    return [
+        {'user_id': user_id, 'source': source, 'currency': currency, 'amount': amount, 'tx_count': count,
+         'settled_count': settled}
+        for (user_id, source, currency), (amount, count, settled) in deltas.items()
+    ]
+
+
+def _apply_changes(changes):
+    deltas = aggregate_deltas(changes)
+    if not deltas:
+        return
+    apply_daily_deltas([change for change in changes if change[6]])
+
+    table = Holding.__table__
+    dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'source', 'currency'],
+            set_={column: table.c[column] + stmt.excluded[column]
+                  for column in ('amount', 'tx_count', 'settled_count')},
+        )
+        db.session.execute(stmt, deltas)
+        return
+
+    for delta in deltas:
+        updated = Holding.query.filter_by(
+            user_id=delta['user_id'], source=delta['source'], currency=delta['currency']
+        ).update({
+            Holding.amount: Holding.amount + delta['amount'],
+            Holding.tx_count: Holding.tx_count + delta['tx_count'],
+            Holding.settled_count: Holding.settled_count + delta['settled_count'],
+        }, synchronize_session=False)
+        if not updated:
+            db.session.execute(table.insert(), delta)
+
+
+def apply_deltas(rows):
+    """Add newly inserted transactions to the holdings table and daily series.
+
+    ``rows`` are (user_id, source, currency, amount, timestamp, status);
+    only settled ones move balances. Runs in the caller's transaction so
+    holdings commit (or roll back) together with the transactions they
+    summarize.
+    """
+    _apply_changes([(user_id, source, currency, amount, timestamp, 1, int(status == SETTLED_STATUS))
+                    for user_id, source, currency, amount, timestamp, status in rows])
+    bump_users({(user_id, source) for user_id, source, *_ in rows})
+
+
+def apply_status_changes(rows):
+    # rows: (user_id, source, currency, amount, timestamp, old_status, new_status)
+    # of stored transactions whose status changed; the caller commits. Returns
+    # the (user_id, source, currency) whose settled transactions changed.
+    changes = []
+    for user_id, source, currency, amount, timestamp, old_status, new_status in rows:
+        settled = int(new_status == SETTLED_STATUS) - int(old_status == SETTLED_STATUS)
+        if settled:
+            changes.append((user_id, source, currency, amount, timestamp, 0, settled))
+    _apply_changes(changes)
+    # The transaction lists show every status, so a change that moves no
+    # balance (e.g. pending to failed) still changes the user's pages
+    bump_users({(user_id, source) for user_id, source, *_ in rows})
+    return {(user_id, source, currency) for user_id, source, currency, *_ in changes}
+
+
+def aggregate_daily_deltas(changes):
+    # {(user_id, source, currency): {day: [net, tx_count]}} of settled changes
+    series = defaultdict(lambda: defaultdict(lambda: [0.0, 0]))
+    for user_id, source, currency, amount, timestamp, _, settled in changes:
+        delta = series[(user_id, source, currency)][timestamp.date()]
+        delta[0] += amount * settled
+        delta[1] += settled
+    return series
+
+
+def _series_filter(user_id, source, currency):
+    series = DailyHolding.__table__.c
+    return (series.user_id == user_id) & (series.source == source) & (series.currency == currency)
+
+
+def _apply_series_deltas(user_id, source, currency, days):
+    series = DailyHolding.__table__.c
+    in_series = _series_filter(user_id, source, currency)
+    first_day, last_day = min(days), max(days)
+
+    opening = db.session.execute(
+        select(series.balance).where(in_series, series.day < first_day).order_by(series.day.desc()).limit(1)
+    ).scalar() or 0.0
+    # Only the days between the first and last affected day are merged row by
+    # row; appends touch just the tail of the series
+    existing = {
+        row.day: row for row in db.session.execute(
+            select(series.id, series.day, series.net, series.tx_count)
+            .where(in_series, series.day >= first_day, series.day <= last_day)
+        )
+    }
+
+    balance = opening
+    updates, inserts, deletes = [], [], []
+    for day in sorted(set(existing) | set(days)):
+        net, tx_count = days.get(day, (0.0, 0))
+        row = existing.get(day)
+        if row is not None:
+            net += row.net
+            tx_count += row.tx_count
+        balance += net
+        if row is not None and not tx_count:
+            # Its only settled transactions were unsettled again
+            deletes.append({'row_id': row.id})
+        elif row is not None:
+            updates.append({'row_id': row.id, 'net': net, 'balance': balance, 'tx_count': tx_count})
+        else:
+            inserts.append({'user_id': user_id, 'source': source, 'currency': currency, 'day': day,
+                            'net': net, 'balance': balance, 'tx_count': tx_count})
+
+    table = DailyHolding.__table__
+    if updates:
+        db.session.execute(
+            table.update().where(series.id == bindparam('row_id')).values(
+                net=bindparam('net'), balance=bindparam('balance'), tx_count=bindparam('tx_count')),
+            updates,
+        )
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    if deletes:
+        db.session.execute(table.delete().where(series.id == bindparam('row_id')), deletes)
+
+    # A backdated import shifts every later end-of-day balance by the same total
+    shift = sum(net for net, _ in days.values())
+    if shift:
+        db.session.execute(
+            table.update().where(in_series, series.day > last_day).values(balance=series.balance + shift)
+        )
+
+
+def apply_daily_deltas(changes):
+    for (user_id, source, currency), days in aggregate_daily_deltas(changes).items():
+        _apply_series_deltas(user_id, source, currency, days)
+
+
+def clear_holdings(user_id, source):
+    Holding.query.filter_by(user_id=user_id, source=source).delete()
+    DailyHolding.query.filter_by(user_id=user_id, source=source).delete()
+    bump_users([(user_id, source)])
+
+
+def balances(user_id, source):
+    # Non-zero balances, ordered by currency, in O(#currencies)
+    return (
+        Holding.query
+        .filter_by(user_id=user_id, source=source)
+        .filter(func.abs(Holding.amount) > ZERO_TOLERANCE)
+        .order_by(Holding.currency)
+        .all()
+    )
+
+
+def currencies(user_id, source):
+    rows = (
+        db.session.query(Holding.currency)
+        .filter_by(user_id=user_id, source=source)
+        .filter(Holding.tx_count > 0)
+        .order_by(Holding.currency)
+        .all()
+    )
+    return [row.currency for row in rows]
+
+
+def _amounts_differ(expected, actual):
+    tolerance = ZERO_TOLERANCE + 1e-9 * max(abs(expected), abs(actual))
+    return abs(expected - actual) > tolerance
+
+
+def _is_drift(expected, actual):
+    if expected is None or actual is None:
+        return True
+    amount_expected, *counts_expected = expected
+    amount_actual, *counts_actual = actual
+    return counts_expected != counts_actual or _amounts_differ(amount_expected, amount_actual)
+
+
+def rebuild_holdings(user_id=None, repair=True):
+    """Recompute holdings from raw transactions and report any drift.
+
+    Returns a list of (user_id, source, currency, expected, actual) tuples,
+    where expected/actual are (amount, tx_count, settled_count) or None when
+    missing. With ``repair`` the table is rewritten from the recomputed
+    totals; the caller commits.
+    """
+    actual_query = db.session.query(
+        Holding.user_id, Holding.source, Holding.currency, Holding.amount, Holding.tx_count, Holding.settled_count,
+    )
+    if user_id is not None:
+        actual_query = actual_query.filter(Holding.user_id == user_id)
+
+    expected = {(u, s, c): (amount or 0.0, count, settled)
+                for u, s, c, amount, count, settled in db.session.execute(holding_totals(user_id))}
+    actual = {(u, s, c): (amount, count, settled) for u, s, c, amount, count, settled in actual_query}
+
+    drift = [
+        (*key, expected.get(key), actual.get(key))
+        for key in sorted(set(expected) | set(actual))
+        if _is_drift(expected.get(key), actual.get(key))
+    ]
+    for key_user, source, currency, want, have in drift:
+        logger.warning(f"Holding drift for user {key_user} {source} {currency}: expected {want}, found {have}")
+
+    if repair and drift:
+        delete = Holding.query
+        if user_id is not None:
+            delete = delete.filter_by(user_id=user_id)
+        delete.delete(synchronize_session=False)
+        rows = [
+            {'user_id': u, 'source': s, 'currency': c, 'amount': amount, 'tx_count': count, 'settled_count': settled}
+            for (u, s, c), (amount, count, settled) in expected.items()
+        ]
+        if rows:
+            db.session.execute(Holding.__table__.insert(), rows)
+        bump_users({(key_user, source) for key_user, source, *_ in drift})
+    return drift
+
+
+def rebuild_daily_holdings(user_id=None, repair=True):
+    """Recompute the daily series from raw transactions and report drift.
+
+    Returns the (user_id, source, currency) series whose stored days, nets or
+    balances differ. With ``repair`` those series are rewritten; the caller
+    commits.
+    """
+    expected = defaultdict(dict)
+    for u, s, c, day, net, balance, count in db.session.execute(daily_holding_totals(user_id)):
+        expected[(u, s, c)][str(day)] = (net, balance, count)
+    stored_query = select(
+        DailyHolding.user_id, DailyHolding.source, DailyHolding.currency,
+        DailyHolding.day, DailyHolding.net, DailyHolding.balance, DailyHolding.tx_count,
+    )
+    if user_id is not None:
+        stored_query = stored_query.where(DailyHolding.user_id == user_id)
+    stored = defaultdict(dict)
+    for u, s, c, day, net, balance, count in db.session.execute(stored_query):
+        stored[(u, s, c)][str(day)] = (net, balance, count)
+
+    def differs(want, have):
+        if want.keys() != have.keys():
+            return True
+        return any(
+            want[day][2] != have[day][2]
+            or _amounts_differ(want[day][0], have[day][0])
+            or _amounts_differ(want[day][1], have[day][1])
+            for day in want
+        )
+
+    drift = [key for key in sorted(set(expected) | set(stored)) if differs(expected[key], stored[key])]
+    for key_user, source, currency in drift:
+        logger.warning(f"Daily holdings drift for user {key_user} {source} {currency}")
+
+    if repair:
+        table = DailyHolding.__table__
+        for key_user, source, currency in drift:
+            db.session.execute(table.delete().where(_series_filter(key_user, source, currency)))
+            rows = [
+                {'user_id': key_user, 'source': source, 'currency': currency,
+                 'day': date.fromisoformat(day), 'net': net, 'balance': balance, 'tx_count': count}
+                for day, (net, balance, count) in sorted(expected[(key_user, source, currency)].items())
+            ]
+            if rows:
+                db.session.execute(table.insert(), rows)
+        bump_users({(key_user, source) for key_user, source, _ in drift})
+    return drift
+
+
+@click.command('check-holdings')
+@click.option('--user-id', type=int, help='Only check this user.')
+@click.option('--repair/--no-repair', default=False, help='Rewrite the holdings table from transactions.')
+def check_holdings_command(user_id, repair):
+    """Compare the holdings table with raw transactions and report drift."""
+    drift = rebuild_holdings(user_id=user_id, repair=repair)
+    for drift_user, source, currency, expected, actual in drift:
+        click.echo(f'user {drift_user} {source} {currency}: expected {expected}, found {actual}')
+    series_drift = rebuild_daily_holdings(user_id=user_id, repair=repair)
+    for drift_user, source, currency in series_drift:
+        click.echo(f'user {drift_user} {source} {currency}: daily series differs')
+    if repair:
+        db.session.commit()
+    suffix = ' repaired' if repair and (drift or series_drift) else ''
+    click.echo(f'{len(drift)} drifted holdings, {len(series_drift)} drifted daily series{suffix}')
+    if (drift or series_drift) and not repair:
+        raise click.ClickException('holdings drift detected; rerun with --repair')
@@ -0,0 +1,81 @@
+# Request-scoped user resolution. The session carries the user's id; a
+# before_request hook resolves it once per request into g.user, served from a
+# small in-process LRU cache so most requests do not query the user table.
+from functools import wraps
+from flask import current_app, g, redirect, session, url_for
+from sqlalchemy.orm import make_transient_to_detached
+from database.models import db, User
+from app.lru import LRUCache
+
+
+def _column_values(user):
+    # Plain column values are cached rather than ORM instances, which belong
+    # to the session of the request that loaded them
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+def _cached_user(values):
+    # Rebuild the instance and attach it to this request's session without a SELECT
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def get_user(user_id):
+    cache = current_app.extensions['user_cache']
+    values = cache.get(user_id)
+    if values is not None:
+        return _cached_user(values)
+    user = db.session.get(User, user_id)
+    if user is not None:
+        cache.put(user_id, _column_values(user))
+    return user
+
+
+def invalidate_user(user_id):
+    current_app.extensions['user_cache'].pop(user_id)
+
+
+def load_user():
+    g.user = None
+    user_id = session.get('user_id')
+    if user_id is None and 'username' in session:
+        # Sessions issued before user ids were stored
+        user = User.query.filter_by(username=session.pop('username')).first()
+        if user is not None:
+            session['user_id'] = user_id = user.id
+    if user_id is None:
+        return
+    g.user = get_user(user_id)
+    if g.user is None:
+        # The account no longer exists
+        session.pop('user_id', None)
+
+
+def login_user(user):
+    session.pop('user_id_pending', None)
+    session['user_id'] = user.id
+    g.user = user
+
+
+def logout_user():
+    session.pop('user_id_pending', None)
+    user_id = session.pop('user_id', None)
+    g.user = None
+    return user_id
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if g.user is None:
+            return redirect(url_for('auth.login'))
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def init_app(app):
+    app.config.setdefault('USER_CACHE_SIZE', 1024)
+    app.config.setdefault('USER_CACHE_TTL', 300)
+    app.extensions['user_cache'] = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+    app.before_request(load_user)
@@ -0,0 +1,6 @@
+from .engine import (
+    NEGATIVE_TYPES, ImportResult, bulk_insert_transactions, signed_amount, transaction_row, update_statuses,
+)
+from .stream import ImportInterrupted, clear_checkpoints, read_csv_columns, stream_import
+from .schemas import COINBASE_BACKUP, COINBASE_STATEMENT, FIDELITY_BACKUP, FIDELITY_HISTORY, CsvSchema, parse_frame
+from .columnar import ColumnarFormatError, columnar_bytes, restore_columnar
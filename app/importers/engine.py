@@ -0,0 +1,214 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from flask import current_app
+from sqlalchemy import bindparam, insert, select
+from sqlalchemy.exc import IntegrityError
+from database.engine import UPSERT_DIALECTS
+from database.models import db, Transaction
+from app.holdings import apply_deltas, apply_status_changes
+from app.cost_basis import clear_cost_basis
+from app.prices import record_transaction_prices
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Amounts are stored signed: outflows are negative, so balances are plain sums
+NEGATIVE_TYPES = ('sell', 'send')
+
+# Returned for each inserted row so holdings can be updated in the same transaction
+HOLDING_COLUMNS = (
+    Transaction.__table__.c.user_id,
+    Transaction.__table__.c.source,
+    Transaction.__table__.c.currency,
+    Transaction.__table__.c.amount,
+    Transaction.__table__.c.timestamp,
+    Transaction.__table__.c.status,
+)
+
+# Prices are recorded only from the rows an import actually wrote
+INSERTED_COLUMNS = HOLDING_COLUMNS + (Transaction.__table__.c.price_at_transaction,)
+
+# Failed transaction IDs kept per import for the summary log record
+FAILED_ID_SAMPLE = 10
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    skipped: int = 0
+    failed: int = 0
+    errors: Counter = field(default_factory=Counter)
+    failed_ids: list = field(default_factory=list)
+
+    def __iadd__(self, other):
+        self.inserted += other.inserted
+        self.skipped += other.skipped
+        self.failed += other.failed
+        self.errors.update(other.errors)
+        self.failed_ids.extend(other.failed_ids[:FAILED_ID_SAMPLE - len(self.failed_ids)])
+        return self
+
+    def record_failure(self, tx_id, reason):
+        # Failures are counted per reason and logged once per import, not per row
+        self.failed += 1
+        self.errors[reason] += 1
+        if len(self.failed_ids) < FAILED_ID_SAMPLE:
+            self.failed_ids.append(tx_id)
+
+    def failure_summary(self):
+        reasons = ', '.join(f"{reason}: {count}" for reason, count in self.errors.most_common())
+        return f"{self.failed} failed ({reasons}); first failed IDs: {self.failed_ids}"
+
+    @property
+    def total(self):
+        return self.inserted + self.skipped + self.failed
+
+
+def signed_amount(tx_type, amount, negative_types=NEGATIVE_TYPES):
+    return -abs(amount) if tx_type.lower() in negative_types else amount
+
+
+def transaction_row(tx_id, user_id, tx_type, amount, currency, timestamp,
+                    source, status='completed', price=None):
+    return {
+        'coinbase_tx_id': tx_id,
+        'user_id': user_id,
+        'type': tx_type,
+        'amount': amount,
+        'currency': currency,
+        'timestamp': timestamp,
+        'status': status,
+        'price_at_transaction': price,
+        'source': source,
+    }
+
+
+def frame_records(frame):
+    # Much faster than DataFrame.to_dict('records') for wide chunks
+    columns = list(frame.columns)
+    return [dict(zip(columns, values)) for values in zip(*(frame[column].tolist() for column in columns))]
+
+
+def _batches(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def _upsert_statement():
+    dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if dialect_insert is None:
+        return None
+    return (
+        dialect_insert(Transaction.__table__)
+        .on_conflict_do_nothing(index_elements=['coinbase_tx_id'])
+        .returning(*INSERTED_COLUMNS)
+    )
+
+
+def _holding_rows(rows):
+    return [tuple(row[column.key] for column in HOLDING_COLUMNS) for row in rows]
+
+
+def _insert_batch(batch, upsert):
+    # Returns the rows actually written for this batch
+    if upsert is not None:
+        inserted = [row._asdict() for row in db.session.execute(upsert, batch)]
+        apply_deltas(_holding_rows(inserted))
+        return inserted
+
+    # Fallback for dialects without ON CONFLICT: one lookup for the whole batch
+    ids = [row['coinbase_tx_id'] for row in batch]
+    existing = {
+        tx_id for (tx_id,) in
+        db.session.query(Transaction.coinbase_tx_id).filter(Transaction.coinbase_tx_id.in_(ids))
+    }
+    seen = set()
+    new_rows = []
+    for row in batch:
+        if row['coinbase_tx_id'] in existing or row['coinbase_tx_id'] in seen:
+            continue
+        seen.add(row['coinbase_tx_id'])
+        new_rows.append(row)
+    if new_rows:
+        db.session.execute(insert(Transaction.__table__), new_rows)
+        apply_deltas(_holding_rows(new_rows))
+    return new_rows
+
+
+def _insert_rows_individually(batch, upsert):
+    # Isolate the bad rows of a batch that failed as a whole
+    result = ImportResult()
+    written = []
+    for row in batch:
+        try:
+            with db.session.begin_nested():
+                inserted = _insert_batch([row], upsert)
+        except IntegrityError as e:
+            result.record_failure(row.get('coinbase_tx_id'), str(e.orig))
+            continue
+        written.extend(inserted)
+        result.inserted += len(inserted)
+        result.skipped += 1 - len(inserted)
+    return result, written
+
+
+def bulk_insert_transactions(rows, batch_size=None):
+    """Insert transaction rows in batches, skipping IDs that already exist.
+
+    Duplicates are resolved by the database (ON CONFLICT DO NOTHING where
+    supported), so concurrent imports of overlapping files cannot collide.
+    Holdings are updated for the rows actually inserted and their prices
+    go to the price store. The caller owns the surrounding transaction and
+    commits it.
+    """
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    upsert = _upsert_statement()
+    result = ImportResult()
+    written = []
+
+    for batch in _batches(rows, batch_size):
+        try:
+            with db.session.begin_nested():
+                inserted = _insert_batch(batch, upsert)
+        except IntegrityError:
+            batch_result, inserted = _insert_rows_individually(batch, upsert)
+            result += batch_result
+            written.extend(inserted)
+            continue
+        written.extend(inserted)
+        result.inserted += len(inserted)
+        result.skipped += len(batch) - len(inserted)
+
+    record_transaction_prices(written)
+    return result
+
+
+def update_statuses(rows, batch_size=None):
+    """Store the new status of already imported rows whose status changed.
+
+    Used when a sync fetches transactions again, e.g. a pending one that
+    has since completed. Holdings follow the transactions that settle or
+    stop being settled, and their currencies' cost basis is replayed. The
+    caller commits. Returns the number updated.
+    """
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    statuses = {row['coinbase_tx_id']: row['status'] for row in rows}
+    table = Transaction.__table__
+    changed = []
+    tx_ids = list(statuses)
+    for batch in _batches(tx_ids, batch_size):
+        for tx_id, row_id, *holding in db.session.execute(
+            select(table.c.coinbase_tx_id, table.c.id, *HOLDING_COLUMNS).where(table.c.coinbase_tx_id.in_(batch))
+        ):
+            if holding[-1] != statuses[tx_id]:
+                changed.append((row_id, *holding, statuses[tx_id]))
+    if not changed:
+        return 0
+    db.session.execute(
+        table.update().where(table.c.id == bindparam('row_id')).values(status=bindparam('new_status')),
+        [{'row_id': row_id, 'new_status': new_status} for row_id, *_, new_status in changed],
+    )
+    for user_id, source, currency in apply_status_changes([holding for _, *holding in changed]):
+        # Settling one transaction and unsettling another keeps the settled
+        # count that cost basis compares, so its lots are rebuilt instead
+        clear_cost_basis(user_id, source, currency=currency)
+    return len(changed)
@@ -0,0 +1,232 @@
+from dataclasses import dataclass
+from database.models import SETTLED_STATUS
+from app.prices import CURRENCY_CHARS
+from .engine import NEGATIVE_TYPES, frame_records
+import pandas as pd
+
+# Matches Coinbase Convert notes such as "Converted 0.1 BTC to 2.05 ETH"
+CONVERT_PATTERN = r'\bto\s+(?P<quantity>[\d.,]+)\s+(?P<asset>[A-Za-z0-9]+)'
+
+
+@dataclass(frozen=True)
+class CsvSchema:
+    name: str
+    source: str
+    # Transaction field -> CSV column
+    columns: dict
+    timestamp_format: str
+    # Without an ID column, IDs are built from the row number, date and symbol
+    id_column: str = None
+    id_prefix: str = None
+    # Lower-cased types whose quantity is stored as negative
+    negative_types: tuple = NEGATIVE_TYPES
+    # Column holding "Converted X A to Y B" notes; enables Convert splitting
+    convert_notes_column: str = None
+    # Optional status column; files without it (or rows with it blank) are settled
+    status_column: str = None
+
+    @property
+    def required_columns(self):
+        columns = list(self.columns.values())
+        if self.id_column:
+            columns.insert(0, self.id_column)
+        return columns
+
+    @property
+    def csv_columns(self):
+        columns = self.required_columns
+        if self.status_column:
+            columns.append(self.status_column)
+        if self.convert_notes_column:
+            columns.append(self.convert_notes_column)
+        return columns
+
+    @property
+    def dtypes(self):
+        # Everything is read as text and converted explicitly below
+        return {column: 'string' for column in self.csv_columns}
+
+    def missing_columns(self, columns):
+        return [column for column in self.required_columns if column not in columns]
+
+
+@dataclass
+class ParsedChunk:
+    rows: pd.DataFrame
+    rejects: pd.DataFrame
+
+    def records(self):
+        return frame_records(self.rows)
+
+
+COINBASE_STATEMENT = CsvSchema(
+    name='coinbase_statement',
+    source='coinbase',
+    id_column='ID',
+    columns={
+        'timestamp': 'Timestamp',
+        'type': 'Transaction Type',
+        'currency': 'Asset',
+        'amount': 'Quantity Transacted',
+        'price': 'Price at Transaction',
+    },
+    timestamp_format='%Y-%m-%d %H:%M:%S UTC',
+    convert_notes_column='Notes',
+)
+
+COINBASE_BACKUP = CsvSchema(
+    name='coinbase_backup',
+    source='coinbase',
+    id_column='ID',
+    columns={
+        'timestamp': 'Timestamp',
+        'type': 'Transaction Type',
+        'currency': 'Asset',
+        'amount': 'Quantity Transacted',
+        'price': 'Price at Transaction',
+    },
+    timestamp_format='ISO8601',
+    status_column='Status',
+)
+
+FIDELITY_HISTORY = CsvSchema(
+    name='fidelity_history',
+    source='fidelity',
+    id_prefix='fidelity',
+    columns={
+        'timestamp': 'Run Date',
+        'type': 'Action',
+        'currency': 'Symbol',
+        'amount': 'Quantity',
+        'price': 'Price',
+    },
+    timestamp_format='%m/%d/%Y',
+    negative_types=('sell',),
+)
+
+FIDELITY_BACKUP = CsvSchema(
+    name='fidelity_backup',
+    source='fidelity',
+    id_column='ID',
+    columns={
+        'timestamp': 'Run Date',
+        'type': 'Action',
+        'currency': 'Symbol',
+        'amount': 'Quantity',
+        'price': 'Price',
+    },
+    timestamp_format='ISO8601',
+    negative_types=('sell',),
+    status_column='Status',
+)
+
+
+def parse_timestamps(values, timestamp_format):
+    values = values.str.strip()
+    parsed = pd.to_datetime(values, format=timestamp_format, errors='coerce', utc=True)
+    # Fall back to format inference only for the rows the known format missed
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry], format='mixed', errors='coerce', utc=True)
+    return parsed.dt.tz_convert(None)
+
+
+def to_float(values):
+    return pd.to_numeric(values, errors='coerce').astype('float64')
+
+
+def clean_currency(values):
+    return to_float(values.str.replace(CURRENCY_CHARS, '', regex=True))
+
+
+def _transaction_frame(index, tx_id, user_id, tx_type, amount, currency, timestamp, source, price, status):
+    frame = pd.DataFrame({
+        'coinbase_tx_id': tx_id,
+        'type': tx_type,
+        'amount': amount,
+        'currency': currency,
+        'timestamp': timestamp,
+        'price_at_transaction': price,
+        'status': status,
+    }, index=index)
+    frame['user_id'] = user_id
+    frame['source'] = source
+    return frame
+
+
+def parse_frame(schema, df, user_id):
+    """Parse one CSV chunk into transaction rows without per-row Python work.
+
+    Returns a ParsedChunk whose ``rows`` are ready for bulk insertion and whose
+    ``rejects`` list the original row number and the first reason it failed.
+    """
+    columns = schema.columns
+    reasons = pd.Series(pd.NA, index=df.index, dtype='string')
+
+    def reject(mask, reason):
+        reasons[mask.fillna(False).astype(bool) & reasons.isna()] = reason
+
+    if schema.id_column:
+        tx_id = df[schema.id_column].str.strip()
+    else:
+        tx_id = (schema.id_prefix + '_' + df.index.astype(str).to_series(index=df.index)
+                 + '_' + df[columns['timestamp']] + '_' + df[columns['currency']])
+
+    timestamp = parse_timestamps(df[columns['timestamp']], schema.timestamp_format)
+    reject(timestamp.isna(), 'invalid timestamp')
+
+    tx_type = df[columns['type']].str.strip()
+    reject(tx_type.isna(), 'missing transaction type')
+
+    currency = df[columns['currency']].str.strip()
+    reject(currency.isna(), 'missing asset')
+
+    amount = to_float(df[columns['amount']].str.replace(',', '', regex=False))
+    reject(amount.isna(), 'invalid quantity')
+    reject(tx_id.isna() | (tx_id == ''), 'missing ID')
+
+    price = clean_currency(df[columns['price']])
+
+    status = pd.Series(SETTLED_STATUS, index=df.index, dtype='string')
+    if schema.status_column and schema.status_column in df:
+        status = df[schema.status_column].str.strip().replace('', pd.NA).fillna(SETTLED_STATUS)
+
+    lowered = tx_type.str.lower()
+    amount = amount.where(~lowered.isin(schema.negative_types), -amount.abs())
+
+    convert = pd.Series(False, index=df.index)
+    if schema.convert_notes_column:
+        convert = (lowered == 'convert').fillna(False)
+        notes = df.get(schema.convert_notes_column, pd.Series(pd.NA, index=df.index, dtype='string'))
+        targets = notes.str.extract(CONVERT_PATTERN)
+        target_quantity = to_float(targets['quantity'].str.replace(',', '', regex=False))
+        reject(convert & (targets['asset'].isna() | target_quantity.isna()), 'unparseable Convert notes')
+
+    valid = reasons.isna()
+    plain = valid & ~convert
+    frames = [_transaction_frame(
+        df.index[plain], tx_id[plain], user_id, tx_type[plain], amount[plain],
+        currency[plain], timestamp[plain], schema.source, price[plain], status[plain],
+    )]
+
+    converted = valid & convert
+    if converted.any():
+        # A Convert becomes a sell of the source asset and a buy of the target
+        frames.append(_transaction_frame(
+            df.index[converted], tx_id[converted] + '_sell', user_id, 'sell',
+            -amount[converted].abs(), currency[converted], timestamp[converted],
+            schema.source, price[converted], status[converted],
+        ))
+        frames.append(_transaction_frame(
+            df.index[converted], tx_id[converted] + '_buy', user_id, 'buy',
+            target_quantity[converted], targets['asset'][converted], timestamp[converted],
+            schema.source, None, status[converted],
+        ))
+
+    rows = pd.concat(frames).sort_index(kind='stable')
+    rows['price_at_transaction'] = rows['price_at_transaction'].astype(object).where(
+        rows['price_at_transaction'].notna(), None)
+
+    rejected = ~valid
+    rejects = pd.DataFrame({'row': df.index[rejected], 'reason': reasons[rejected].to_numpy()})
+    return ParsedChunk(rows=rows, rejects=rejects)
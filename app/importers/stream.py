@@ -0,0 +1,120 @@
+from flask import current_app
+from database.engine import serialized_write
+from database.models import db, ImportCheckpoint
+from .engine import ImportResult, bulk_insert_transactions
+from .schemas import parse_frame
+from collections import Counter
+import hashlib
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 50000
+DIGEST_BLOCK_SIZE = 1024 * 1024
+
+
+class ImportInterrupted(Exception):
+    def __init__(self, rows_committed, cause):
+        super().__init__(f"Import stopped after {rows_committed} rows: {cause}")
+        self.rows_committed = rows_committed
+        self.cause = cause
+
+
+def file_digest(file):
+    # Hash the upload in fixed-size blocks so large files are never held in memory
+    sha = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(DIGEST_BLOCK_SIZE), b''):
+        sha.update(block)
+    file.seek(0)
+    return sha.hexdigest()
+
+
+def read_csv_columns(file, compression=None):
+    columns = pd.read_csv(file, nrows=0, compression=compression).columns.tolist()
+    file.seek(0)
+    return columns
+
+
+def _load_checkpoint(user_id, kind, digest):
+    return ImportCheckpoint.query.filter_by(user_id=user_id, kind=kind, file_digest=digest).first()
+
+
+def _log_rejects(schema, user_id, reasons, first_rows, result):
+    # One record per import for both parse rejects and rows the database refused
+    if not reasons and not result.errors:
+        return
+    message = f"{schema.name} import for user {user_id}"
+    if reasons:
+        summary = ', '.join(f"{reason}: {count}" for reason, count in reasons.most_common())
+        message += f" rejected {sum(reasons.values())} rows ({summary}); first rejected rows: {first_rows}"
+    if result.errors:
+        message += f"{';' if reasons else ''} insert {result.failure_summary()}"
+    logger.warning(message)
+
+
+def stream_import(file, user_id, schema, chunk_size=None, progress=None, compression=None):
+    """Import a CSV upload chunk by chunk, committing after every chunk.
+
+    Each chunk is parsed with the given CsvSchema and bulk inserted. Progress
+    is recorded in an ImportCheckpoint keyed by the file's digest, so uploading
+    the same file after a failure resumes from the last committed chunk.
+    ``progress(rows_parsed, result)`` is called after every commit;
+    ``compression`` is passed to pandas (e.g. 'gzip' for .csv.gz backups).
+    """
+    chunk_size = chunk_size or current_app.config.get('IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    digest = file_digest(file)
+
+    checkpoint = _load_checkpoint(user_id, schema.name, digest)
+    if checkpoint is None:
+        checkpoint = ImportCheckpoint(user_id=user_id, source=schema.source, kind=schema.name, file_digest=digest)
+        db.session.add(checkpoint)
+        db.session.commit()
+    elif checkpoint.rows_committed:
+        logger.info(f"Resuming {schema.name} import for user {user_id} after row {checkpoint.rows_committed}")
+
+    result = ImportResult(checkpoint.inserted, checkpoint.skipped, checkpoint.failed)
+    committed = checkpoint.rows_committed
+    reject_reasons = Counter()
+    first_rejects = []
+
+    # Skip already committed data rows at the parser level, keeping the header
+    reader = pd.read_csv(file, chunksize=chunk_size, skiprows=range(1, committed + 1), compression=compression,
+                         dtype=schema.dtypes, usecols=lambda column: column in schema.csv_columns)
+    try:
+        for chunk in reader:
+            # Number rows from the start of the file, so IDs built from the row
+            # number match across chunk sizes and resumed runs
+            chunk.index = pd.RangeIndex(committed, committed + len(chunk))
+            parsed = parse_frame(schema, chunk, user_id)
+            records = parsed.records()
+            with serialized_write(f'{schema.name} import'):
+                chunk_result = bulk_insert_transactions(records)
+                chunk_result.failed += len(parsed.rejects)
+                result += chunk_result
+
+                committed += len(chunk)
+                checkpoint.rows_committed = committed
+                checkpoint.inserted = result.inserted
+                checkpoint.skipped = result.skipped
+                checkpoint.failed = result.failed
+                db.session.commit()
+            reject_reasons.update(parsed.rejects['reason'])
+            first_rejects.extend(parsed.rejects['row'].head(10 - len(first_rejects)).tolist())
+            if progress is not None:
+                progress(committed, result)
+    except Exception as e:
+        db.session.rollback()
+        _log_rejects(schema, user_id, reject_reasons, first_rejects, result)
+        raise ImportInterrupted(committed, e) from e
+
+    _log_rejects(schema, user_id, reject_reasons, first_rejects, result)
+
+    db.session.delete(checkpoint)
+    db.session.commit()
+    return result
+
+
+def clear_checkpoints(user_id, source):
+    ImportCheckpoint.query.filter_by(user_id=user_id, source=source).delete()
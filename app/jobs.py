@@ -0,0 +1,189 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app, flash, jsonify, redirect, request, url_for
+from sqlalchemy.exc import IntegrityError
+from database.audit import audit_job
+from database.engine import serialized_write
+from database.models import db, Job, JOB_ACTIVE_STATUSES
+from app.importers import ImportInterrupted, stream_import
+from app.metrics import metrics
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateJobError(Exception):
+    def __init__(self, job):
+        super().__init__(f"A {job.kind} job (#{job.id}) is already {job.status}.")
+        self.job = job
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobProgress:
+    # Handed to job functions to record progress and observe cancellation
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def update(self, **counts):
+        counts['updated_at'] = datetime.utcnow()
+        with serialized_write('job progress'):
+            Job.query.filter_by(id=self.job_id).update(counts)
+            db.session.commit()
+        self.check_cancelled()
+
+    def import_progress(self, rows_parsed, result):
+        self.update(rows_parsed=rows_parsed, inserted=result.inserted,
+                    skipped=result.skipped, failed=result.failed)
+
+    def check_cancelled(self):
+        if db.session.query(Job.cancel_requested).filter_by(id=self.job_id).scalar():
+            raise JobCancelled('cancelled by user')
+
+
+class JobRunner:
+    def __init__(self, app):
+        self.app = app
+        workers = app.config['JOB_WORKERS']
+        # JOB_WORKERS = 0 runs jobs inline, which keeps tests and scripts synchronous
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job') if workers else None
+
+    def submit(self, user_id, kind, func, *args):
+        job = _create_job(user_id, kind)
+        if self.executor is None:
+            self._run(job.id, func, args)
+            db.session.refresh(job)
+        else:
+            self.executor.submit(self._run, job.id, func, args)
+        return job
+
+    def _run(self, job_id, func, args):
+        with self.app.app_context():
+            try:
+                with serialized_write('job start'):
+                    claimed = Job.query.filter_by(id=job_id, status='queued').update(
+                        {'status': 'running', 'started_at': datetime.utcnow()})
+                    db.session.commit()
+                if not claimed:
+                    # Cancelled while still queued
+                    return
+                started = time.perf_counter()
+                try:
+                    with audit_job(f'job {job_id} {func.__name__}'):
+                        message = func(JobProgress(job_id), *args)
+                except Exception as e:
+                    cause = e.cause if isinstance(e, ImportInterrupted) else e
+                    if isinstance(cause, JobCancelled):
+                        _finish(job_id, 'cancelled', str(e))
+                    else:
+                        logger.exception(f"Job {job_id} failed")
+                        _finish(job_id, 'failed', str(e))
+                else:
+                    _finish(job_id, 'succeeded', message)
+                job = db.session.get(Job, job_id)
+                metrics().record_import(job.kind, job.status, time.perf_counter() - started,
+                                        job.inserted, job.skipped, job.failed)
+            finally:
+                db.session.remove()
+
+
+def _finish(job_id, status, message):
+    db.session.rollback()
+    with serialized_write('job finish'):
+        Job.query.filter_by(id=job_id).update({
+            'status': status,
+            'message': (message or '')[:500],
+            'finished_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow(),
+        })
+        db.session.commit()
+
+
+def _active_job(user_id, kind):
+    return Job.query.filter(Job.user_id == user_id, Job.kind == kind,
+                            Job.status.in_(JOB_ACTIVE_STATUSES)).first()
+
+
+def _create_job(user_id, kind):
+    # Jobs that stopped reporting progress (e.g. the process died) no longer block new ones
+    stale_before = datetime.utcnow() - timedelta(seconds=current_app.config['JOB_STALE_AFTER'])
+    Job.query.filter(Job.user_id == user_id, Job.kind == kind,
+                     Job.status.in_(JOB_ACTIVE_STATUSES), Job.updated_at < stale_before).update(
+        {'status': 'failed', 'message': 'Job stopped reporting progress.', 'finished_at': datetime.utcnow()},
+        synchronize_session=False)
+
+    job = Job(user_id=user_id, kind=kind, status='queued')
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The partial unique index rejected a second active job of this kind
+        db.session.rollback()
+        raise DuplicateJobError(_active_job(user_id, kind))
+    return job
+
+
+def init_app(app):
+    app.config.setdefault('JOB_WORKERS', 2)
+    app.config.setdefault('JOB_STALE_AFTER', 3600)
+    app.extensions['jobs'] = JobRunner(app)
+
+
+def submit_job(user_id, kind, func, *args):
+    return current_app.extensions['jobs'].submit(user_id, kind, func, *args)
+
+
+def cancel_job(job):
+    if job.status == 'queued':
+        job.status = 'cancelled'
+        job.finished_at = datetime.utcnow()
+    if job.is_active:
+        job.cancel_requested = True
+    db.session.commit()
+
+
+def _import_upload(progress, path, user_id, schema):
+    try:
+        with open(path, 'rb') as file:
+            result = stream_import(file, user_id, schema, progress=progress.import_progress)
+    finally:
+        os.remove(path)
+    return (f'Imported {result.inserted} transactions '
+            f'({result.skipped} already present, {result.failed} failed).')
+
+
+def submit_import(user_id, file, schema):
+    # The upload only lives as long as the request, so spool it to disk for the worker
+    fd, path = tempfile.mkstemp(prefix=f'{schema.name}_', suffix='.csv')
+    with os.fdopen(fd, 'wb') as spool:
+        file.save(spool)
+    try:
+        return submit_job(user_id, f'import_{schema.name}', _import_upload, path, user_id, schema)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+def job_started_response(job, endpoint):
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job.to_dict()), 202
+    if not job.is_active:
+        # Finished inline (JOB_WORKERS = 0)
+        flash(job.message, 'success' if job.status == 'succeeded' else 'error')
+        return redirect(url_for(endpoint))
+    flash(f'Job #{job.id} started. Check {url_for("jobs.job_status", job_id=job.id)} for progress.', 'info')
+    return redirect(url_for(endpoint))
+
+
+def job_conflict_response(error, endpoint):
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'error': str(error), 'job': error.job.to_dict() if error.job else None}), 409
+    flash(str(error), 'error')
+    return redirect(url_for(endpoint))
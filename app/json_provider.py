@@ -0,0 +1,46 @@
+# Flask JSON provider backed by orjson when it is installed. orjson writes
+# bytes straight into the response and serializes dates, dataclasses and
+# NumPy values natively; without it Flask's standard provider is kept.
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Drop-in provider for ``jsonify`` and ``request.get_json``.
+
+    Unlike the standard provider, datetimes are written as ISO 8601 rather
+    than HTTP dates; the routes format their own timestamps either way.
+    """
+
+    def options(self, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.options(**kwargs)).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.options()), mimetype=self.mimetype)
+
+
+def init_app(app):
+    app.config.setdefault('JSON_ORJSON', orjson is not None)
+    if app.config['JSON_ORJSON']:
+        if orjson is None:
+            raise RuntimeError('JSON_ORJSON is set but orjson is not installed')
+        app.json = OrjsonProvider(app)
+    # Responses are for machines; sorting keys costs time and buys nothing
+    app.json.sort_keys = False
@@ -0,0 +1,67 @@
+# Central logging setup. Every record goes through a QueueHandler on the root
+# logger, so request and worker threads only enqueue; a single QueueListener
+# thread formats the records and writes them to a size-rotated log file.
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import logging
+import queue
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s'
+
+_listener = None
+
+
+def _level(name):
+    return logging.getLevelName(name.upper()) if isinstance(name, str) else name
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def configure_logging(filename, level, logger_levels=(), max_bytes=10 * 1024 * 1024, backup_count=5):
+    """Route all logging through one queue into a rotating file.
+
+    Safe to call again (the app factory runs once per app): the previous
+    listener is stopped and its queue handler replaced.
+    """
+    global _listener
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+
+    records = queue.SimpleQueue()
+    file_handler = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                       encoding='utf-8', delay=True)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = QueueListener(records, file_handler, respect_handler_level=True)
+    _listener.start()
+
+    root.addHandler(QueueHandler(records))
+    root.setLevel(_level(level))
+    for name, logger_level in dict(logger_levels).items():
+        logging.getLogger(name).setLevel(_level(logger_level))
+
+
+def init_app(app):
+    # Debug runs log everything; otherwise INFO, with the access log and
+    # library chatter limited to warnings
+    app.config.setdefault('LOG_FILE', 'log.txt')
+    app.config.setdefault('LOG_LEVEL', 'DEBUG' if app.debug else 'INFO')
+    app.config.setdefault('LOG_LEVELS', {} if app.debug else {'werkzeug': 'WARNING', 'urllib3': 'WARNING'})
+    app.config.setdefault('LOG_MAX_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('LOG_BACKUP_COUNT', 5)
+    if not app.config['LOG_FILE']:
+        return
+    configure_logging(app.config['LOG_FILE'], app.config['LOG_LEVEL'], app.config['LOG_LEVELS'],
+                      app.config['LOG_MAX_BYTES'], app.config['LOG_BACKUP_COUNT'])
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,86 @@
+# The in-process LRU with a per-entry TTL behind the user cache, the price
+# cache and the Coinbase client pool. Each process keeps its own copy, so the
+# TTL bounds how long a change made by another process can go unseen.
+from collections import OrderedDict
+import threading
+import time
+
+
+class LRUCache:
+    """Thread-safe LRU of at most ``maxsize`` entries, each living ``ttl`` seconds.
+
+    Methods that drop entries return the dropped values, so owners of
+    resources (e.g. HTTP sessions) can close them outside the lock.
+    """
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, load=None):
+        # Without ``load`` a missing or expired entry is None; with it, it is
+        # loaded (outside the lock) and stored
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+        if load is None:
+            return None
+        value = load(key)
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.maxsize:
+                evicted.append(self._entries.popitem(last=False)[1][1])
+        return evicted
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry and entry[1]
+
+    def take(self, match):
+        # Remove and return the most recently used live value whose key matches
+        with self._lock:
+            now = self.clock()
+            for key in reversed(self._entries):
+                expires, value = self._entries[key]
+                if expires >= now and match(key):
+                    del self._entries[key]
+                    return value
+        return None
+
+    def discard(self, match):
+        with self._lock:
+            stale = [key for key in self._entries if match(key)]
+            return [self._entries.pop(key)[1] for key in stale]
+
+    def expire(self):
+        now = self.clock()
+        with self._lock:
+            stale = [key for key, (expires, _) in self._entries.items() if expires < now]
+            return [self._entries.pop(key)[1] for key in stale]
+
+    def clear(self):
+        with self._lock:
+            values = [value for _, value in self._entries.values()]
+            self._entries.clear()
+        return values
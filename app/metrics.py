@@ -0,0 +1,188 @@
+# Request, SQL and import metrics, exposed on /metrics in the Prometheus text
+# format. Metrics live in process memory; with several worker processes each
+# one reports its own series and Prometheus sums them per instance.
+from bisect import bisect_left
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+IMPORT_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+        bounds = self.buckets + (float('inf'),)
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, [le])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+class Metrics:
+    def __init__(self):
+        self.request_seconds = Histogram(
+            'http_request_duration_seconds', 'Time to produce a response, per endpoint.',
+            ('endpoint', 'method'))
+        self.requests = Counter(
+            'http_requests_total', 'Responses per endpoint and status code.', ('endpoint', 'method', 'status'))
+        self.request_statements = Histogram(
+            'http_request_sql_statements', 'SQL statements executed per request.', ('endpoint',),
+            STATEMENT_BUCKETS)
+        self.request_sql_seconds = Histogram(
+            'http_request_sql_duration_seconds', 'Total SQL time per request.', ('endpoint',))
+        self.statements = Counter(
+            'sql_statements_total', 'SQL statements executed, inside or outside requests.', ('context',))
+        self.sql_seconds = Counter(
+            'sql_duration_seconds_total', 'Time spent executing SQL statements.', ('context',))
+        self.import_seconds = Histogram(
+            'import_duration_seconds', 'Duration of imports, restores and syncs.', ('kind', 'status'),
+            IMPORT_BUCKETS)
+        self.import_rows = Counter(
+            'import_rows_total', 'Rows handled by imports, restores and syncs.', ('kind', 'outcome'))
+
+    def all(self):
+        return [value for value in vars(self).values() if isinstance(value, (Counter, Histogram))]
+
+    def render(self):
+        lines = []
+        for metric in self.all():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def record_import(self, kind, status, seconds, inserted=0, skipped=0, failed=0):
+        self.import_seconds.observe(kind, status, value=seconds)
+        for outcome, count in (('inserted', inserted), ('skipped', skipped), ('failed', failed)):
+            if count:
+                self.import_rows.inc(kind, outcome, amount=count)
+
+
+def metrics():
+    return current_app.extensions['metrics']
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+
+
+def _observe_request(response):
+    # Streamed bodies (exports) keep running after this point; their time
+    # and queries are not part of the request histograms
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return response
+    registry = metrics()
+    endpoint = _endpoint()
+    registry.request_seconds.observe(endpoint, request.method, value=time.perf_counter() - started)
+    registry.requests.inc(endpoint, request.method, str(response.status_code))
+    registry.request_statements.observe(endpoint, value=g.sql_statements)
+    registry.request_sql_seconds.observe(endpoint, value=g.sql_seconds)
+    return response
+
+
+def instrument_engine(engine, registry):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['metrics_started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        in_request = has_request_context() and 'metrics_started' in g
+        if in_request:
+            g.sql_statements += 1
+            g.sql_seconds += elapsed
+        context_label = 'request' if in_request else 'background'
+        registry.statements.inc(context_label)
+        registry.sql_seconds.inc(context_label, amount=elapsed)
+
+
+def metrics_view():
+    return Response(metrics().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app, db):
+    app.config.setdefault('METRICS_ENABLED', True)
+    registry = app.extensions['metrics'] = Metrics()
+    if not app.config['METRICS_ENABLED']:
+        return
+    with app.app_context():
+        instrument_engine(db.engine, registry)
+    app.before_request(_start_request)
+    app.after_request(_observe_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
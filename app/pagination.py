@@ -0,0 +1,93 @@
+# Keyset (cursor) pagination over transactions, newest first. Pages are
+# addressed by the (timestamp, id) of their boundary rows instead of an
+# OFFSET, so every page is one index range read however deep it is.
+from dataclasses import dataclass
+from datetime import datetime
+from sqlalchemy import func, tuple_
+from database.models import db, Holding, Transaction
+import base64
+
+DEFAULT_PER_PAGE = 10
+MAX_PER_PAGE = 100
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    per_page: int
+    next_token: str = None
+    prev_token: str = None
+    total: int = None
+
+    @property
+    def has_next(self):
+        return self.next_token is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_token is not None
+
+
+def encode_token(tx):
+    raw = f'{tx.timestamp.isoformat()}|{tx.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    # Returns (timestamp, id) or None for a missing or malformed token
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        timestamp, tx_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(tx_id)
+    except ValueError:
+        return None
+
+
+def clamp_per_page(per_page):
+    if not per_page:
+        return DEFAULT_PER_PAGE
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+def cached_count(user_id, source, currency=None):
+    # Holdings keep a per-currency transaction count, so no COUNT(*) over the history
+    query = db.session.query(func.sum(Holding.tx_count)).filter_by(user_id=user_id, source=source)
+    if currency:
+        query = query.filter_by(currency=currency)
+    return query.scalar() or 0
+
+
+def keyset_paginate(query, per_page, after=None, before=None):
+    """One page of ``query`` ordered by (timestamp, id) descending.
+
+    ``after`` continues towards older rows from a next_token, ``before``
+    goes back towards newer rows from a prev_token. One extra row is read to
+    tell whether another page exists in the direction of travel.
+    """
+    key = tuple_(Transaction.timestamp, Transaction.id)
+    after, before = decode_token(after), decode_token(before)
+
+    if before is not None:
+        rows = (query.filter(key > tuple_(*before))
+                .order_by(Transaction.timestamp.asc(), Transaction.id.asc())
+                .limit(per_page + 1).all())
+        more_newer = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        # We came from an older page, so there is always one to go back to
+        has_older, has_newer = bool(items), more_newer
+    else:
+        if after is not None:
+            query = query.filter(key < tuple_(*after))
+        rows = (query.order_by(Transaction.timestamp.desc(), Transaction.id.desc())
+                .limit(per_page + 1).all())
+        items = rows[:per_page]
+        has_older, has_newer = len(rows) > per_page, after is not None and bool(items)
+
+    return KeysetPage(
+        items=items,
+        per_page=per_page,
+        next_token=encode_token(items[-1]) if has_older else None,
+        prev_token=encode_token(items[0]) if has_newer else None,
+    )
@@ -0,0 +1,274 @@
+# Local price history for valuing holdings. Prices are stored per source,
+# symbol and day in price_point: each user's imported transactions price that
+# user's holdings, and bulk-loaded CSVs price everyone's. Series are read back
+# as sorted NumPy arrays so a whole series of days is priced with one
+# searchsorted. Hot series stay in an in-process LRU.
+from collections import defaultdict
+from datetime import datetime, time as day_time
+from flask import current_app
+from sqlalchemy import String, cast, select
+from database.engine import UPSERT_DIALECTS, serialized_write
+from database.models import db, DailyHolding, PricePoint, SETTLED_STATUS
+from app.holdings import currencies
+from app.data_versions import bump, bump_users, prices_scope
+from app.lru import LRUCache
+import click
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Accepted headers of price CSVs, matched case-insensitively
+DATE_COLUMNS = ('date', 'day', 'timestamp', 'time', 'run date')
+PRICE_COLUMNS = ('close', 'price', 'close price', 'adj close', 'price at transaction')
+SYMBOL_COLUMNS = ('symbol', 'asset', 'currency', 'ticker')
+
+# Currency symbols, thousands separators and spaces around numbers in CSVs
+CURRENCY_CHARS = r'[$,\s]'
+
+WRITE_BATCH_SIZE = 1000
+
+SOURCES = ('coinbase', 'fidelity')
+
+
+def day_numbers(days):
+    # Dates (or ISO date strings) as days since the epoch, converted in C
+    return np.asarray(days, dtype='datetime64[D]').astype('int64')
+
+
+class PriceSeries:
+    """Prices of one symbol on the days they are known, oldest first.
+
+    A user's series combines their transaction prices with the loaded prices
+    of the source; on days with both, the loaded price wins.
+    """
+
+    def __init__(self, days, prices):
+        # Days as day numbers (see day_numbers), so lookups are integer searches
+        self.days = np.asarray(days, dtype='int64')
+        self.prices = np.asarray(prices, dtype='float64')
+
+    def __len__(self):
+        return len(self.days)
+
+    def as_of(self, days):
+        """Price on or before each of ``days`` (day numbers); NaN before the first."""
+        days = np.asarray(days, dtype='int64')
+        index = np.searchsorted(self.days, days, side='right') - 1
+        prices = np.full(len(days), np.nan)
+        known = index >= 0
+        prices[known] = self.prices[index[known]]
+        return prices
+
+    def latest(self):
+        return float(self.prices[-1]) if len(self.prices) else None
+
+
+def _load_series(key):
+    source, user_id, symbol = key
+    prices = PricePoint.__table__.c
+    loaded = prices.user_id.is_(None)
+    rows = db.session.execute(
+        select(cast(prices.day, String), prices.price)
+        .where(prices.source == source, prices.symbol == symbol, (prices.user_id == user_id) | loaded)
+        .order_by(prices.day, loaded)
+    ).all()
+    if not rows:
+        return PriceSeries([], [])
+    days, values = zip(*rows)
+    days = day_numbers(days)
+    # A loaded price sorts after the user's price of the same day and wins
+    last = np.r_[days[1:] != days[:-1], True]
+    return PriceSeries(days[last], np.asarray(values, dtype='float64')[last])
+
+
+def price_series(user_id, source, symbol):
+    return current_app.extensions['price_cache'].get((source, user_id, symbol), _load_series)
+
+
+def latest_prices(user_id, source, symbols):
+    # {symbol: latest known price}, skipping symbols without any
+    prices = {}
+    for symbol in symbols:
+        price = price_series(user_id, source, symbol).latest()
+        if price is not None:
+            prices[symbol] = price
+    return prices
+
+
+def invalidate_prices(source, symbols, user_id=None):
+    # Writes in this process drop their symbols' series; without a user, those
+    # of every user. Cache keys are (source, user_id, symbol).
+    current_app.extensions['price_cache'].discard(
+        lambda key: key[0] == source and key[2] in symbols and (user_id is None or key[1] == user_id))
+
+
+def _upsert(points, loaded):
+    # points: {(source, user_id, symbol, day): (price, observed_at)}, with
+    # user_id None for loaded prices; the caller commits
+    if not points:
+        return 0
+    rows = [
+        {'source': source, 'user_id': user_id, 'symbol': symbol, 'day': day, 'price': price,
+         'observed_at': observed_at}
+        for (source, user_id, symbol, day), (price, observed_at) in points.items()
+    ]
+    table = PricePoint.__table__
+    # Loaded and transaction prices each have their own partial unique index
+    if loaded:
+        key, key_where = ['source', 'symbol', 'day'], table.c.user_id.is_(None)
+    else:
+        key, key_where = ['user_id', 'source', 'symbol', 'day'], table.c.user_id.isnot(None)
+    dialect_insert = UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        batch = rows[start:start + WRITE_BATCH_SIZE]
+        if dialect_insert is not None:
+            stmt = dialect_insert(table)
+            # A transaction price only replaces an earlier one of the same day
+            replace = None if loaded else table.c.observed_at <= stmt.excluded.observed_at
+            stmt = stmt.on_conflict_do_update(
+                index_elements=key,
+                index_where=key_where,
+                set_={column: stmt.excluded[column] for column in ('price', 'observed_at')},
+                where=replace,
+            )
+            db.session.execute(stmt, batch)
+            continue
+        for row in batch:
+            existing = PricePoint.query.filter_by(
+                source=row['source'], user_id=row['user_id'], symbol=row['symbol'], day=row['day']).first()
+            if existing is None:
+                db.session.add(PricePoint(**row))
+            elif loaded or existing.observed_at <= row['observed_at']:
+                existing.price, existing.observed_at = row['price'], row['observed_at']
+
+    symbols = defaultdict(set)
+    for source, user_id, symbol, _ in points:
+        symbols[(source, user_id)].add(symbol)
+    for (source, user_id), changed in symbols.items():
+        invalidate_prices(source, changed, user_id)
+    if loaded:
+        bump(prices_scope(source) for source, _ in symbols)
+    else:
+        bump_users((user_id, source) for source, user_id in symbols)
+    return len(rows)
+
+
+def record_transaction_prices(rows):
+    """Keep the latest ``price_at_transaction`` per user, source, currency and day of ``rows``.
+
+    Called with every batch written by the importers; the caller commits.
+    The prices only value the holdings of the user they came from.
+    """
+    points = {}
+    for row in rows:
+        price = row['price_at_transaction']
+        if price is None or price != price or price <= 0 or row['status'] != SETTLED_STATUS:
+            continue
+        timestamp = row['timestamp']
+        key = (row['source'], row['user_id'], row['currency'], timestamp.date())
+        current = points.get(key)
+        if current is None or current[1] <= timestamp:
+            points[key] = (float(price), timestamp)
+    return _upsert(points, loaded=False)
+
+
+def _find_column(columns, names):
+    lowered = {column.strip().lower(): column for column in columns}
+    return next((lowered[name] for name in names if name in lowered), None)
+
+
+def read_price_csv(file, symbol=None):
+    """Parse a price CSV into {(symbol, day): (price, observed_at)}.
+
+    Needs a date and a close/price column, plus a symbol column unless
+    ``symbol`` is given. Rows that do not parse are skipped.
+    """
+    frame = pd.read_csv(file, dtype='string')
+    date_column = _find_column(frame.columns, DATE_COLUMNS)
+    price_column = _find_column(frame.columns, PRICE_COLUMNS)
+    symbol_column = _find_column(frame.columns, SYMBOL_COLUMNS)
+    if date_column is None or price_column is None or (symbol is None and symbol_column is None):
+        raise ValueError(f'Price CSV needs date, price and symbol columns, found {list(frame.columns)}')
+
+    days = pd.to_datetime(frame[date_column], format='mixed', errors='coerce', utc=True).dt.tz_convert(None)
+    prices = pd.to_numeric(frame[price_column].str.replace(CURRENCY_CHARS, '', regex=True), errors='coerce')
+    symbols = pd.Series(symbol, index=frame.index, dtype='string') if symbol else frame[symbol_column].str.strip()
+    valid = days.notna() & prices.notna() & (prices > 0) & symbols.notna()
+    if not valid.all():
+        logger.warning(f"Skipped {int((~valid).sum())} unparseable price rows")
+    points = {}
+    for symbol_value, day, price in zip(symbols[valid].tolist(), days[valid].tolist(), prices[valid].tolist()):
+        day = day.date()
+        points[(symbol_value, day)] = (price, datetime.combine(day, day_time.max))
+    return points
+
+
+def load_price_csv(file, source, symbol=None):
+    """Bulk-load a price CSV for every user of ``source``.
+
+    Loaded prices take precedence over transaction prices of the same day.
+    """
+    points = {(source, None, symbol_value, day): value
+              for (symbol_value, day), value in read_price_csv(file, symbol).items()}
+    with serialized_write('load prices'):
+        written = _upsert(points, loaded=True)
+        db.session.commit()
+    return written
+
+
+def value_series(user_id, source, days, currency=None):
+    """Market value of the holdings at the end of each of ``days``.
+
+    Every currency's end-of-day balance (from the daily holdings series) is
+    carried forward to each day and multiplied by its as-of price; days
+    before a currency's first price count it as zero.
+    """
+    wanted = day_numbers(days)
+    values = np.zeros(len(wanted))
+    # Only currencies with a price history can add value
+    priced = [symbol for symbol in ([currency] if currency else currencies(user_id, source))
+              if len(price_series(user_id, source, symbol))]
+    if not priced or not len(wanted):
+        return values
+
+    series = DailyHolding.__table__.c
+    # Days come back as text and are parsed by NumPy, not row by row
+    rows = db.session.execute(
+        select(series.currency, cast(series.day, String), series.balance)
+        .where(series.user_id == user_id, series.source == source, series.currency.in_(priced))
+        .order_by(series.currency, series.day)
+    ).all()
+    if not rows:
+        return values
+
+    symbols, holding_days, balances = zip(*rows)
+    holding_days = day_numbers(holding_days)
+    balances = np.array(balances, dtype='float64')
+    names = np.array(symbols, dtype=object)
+    # Rows are grouped by currency; each group is one searchsorted
+    bounds = np.append(np.flatnonzero(np.r_[True, names[1:] != names[:-1]]), len(rows))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        index = np.searchsorted(holding_days[start:end], wanted, side='right') - 1
+        held = np.where(index >= 0, balances[start:end][np.maximum(index, 0)], 0.0)
+        prices = price_series(user_id, source, symbols[start]).as_of(wanted)
+        values += np.nan_to_num(held * prices)
+    return values
+
+
+@click.command('load-prices')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--source', required=True, type=click.Choice(SOURCES),
+              help='Source whose symbols the prices are for (Fidelity tickers are not crypto assets).')
+@click.option('--symbol', help='Symbol of every row, for files without a symbol column.')
+def load_prices_command(path, source, symbol):
+    """Load daily prices from a CSV with date, close/price and symbol columns."""
+    written = load_price_csv(path, source, symbol)
+    click.echo(f'Loaded {written} daily {source} prices')
+
+
+def init_app(app):
+    app.config.setdefault('PRICE_CACHE_SIZE', 256)
+    app.config.setdefault('PRICE_CACHE_TTL', 300)
+    app.extensions['price_cache'] = LRUCache(app.config['PRICE_CACHE_SIZE'], app.config['PRICE_CACHE_TTL'])
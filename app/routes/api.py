@@ -0,0 +1,162 @@
+# Read-only JSON API over the same data as the pages, so the templates and
+# other dashboards can fetch just the part they need:
+#   GET /api/<source>/holdings
+#   GET /api/<source>/transactions?currency=BTC,ETH&type=buy&since=2024-01-01&fields=id,amount
+#   GET /api/<source>/charts?currency=BTC,ETH&resolution=week
+from datetime import datetime, timedelta
+from flask import Blueprint, abort, g, jsonify, request
+from database.models import db, Transaction
+from app.charts import RESOLUTIONS, currency_chart_data
+from app.holdings import balances
+from app.pagination import cached_count, clamp_per_page, keyset_paginate
+from app.prices import latest_prices
+from app.data_versions import conditional, prices_scope, user_scope
+
+api_bp = Blueprint('api', __name__)
+
+SOURCES = ('coinbase', 'fidelity')
+
+# API field -> Transaction column
+TRANSACTION_FIELDS = {
+    'id': Transaction.id,
+    'tx_id': Transaction.coinbase_tx_id,
+    'type': Transaction.type,
+    'amount': Transaction.amount,
+    'currency': Transaction.currency,
+    'timestamp': Transaction.timestamp,
+    'status': Transaction.status,
+    'price': Transaction.price_at_transaction,
+}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+@api_bp.errorhandler(BadRequest)
+def bad_request(e):
+    return jsonify({'error': str(e)}), 400
+
+
+@api_bp.errorhandler(404)
+def not_found(e):
+    return jsonify({'error': 'Not found.'}), 404
+
+
+@api_bp.before_request
+def require_user():
+    if g.user is None:
+        return jsonify({'error': 'Not logged in.'}), 401
+    if request.view_args and request.view_args.get('source') not in SOURCES:
+        abort(404)
+
+
+def _list_arg(name):
+    value = request.args.get(name, '')
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(f'{name} must be an ISO date or datetime, got {value!r}')
+
+
+def _selected_fields():
+    fields = _list_arg('fields') or list(TRANSACTION_FIELDS)
+    unknown = [field for field in fields if field not in TRANSACTION_FIELDS]
+    if unknown:
+        raise BadRequest(f'Unknown fields {unknown}; choose from {list(TRANSACTION_FIELDS)}')
+    return fields
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _priced_scopes(user_id, source):
+    return [user_scope(user_id, source), prices_scope(source)]
+
+
+def _source_scopes(user_id, source):
+    return [user_scope(user_id, source)]
+
+
+@api_bp.route('/<source>/holdings')
+@conditional(_priced_scopes)
+def holdings(source):
+    holdings = balances(g.user.id, source)
+    prices = latest_prices(g.user.id, source, [holding.currency for holding in holdings])
+    return jsonify({
+        'source': source,
+        'holdings': [
+            {
+                'currency': holding.currency,
+                'amount': holding.amount,
+                'tx_count': holding.tx_count,
+                'price': prices.get(holding.currency),
+                'value': holding.amount * prices[holding.currency] if holding.currency in prices else None,
+            }
+            for holding in holdings
+        ],
+    })
+
+
+@api_bp.route('/<source>/transactions')
+@conditional(_source_scopes)
+def transactions(source):
+    fields = _selected_fields()
+    currencies = _list_arg('currency')
+    types = _list_arg('type')
+    since, until = _date_arg('since'), _date_arg('until')
+    per_page = clamp_per_page(request.args.get('per_page', type=int))
+
+    # Only the requested columns are read, plus the (timestamp, id) page key
+    columns = dict.fromkeys(['id', 'timestamp', *fields])
+    query = db.session.query(*(TRANSACTION_FIELDS[field].label(field) for field in columns)).filter(
+        Transaction.user_id == g.user.id, Transaction.source == source)
+    if currencies:
+        query = query.filter(Transaction.currency.in_(currencies))
+    if types:
+        query = query.filter(Transaction.type.in_(types))
+    if since is not None:
+        query = query.filter(Transaction.timestamp >= since)
+    if until is not None:
+        # A bare date includes the whole day
+        if len(request.args['until']) == 10:
+            until += timedelta(days=1)
+            query = query.filter(Transaction.timestamp < until)
+        else:
+            query = query.filter(Transaction.timestamp <= until)
+
+    page = keyset_paginate(query, per_page, after=request.args.get('after'), before=request.args.get('before'))
+    # The holdings counts only cover currency filters
+    total = None
+    if not types and since is None and until is None and len(currencies) <= 1:
+        total = cached_count(g.user.id, source, currencies[0] if currencies else None)
+
+    return jsonify({
+        'source': source,
+        'items': [{field: _json_value(getattr(row, field)) for field in fields} for row in page.items],
+        'next': page.next_token,
+        'prev': page.prev_token,
+        'per_page': per_page,
+        'total': total,
+    })
+
+
+@api_bp.route('/<source>/charts')
+@conditional(_priced_scopes)
+def charts(source):
+    resolution = request.args.get('resolution', 'auto')
+    if resolution not in RESOLUTIONS:
+        resolution = 'auto'
+    return jsonify({
+        'source': source,
+        'resolution': resolution,
+        'series': currency_chart_data(g.user.id, source, _list_arg('currency'), resolution),
+    })
@@ -1,14 +1,13 @@
-from flask import render_template, redirect, url_for, request, session, flash
-from database.models import db, User
+from flask import render_template, redirect, url_for, request, session, flash, g
+from database.models import User
+from app.identity import login_user, logout_user
 from werkzeug.security import check_password_hash
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, filename='log.txt')
 logger = logging.getLogger(__name__)
 
 def login():
-    if 'username' in session:
+    if g.user is not None:
         return redirect(url_for('main.index'))
 
     if request.method == 'POST':
@@ -18,9 +17,9 @@ def login():
 
         if user and check_password_hash(user.password, password):
             if user.totp_secret:
-                session['username_pending'] = username
+                session['user_id_pending'] = user.id
                 return redirect(url_for('auth.verify_2fa'))
-            session['username'] = username
+            login_user(user)
             logger.info(f"User {username} logged in")
             return redirect(url_for('main.index'))
         else:
@@ -29,8 +28,8 @@ def login():
     return render_template('login.html')
 
 def logout():
-    username = session.pop('username', None)
-    session.pop('username_pending', None)
-    if username:
-        logger.info(f"User {username} logged out")
+    user = g.user
+    logout_user()
+    if user:
+        logger.info(f"User {user.username} logged out")
     return redirect(url_for('auth.login'))
\ No newline at end of file
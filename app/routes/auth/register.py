@@ -1,14 +1,13 @@
-from flask import render_template, redirect, url_for, request, session, flash
+from flask import render_template, redirect, url_for, request, flash, g
 from database.models import db, User
+from app.identity import login_user
 from werkzeug.security import generate_password_hash
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, filename='log.txt')
 logger = logging.getLogger(__name__)
 
 def register():
-    if 'username' in session:
+    if g.user is not None:
         return redirect(url_for('main.index'))
 
     if request.method == 'POST':
@@ -26,7 +25,7 @@ def register():
             db.session.add(new_user)
             db.session.commit()
             logger.info(f"User {username} registered")
-            session['username'] = username
+            login_user(new_user)
             return redirect(url_for('main.index'))
 
     return render_template('register.html')
\ No newline at end of file
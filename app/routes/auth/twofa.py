@@ -1,25 +1,20 @@
-from flask import render_template, redirect, url_for, request, session, flash
+from flask import render_template, redirect, url_for, request, session, flash, g
 from database.models import db, User
+from app.identity import invalidate_user, login_user
 import pyotp
 import qrcode
 from io import BytesIO
 import base64
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, filename='log.txt')
 logger = logging.getLogger(__name__)
 
 def setup_2fa():
-    if 'username' not in session:
+    user = g.user
+    if user is None:
         flash('Please log in to set up 2FA', 'error')
         return redirect(url_for('auth.login'))
 
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found', 'error')
-        return redirect(url_for('auth.login'))
-
     if user.totp_secret:
         flash('2FA is already enabled', 'info')
         return redirect(url_for('settings.settings'))
@@ -48,19 +43,23 @@ def setup_2fa():
     return render_template('2fa_setup.html', qr_base64=qr_base64, secret=secret)
 
 def verify_2fa():
-    if 'username' not in session and 'username_pending' not in session:
+    # Either a logged-in user confirming 2FA setup, or a login waiting for its code
+    setting_up = g.user is not None
+    if setting_up:
+        user = g.user
+    elif 'user_id_pending' in session:
+        user = db.session.get(User, session['user_id_pending'])
+        if not user:
+            flash('User not found', 'error')
+            return redirect(url_for('auth.login'))
+    else:
         flash('Please log in to verify 2FA', 'error')
         return redirect(url_for('auth.login'))
-
-    username = session.get('username') or session.get('username_pending')
-    user = User.query.filter_by(username=username).first()
-    if not user:
-        flash('User not found', 'error')
-        return redirect(url_for('auth.login'))
+    username = user.username
 
     if request.method == 'POST':
         code = request.form['code']
-        secret = session.get('totp_secret') if 'username' in session else user.totp_secret
+        secret = session.get('totp_secret') if setting_up else user.totp_secret
 
         if not secret:
             flash('No 2FA setup in progress', 'error')
@@ -68,18 +67,18 @@ def verify_2fa():
 
         totp = pyotp.TOTP(secret)
         if totp.verify(code):
-            if 'username' in session:
+            if setting_up:
                 # Setting up 2FA
                 user.totp_secret = secret
                 db.session.commit()
+                invalidate_user(user.id)
                 session.pop('totp_secret', None)
                 logger.info(f"User {username} enabled 2FA")
                 flash('2FA enabled successfully', 'success')
                 return redirect(url_for('settings.settings'))
             else:
                 # Logging in with 2FA
-                session.pop('username_pending', None)
-                session['username'] = username
+                login_user(user)
                 logger.info(f"User {username} logged in with 2FA")
                 return redirect(url_for('main.index'))
         else:
@@ -88,18 +87,15 @@ def verify_2fa():
     return render_template('2fa_verify.html')
 
 def disable_2fa():
-    if 'username' not in session:
+    user = g.user
+    if user is None:
         flash('Please log in to disable 2FA', 'error')
         return redirect(url_for('auth.login'))
 
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found', 'error')
-        return redirect(url_for('auth.login'))
-
     if user.totp_secret:
         user.totp_secret = None
         db.session.commit()
+        invalidate_user(user.id)
         logger.info(f"User {user.username} disabled 2FA")
         flash('2FA disabled successfully', 'success')
     else:
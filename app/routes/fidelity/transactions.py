@@ -1,25 +1,25 @@
-from flask import render_template, redirect, url_for, session, flash, request
-from database.models import db, User, Transaction
-from sqlalchemy import func
+from flask import render_template, request, g
+from database.models import Transaction
+from app.identity import login_required
+from app.holdings import currencies as holding_currencies
+from app.charts import chart_data as balance_chart
+from app.pagination import cached_count, clamp_per_page, keyset_paginate
+from app.data_versions import conditional, prices_scope, user_scope
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, filename='log.txt')
 logger = logging.getLogger(__name__)
 
+@login_required
+@conditional(lambda user_id: [user_scope(user_id, 'fidelity'), prices_scope('fidelity')])
 def transactions():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('auth.login'))
+    user = g.user
 
     # Get query parameters
     currency = request.args.get('currency', '')
-    page = request.args.get('page', 1, type=int)
-    per_page = 10  # Transactions per page
+    after = request.args.get('after')
+    before = request.args.get('before')
+    resolution = request.args.get('resolution', 'auto')
+    per_page = clamp_per_page(request.args.get('per_page', type=int))
 
     # Base query for transactions
     query = Transaction.query.filter_by(user_id=user.id, source='fidelity')
@@ -28,45 +28,16 @@ def transactions():
     if currency:
         query = query.filter_by(currency=currency)
 
-    # Paginate results
-    pagination = query.order_by(Transaction.timestamp.desc()).paginate(page=page, per_page=per_page, error_out=False)
+    # Keyset pagination: constant cost per page, total from the cached holdings counts
+    pagination = keyset_paginate(query, per_page, after=after, before=before)
+    pagination.total = cached_count(user.id, 'fidelity', currency)
     transactions = pagination.items
 
     # Get unique currencies (stock symbols) for filter dropdown
-    currencies = db.session.query(Transaction.currency).filter_by(user_id=user.id, source='fidelity').distinct().all()
-    currencies = [c[0] for c in currencies]
-
-    # Prepare chart data (cumulative amount owned by date)
-    chart_query = Transaction.query.filter_by(user_id=user.id, source='fidelity')
-    if currency:
-        chart_query = chart_query.filter_by(currency=currency)
-
-    # Fetch transactions ordered by timestamp
-    chart_transactions = (
-        chart_query
-        .filter(Transaction.type.in_(['Buy', 'Sell']))
-        .with_entities(
-            func.date(Transaction.timestamp).label('date'),
-            Transaction.amount,
-            Transaction.type
-        )
-        .order_by(Transaction.timestamp)
-        .all()
-    )
-
-    # Calculate cumulative amount owned by date
-    balance = 0
-    chart_data = {}
-    for tx in chart_transactions:
-        date = tx.date
-        amount = tx.amount
-        balance += amount
-        chart_data[date] = balance
+    currencies = holding_currencies(user.id, 'fidelity')
 
-    # Format chart data for Chart.js
-    chart_labels = sorted(chart_data.keys())
-    chart_values = [float(chart_data[date]) for date in chart_labels]
-    chart_data_dict = {'labels': chart_labels, 'values': chart_values}
+    # Cumulative amount owned by date, downsampled to at most CHART_MAX_POINTS points
+    chart_data = balance_chart(user.id, 'fidelity', currency, resolution)
 
     return render_template(
         'fidelity_transactions.html',
@@ -74,5 +45,7 @@ def transactions():
         currencies=currencies,
         currency=currency,
         pagination=pagination,
-        chart_data=chart_data_dict
+        chart_data=chart_data,
+        resolution=resolution,
+        per_page=per_page
     )
\ No newline at end of file
@@ -0,0 +1,42 @@
+from flask import Blueprint, g, jsonify
+from database.models import Job
+from app.jobs import cancel_job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+def _user_job(job_id):
+    return Job.query.filter_by(id=job_id, user_id=g.user.id).first()
+
+@jobs_bp.route('/')
+def list_jobs():
+    if g.user is None:
+        return jsonify({'error': 'Not logged in.'}), 401
+
+    jobs = Job.query.filter_by(user_id=g.user.id).order_by(Job.id.desc()).limit(20).all()
+    return jsonify({'jobs': [job.to_dict() for job in jobs]})
+
+@jobs_bp.route('/<int:job_id>')
+def job_status(job_id):
+    if g.user is None:
+        return jsonify({'error': 'Not logged in.'}), 401
+
+    job = _user_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found.'}), 404
+
+    return jsonify(job.to_dict())
+
+@jobs_bp.route('/<int:job_id>/cancel', methods=['POST'])
+def cancel(job_id):
+    if g.user is None:
+        return jsonify({'error': 'Not logged in.'}), 401
+
+    job = _user_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found.'}), 404
+
+    if not job.is_active:
+        return jsonify({'error': f'Job is already {job.status}.', 'job': job.to_dict()}), 409
+
+    cancel_job(job)
+    return jsonify(job.to_dict())
@@ -1,55 +1,62 @@
-from flask import Blueprint, render_template, session, redirect, url_for
-from database.models import db, User, Transaction
-from sqlalchemy import func
+from flask import Blueprint, render_template, g
+from app.identity import login_required
+from app.holdings import balances
+from app.cost_basis import cost_basis_summary, refresh_cost_basis
+from app.prices import latest_prices
+from app.data_versions import conditional, prices_scope, user_scope
 
 main_bp = Blueprint('main', __name__)
 
+
+def _money(value):
+    return f"{value:,.2f}" if value is not None else '-'
+
+
+def _with_cost_basis(user_id, source, holdings, amount_format):
+    # Balances valued from the price store (cached per symbol) and joined with
+    # their open lots; lots only change when transactions do
+    prices = latest_prices(user_id, source, [holding.currency for holding in holdings])
+    refresh_cost_basis(user_id, source)
+    summary = {row['currency']: row for row in cost_basis_summary(user_id, source, prices=prices)}
+    rows = []
+    for holding in holdings:
+        basis = summary.get(holding.currency, {})
+        price = prices.get(holding.currency)
+        rows.append({
+            'currency': holding.currency,
+            'amount': amount_format.format(holding.amount),
+            'value': _money(holding.amount * price if price is not None else None),
+            'cost_basis': _money(basis.get('cost_basis')),
+            'unrealized_gain': _money(basis.get('unrealized_gain')),
+            'realized_gain': _money(basis.get('realized_gain')),
+        })
+    totals = {
+        'value': _money(sum(holding.amount * prices[holding.currency]
+                            for holding in holdings if holding.currency in prices)),
+        'realized_gain': _money(sum(row['realized_gain'] for row in summary.values())) if summary else None,
+    }
+    return rows, totals
+
 @main_bp.route('/')
+@login_required
+@conditional(lambda user_id: [user_scope(user_id, 'coinbase'), user_scope(user_id, 'fidelity'),
+                              prices_scope('coinbase'), prices_scope('fidelity')])
 def index():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        return redirect(url_for('auth.login'))
+    user = g.user
 
     # Crypto balances (source='coinbase')
-    crypto_balances = (
-        db.session.query(
-            Transaction.currency,
-            func.sum(Transaction.amount).label('total_amount')
-        )
-        .filter_by(user_id=user.id, source='coinbase')
-        .group_by(Transaction.currency)
-        .having(func.sum(Transaction.amount) != 0)
-        .order_by(Transaction.currency)
-        .all()
-    )
-    formatted_crypto_balances = [
-        {'currency': balance.currency, 'amount': f"{balance.total_amount:.8f}"}
-        for balance in crypto_balances
-    ]
+    formatted_crypto_balances, crypto_totals = _with_cost_basis(
+        user.id, 'coinbase', balances(user.id, 'coinbase'), '{:.8f}')
 
     # Stock balances (source='fidelity')
-    stock_balances = (
-        db.session.query(
-            Transaction.currency,
-            func.sum(Transaction.amount).label('total_amount')
-        )
-        .filter_by(user_id=user.id, source='fidelity')
-        .group_by(Transaction.currency)
-        .having(func.sum(Transaction.amount) != 0)
-        .order_by(Transaction.currency)
-        .all()
-    )
-    formatted_stock_balances = [
-        {'currency': balance.currency, 'amount': f"{balance.total_amount:.2f}"}
-        for balance in stock_balances
-    ]
+    formatted_stock_balances, stock_totals = _with_cost_basis(
+        user.id, 'fidelity', balances(user.id, 'fidelity'), '{:.2f}')
 
     return render_template(
         'index.html',
         user=user,
         crypto_balances=formatted_crypto_balances,
-        stock_balances=formatted_stock_balances
-    )
\ No newline at end of file
+        stock_balances=formatted_stock_balances,
+        crypto_totals=crypto_totals,
+        stock_totals=stock_totals,
+    )
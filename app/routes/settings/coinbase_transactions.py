@@ -1,113 +1,94 @@
-from flask import redirect, url_for, request, session, flash, send_file
-from database.models import db, User, Transaction
-import pandas as pd
+from flask import redirect, url_for, request, flash, g
+from database.engine import serialized_write
+from database.models import db, Transaction
+from app.identity import login_required
+from app.exports import columnar_response, export_response, has_transactions
+from app.coinbase_sync import reset_cursors
+from app.holdings import clear_holdings
+from app.cost_basis import clear_cost_basis
+from app.importers import (
+    COINBASE_BACKUP, ImportInterrupted, clear_checkpoints, read_csv_columns, restore_columnar, stream_import,
+)
 import logging
-from datetime import datetime
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, filename='log.txt')
 logger = logging.getLogger(__name__)
 
+@login_required
 def export_transactions():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
+    user = g.user
 
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('settings.settings'))
-
-    transactions = Transaction.query.filter_by(user_id=user.id, source='coinbase').all()
-    if not transactions:
+    if not has_transactions(user.id, 'coinbase'):
         flash('No Coinbase transactions to export.', 'info')
         return redirect(url_for('settings.settings'))
 
-    data = [{
-        'ID': tx.coinbase_tx_id,
-        'Timestamp': tx.timestamp.isoformat(),
-        'Transaction Type': tx.type,
-        'Asset': tx.currency,
-        'Quantity Transacted': tx.amount,
-        'Price at Transaction': tx.price_at_transaction,
-        'Notes': ''
-    } for tx in transactions]
-
-    df = pd.DataFrame(data)
-    filename = f"coinbase_transactions_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    df.to_csv(filename, index=False)
-    logger.info(f"User {user.username} exported Coinbase transactions to {filename}")
+    export_format = request.form.get('format', 'csv')
+    compress = request.form.get('compress') == '1'
+    logger.info(f"User {user.username} exported Coinbase transactions as {export_format}"
+                + (" (gzip)" if compress and export_format == 'csv' else ""))
     flash('Coinbase transactions exported successfully.', 'success')
-    return send_file(filename, as_attachment=True)
+    if export_format == 'npz':
+        return columnar_response(user.id, 'coinbase', 'coinbase_transactions')
+    return export_response(user.id, COINBASE_BACKUP, 'coinbase_transactions', extra_columns=('Notes',), compress=compress)
 
+@login_required
 def import_transactions():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('settings.settings'))
+    user = g.user
 
     if 'backup_file' not in request.files:
         flash('No file selected.', 'error')
         return redirect(url_for('settings.settings'))
 
     file = request.files['backup_file']
-    if not file or not file.filename.endswith('.csv'):
-        flash('Please upload a valid CSV file.', 'error')
+    if not file or not file.filename.endswith(('.csv', '.csv.gz', '.npz')):
+        flash('Please upload a valid CSV or .npz backup file.', 'error')
+        return redirect(url_for('settings.settings'))
+
+    if file.filename.endswith('.npz'):
+        try:
+            result = restore_columnar(file, user.id, 'coinbase')
+            logger.info(f"User {user.username} restored {result.inserted} Coinbase transactions from a columnar backup "
+                        f"(skipped {result.skipped}, failed {result.failed})")
+            flash(f'Successfully imported {result.inserted} Coinbase transactions '
+                  f'({result.skipped} already present, {result.failed} failed).', 'success')
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error restoring Coinbase columnar backup: {str(e)}")
+            flash(f'Failed to import Coinbase transactions: {str(e)}', 'error')
         return redirect(url_for('settings.settings'))
 
+    # Compressed exports can be restored as they are
+    compression = 'gzip' if file.filename.endswith('.gz') else None
     try:
-        df = pd.read_csv(file)
-        required_columns = ['ID', 'Timestamp', 'Transaction Type', 'Asset', 'Quantity Transacted', 'Price at Transaction']
-        if not all(col in df.columns for col in required_columns):
+        columns = read_csv_columns(file, compression=compression)
+        if COINBASE_BACKUP.missing_columns(columns):
             flash('Invalid backup CSV format.', 'error')
             return redirect(url_for('settings.settings'))
 
-        imported_count = 0
-        for index, row in df.iterrows():
-            if Transaction.query.filter_by(coinbase_tx_id=row['ID']).first():
-                continue
-            try:
-                timestamp = pd.to_datetime(row['Timestamp']).to_pydatetime()
-                price = float(row['Price at Transaction']) if row['Price at Transaction'] else None
-                new_tx = Transaction(
-                    coinbase_tx_id=row['ID'],
-                    user_id=user.id,
-                    type=row['Transaction Type'],
-                    amount=float(row['Quantity Transacted']),
-                    currency=row['Asset'],
-                    timestamp=timestamp,
-                    status='completed',
-                    price_at_transaction=price,
-                    source='coinbase'
-                )
-                db.session.add(new_tx)
-                imported_count += 1
-            except Exception as e:
-                logger.error(f"Error importing Coinbase transaction at row {index}: {str(e)}")
-                continue
-
-        db.session.commit()
-        logger.info(f"User {user.username} imported {imported_count} Coinbase transactions")
-        flash(f'Successfully imported {imported_count} Coinbase transactions.', 'success')
+        result = stream_import(file, user.id, COINBASE_BACKUP, compression=compression)
+        logger.info(f"User {user.username} imported {result.inserted} Coinbase transactions "
+                    f"(skipped {result.skipped}, failed {result.failed})")
+        flash(f'Successfully imported {result.inserted} Coinbase transactions '
+              f'({result.skipped} already present, {result.failed} failed).', 'success')
+    except ImportInterrupted as e:
+        logger.error(f"Error importing Coinbase backup: {str(e)}")
+        flash(f'{str(e)}. Upload the same file again to resume the import.', 'error')
     except Exception as e:
         logger.error(f"Error importing Coinbase backup: {str(e)}")
         flash(f'Failed to import Coinbase transactions: {str(e)}', 'error')
 
     return redirect(url_for('settings.settings'))
 
+@login_required
 def clear_transactions():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('settings.settings'))
-
-    Transaction.query.filter_by(user_id=user.id, source='coinbase').delete()
-    db.session.commit()
+    user = g.user
+
+    with serialized_write('clear transactions'):
+        Transaction.query.filter_by(user_id=user.id, source='coinbase').delete()
+        clear_checkpoints(user.id, 'coinbase')
+        clear_holdings(user.id, 'coinbase')
+        clear_cost_basis(user.id, 'coinbase')
+        reset_cursors(user.id)
+        db.session.commit()
     logger.info(f"User {user.username} cleared Coinbase transactions")
     flash('Coinbase transactions cleared successfully.', 'success')
     return redirect(url_for('settings.settings'))
\ No newline at end of file
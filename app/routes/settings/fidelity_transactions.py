@@ -1,115 +1,92 @@
-from flask import redirect, url_for, request, session, flash, send_file
-from database.models import db, User, Transaction
-import pandas as pd
+from flask import redirect, url_for, request, flash, g
+from database.engine import serialized_write
+from database.models import db, Transaction
+from app.identity import login_required
+from app.exports import columnar_response, export_response, has_transactions
+from app.holdings import clear_holdings
+from app.cost_basis import clear_cost_basis
+from app.importers import (
+    FIDELITY_BACKUP, ImportInterrupted, clear_checkpoints, read_csv_columns, restore_columnar, stream_import,
+)
 import logging
-from datetime import datetime
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, filename='log.txt')
 logger = logging.getLogger(__name__)
 
+@login_required
 def export_fidelity_transactions():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
+    user = g.user
 
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('settings.settings'))
-
-    transactions = Transaction.query.filter_by(user_id=user.id, source='fidelity').all()
-    if not transactions:
+    if not has_transactions(user.id, 'fidelity'):
         flash('No Fidelity transactions to export.', 'info')
         return redirect(url_for('settings.settings'))
 
-    data = [{
-        'ID': tx.coinbase_tx_id,
-        'Run Date': tx.timestamp.isoformat(),
-        'Action': tx.type,
-        'Symbol': tx.currency,
-        'Quantity': tx.amount,
-        'Price': tx.price_at_transaction
-    } for tx in transactions]
-
-    df = pd.DataFrame(data)
-    filename = f"fidelity_transactions_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    df.to_csv(filename, index=False)
-    logger.info(f"User {user.username} exported Fidelity transactions to {filename}")
+    export_format = request.form.get('format', 'csv')
+    compress = request.form.get('compress') == '1'
+    logger.info(f"User {user.username} exported Fidelity transactions as {export_format}"
+                + (" (gzip)" if compress and export_format == 'csv' else ""))
     flash('Fidelity transactions exported successfully.', 'success')
-    return send_file(filename, as_attachment=True)
+    if export_format == 'npz':
+        return columnar_response(user.id, 'fidelity', 'fidelity_transactions')
+    return export_response(user.id, FIDELITY_BACKUP, 'fidelity_transactions', compress=compress)
 
+@login_required
 def import_fidelity_transactions():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('settings.settings'))
+    user = g.user
 
     if 'backup_file' not in request.files:
         flash('No file selected.', 'error')
         return redirect(url_for('settings.settings'))
 
     file = request.files['backup_file']
-    if not file or not file.filename.endswith('.csv'):
-        flash('Please upload a valid CSV file.', 'error')
+    if not file or not file.filename.endswith(('.csv', '.csv.gz', '.npz')):
+        flash('Please upload a valid CSV or .npz backup file.', 'error')
+        return redirect(url_for('settings.settings'))
+
+    if file.filename.endswith('.npz'):
+        try:
+            result = restore_columnar(file, user.id, 'fidelity')
+            logger.info(f"User {user.username} restored {result.inserted} Fidelity transactions from a columnar backup "
+                        f"(skipped {result.skipped}, failed {result.failed})")
+            flash(f'Successfully imported {result.inserted} Fidelity transactions '
+                  f'({result.skipped} already present, {result.failed} failed).', 'success')
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error restoring Fidelity columnar backup: {str(e)}")
+            flash(f'Failed to import Fidelity transactions: {str(e)}', 'error')
         return redirect(url_for('settings.settings'))
 
+    # Compressed exports can be restored as they are
+    compression = 'gzip' if file.filename.endswith('.gz') else None
     try:
-        df = pd.read_csv(file)
-        required_columns = ['ID', 'Run Date', 'Action', 'Symbol', 'Quantity', 'Price']
-        if not all(col in df.columns for col in required_columns):
+        columns = read_csv_columns(file, compression=compression)
+        if FIDELITY_BACKUP.missing_columns(columns):
             flash('Invalid backup CSV format.', 'error')
             return redirect(url_for('settings.settings'))
 
-        imported_count = 0
-        for index, row in df.iterrows():
-            if Transaction.query.filter_by(coinbase_tx_id=row['ID']).first():
-                continue
-            try:
-                timestamp = pd.to_datetime(row['Run Date']).to_pydatetime()
-                price = float(row['Price']) if row['Price'] else None
-                amount = float(row['Quantity'])
-                if row['Action'].lower() == 'sell' and amount > 0:
-                    amount = -amount
-                new_tx = Transaction(
-                    coinbase_tx_id=row['ID'],
-                    user_id=user.id,
-                    type=row['Action'],
-                    amount=amount,
-                    currency=row['Symbol'],
-                    timestamp=timestamp,
-                    status='completed',
-                    price_at_transaction=price,
-                    source='fidelity'
-                )
-                db.session.add(new_tx)
-                imported_count += 1
-            except Exception as e:
-                logger.error(f"Error importing Fidelity transaction at row {index}: {str(e)}")
-                continue
-
-        db.session.commit()
-        logger.info(f"User {user.username} imported {imported_count} Fidelity transactions")
-        flash(f'Successfully imported {imported_count} Fidelity transactions.', 'success')
+        result = stream_import(file, user.id, FIDELITY_BACKUP, compression=compression)
+        logger.info(f"User {user.username} imported {result.inserted} Fidelity transactions "
+                    f"(skipped {result.skipped}, failed {result.failed})")
+        flash(f'Successfully imported {result.inserted} Fidelity transactions '
+              f'({result.skipped} already present, {result.failed} failed).', 'success')
+    except ImportInterrupted as e:
+        logger.error(f"Error importing Fidelity backup: {str(e)}")
+        flash(f'{str(e)}. Upload the same file again to resume the import.', 'error')
     except Exception as e:
         logger.error(f"Error importing Fidelity backup: {str(e)}")
         flash(f'Failed to import Fidelity transactions: {str(e)}', 'error')
 
     return redirect(url_for('settings.settings'))
 
+@login_required
 def clear_fidelity_transactions():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
+    user = g.user
 
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('settings.settings'))
-
-    Transaction.query.filter_by(user_id=user.id, source='fidelity').delete()
-    db.session.commit()
+    with serialized_write('clear transactions'):
+        Transaction.query.filter_by(user_id=user.id, source='fidelity').delete()
+        clear_checkpoints(user.id, 'fidelity')
+        clear_holdings(user.id, 'fidelity')
+        clear_cost_basis(user.id, 'fidelity')
+        db.session.commit()
     logger.info(f"User {user.username} cleared Fidelity transactions")
     flash('Fidelity transactions cleared successfully.', 'success')
     return redirect(url_for('settings.settings'))
\ No newline at end of file
@@ -1,31 +1,21 @@
-from flask import render_template, redirect, url_for, request, session, flash
+from flask import render_template, redirect, url_for, request, flash, g
 from database.models import db, User
+from app.identity import invalidate_user, login_required
+from app.coinbase_clients import invalidate_clients
 from werkzeug.security import generate_password_hash
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, filename='log.txt')
 logger = logging.getLogger(__name__)
 
+@login_required
 def settings():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('auth.login'))
+    user = g.user
 
     return render_template('settings.html', user=user)
 
+@login_required
 def update_email():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('auth.login'))
+    user = g.user
 
     email = request.form['email']
     if User.query.filter_by(email=email).first() and email != user.email:
@@ -33,35 +23,27 @@ def update_email():
     else:
         user.email = email
         db.session.commit()
+        invalidate_user(user.id)
         logger.info(f"User {user.username} updated email to {email}")
         flash('Email updated successfully.', 'success')
 
     return redirect(url_for('settings.settings'))
 
+@login_required
 def update_password():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('auth.login'))
+    user = g.user
 
     password = request.form['password']
     user.password = generate_password_hash(password, method='pbkdf2:sha256')
     db.session.commit()
+    invalidate_user(user.id)
     logger.info(f"User {user.username} updated password")
     flash('Password updated successfully.', 'success')
     return redirect(url_for('settings.settings'))
 
+@login_required
 def update_coinbase_credentials():
-    if 'username' not in session:
-        return redirect(url_for('auth.login'))
-
-    user = User.query.filter_by(username=session['username']).first()
-    if not user:
-        flash('User not found.', 'error')
-        return redirect(url_for('auth.login'))
+    user = g.user
 
     api_key = request.form['api_key']
     api_secret = request.form['api_secret']
@@ -70,6 +52,8 @@ def update_coinbase_credentials():
         user.set_coinbase_api_key(api_key)
         user.set_coinbase_api_secret(api_secret)
         db.session.commit()
+        invalidate_user(user.id)
+        invalidate_clients(user.id)
         logger.info(f"User {user.username} updated Coinbase credentials")
         flash('Coinbase API credentials updated successfully.', 'success')
     except Exception as e:
@@ -0,0 +1,5 @@
+# Standalone benchmarks, run as modules against a throwaway SQLite database:
+#   python -m benchmarks.suite --users 20 --transactions 200000 --out baseline.json
+#   python -m benchmarks.suite --users 20 --transactions 200000 --baseline baseline.json
+#   python -m benchmarks.generator --out data/ --transactions 1000000
+#   python -m benchmarks.backup_formats --rows 100000
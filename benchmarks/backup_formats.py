@@ -0,0 +1,80 @@
+# Compare backup formats (CSV, gzipped CSV, columnar .npz) by size, export
+# time and restore time on synthetic transactions.
+from datetime import datetime, timedelta
+import argparse
+import io
+import os
+import random
+import tempfile
+import time
+
+
+def synthetic_rows(user_id, count, seed=0):
+    from app.importers import transaction_row
+    rnd = random.Random(seed)
+    start = datetime(2015, 1, 1)
+    for i in range(count):
+        tx_type = rnd.choice(('buy', 'buy', 'sell', 'send', 'receive'))
+        amount = round(rnd.uniform(0.0001, 5), 8)
+        yield transaction_row(
+            f'bench-{i}', user_id, tx_type, -amount if tx_type in ('sell', 'send') else amount,
+            rnd.choice(('BTC', 'ETH', 'SOL', 'ADA', 'DOGE')), start + timedelta(seconds=i * 1700),
+            'coinbase', price=round(rnd.uniform(1, 60000), 2) if tx_type in ('buy', 'sell') else None,
+        )
+
+
+def _timed(func):
+    started = time.perf_counter()
+    value = func()
+    return value, time.perf_counter() - started
+
+
+def run(rows):
+    from app import create_app
+    from app.exports import csv_lines, gzipped
+    from app.holdings import clear_holdings
+    from app.importers import COINBASE_BACKUP, bulk_insert_transactions, columnar_bytes, restore_columnar, stream_import
+    from database.models import db, Transaction, User
+
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                      'JOB_WORKERS': 0})
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', password='-')
+        db.session.add(user)
+        db.session.commit()
+        bulk_insert_transactions(list(synthetic_rows(user.id, rows)))
+        db.session.commit()
+
+        def clear():
+            Transaction.query.filter_by(user_id=user.id).delete()
+            clear_holdings(user.id, 'coinbase')
+            db.session.commit()
+
+        csv_data, csv_export = _timed(lambda: b''.join(csv_lines(user.id, COINBASE_BACKUP)))
+        gz_data, gz_export = _timed(lambda: b''.join(gzipped(csv_lines(user.id, COINBASE_BACKUP))))
+        npz_data, npz_export = _timed(lambda: columnar_bytes(user.id, 'coinbase'))
+
+        results = []
+        for name, data, export_seconds, restore in (
+            ('csv', csv_data, csv_export, lambda d: stream_import(io.BytesIO(d), user.id, COINBASE_BACKUP)),
+            ('csv.gz', gz_data, gz_export,
+             lambda d: stream_import(io.BytesIO(d), user.id, COINBASE_BACKUP, compression='gzip')),
+            ('npz', npz_data, npz_export, lambda d: restore_columnar(io.BytesIO(d), user.id, 'coinbase')),
+        ):
+            clear()
+            result, restore_seconds = _timed(lambda: restore(data))
+            assert result.inserted == rows, f'{name} restored {result.inserted} of {rows} rows'
+            results.append((name, len(data), export_seconds, restore_seconds))
+
+    print(f'{rows} transactions')
+    print(f"{'format':<8} {'size':>12} {'vs csv':>7} {'export s':>9} {'restore s':>10}")
+    for name, size, export_seconds, restore_seconds in results:
+        print(f'{name:<8} {size:>12,} {results[0][1] / size:>6.1f}x {export_seconds:>9.2f} {restore_seconds:>10.2f}')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    run(parser.parse_args().rows)
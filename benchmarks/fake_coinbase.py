@@ -0,0 +1,193 @@
+# Local stand-in for the parts of the Coinbase v2 API the sync uses:
+#   GET /v2/accounts
+#   GET /v2/accounts/<id>/transactions   (limit, order, starting_after)
+# Every API key gets its own deterministic accounts and transactions, with
+# configurable latency, page size cap, still-pending newest transactions and
+# a per-key rate limit that answers 429 like the real API. Point the app at it with COINBASE_API_URL:
+#   python -m benchmarks.fake_coinbase --port 8765 --latency 0.05
+from datetime import datetime, timedelta
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+import argparse
+import random
+import threading
+import time
+
+CURRENCIES = ('BTC', 'ETH', 'SOL', 'USDC', 'ADA', 'DOGE', 'LTC', 'DOT')
+TYPES = ('buy', 'buy', 'buy', 'sell', 'send', 'receive')
+START = datetime(2018, 1, 1)
+
+
+class FakeCoinbase:
+    """Shared state of the fake API: generated data, settings and counters."""
+
+    def __init__(self, accounts=5, transactions=200, page_size=100, latency=0.0, jitter=0.0,
+                 rate_limit=0.0, seed=0, pending=0):
+        self.accounts = accounts
+        self.transactions = transactions
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        # Requests per second per API key; 0 disables the limit
+        self.rate_limit = rate_limit
+        self.seed = seed
+        # The newest ``pending`` transactions of every account have not settled yet
+        self.pending = pending
+        self._extra = 0
+        self._data = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+
+    def grow(self, count):
+        # Append ``count`` new transactions to every account, as if users kept trading
+        with self._lock:
+            self._extra += count
+            self._data.clear()
+
+    def settle(self):
+        # Complete every pending transaction, as Coinbase does once they clear
+        with self._lock:
+            self.pending = 0
+            self._data.clear()
+
+    def transaction_list(self, key, account_index):
+        cache_key = (key, account_index)
+        with self._lock:
+            cached = self._data.get(cache_key)
+            if cached is None:
+                rnd = random.Random(f'{self.seed}-{key}-{account_index}')
+                currency = CURRENCIES[account_index % len(CURRENCIES)]
+                items = []
+                total = self.transactions + self._extra
+                for j in range(total):
+                    tx_type = rnd.choice(TYPES)
+                    amount = round(rnd.uniform(0.001, 2), 8)
+                    items.append({
+                        'id': f'{key}-a{account_index}-t{j:07d}',
+                        'type': tx_type,
+                        'status': 'pending' if j >= total - self.pending else 'completed',
+                        'amount': {'amount': f"{'-' if tx_type in ('sell', 'send') else ''}{amount}",
+                                   'currency': currency},
+                        'created_at': (START + timedelta(hours=j)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                        'resource': 'transaction',
+                    })
+                cached = self._data[cache_key] = (items, {item['id']: i for i, item in enumerate(items)})
+        return cached
+
+    def account_list(self, key):
+        return [{'id': f'{key}-a{i}', 'name': f'{CURRENCIES[i % len(CURRENCIES)]} Wallet',
+                 'currency': CURRENCIES[i % len(CURRENCIES)], 'type': 'wallet', 'resource': 'account'}
+                for i in range(self.accounts)]
+
+    def allow(self, key):
+        # Token bucket per API key, refilled at ``rate_limit`` tokens per second
+        with self._lock:
+            self.requests += 1
+            if not self.rate_limit:
+                return True
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(key, (self.rate_limit, now))
+            tokens = min(self.rate_limit, tokens + (now - updated) * self.rate_limit)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                self.rate_limited += 1
+                return False
+            self._buckets[key] = (tokens - 1, now)
+            return True
+
+    def sleep(self):
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+    def page(self, items, index, path):
+        limit = min(request.args.get('limit', 25, type=int), self.page_size)
+        order = request.args.get('order', 'desc')
+        starting_after = request.args.get('starting_after')
+        if order == 'desc':
+            items = items[::-1]
+        start = 0
+        if starting_after:
+            if starting_after not in index:
+                return _error(400, 'invalid_request', f'starting_after {starting_after} not found')
+            position = index[starting_after]
+            start = len(items) - position if order == 'desc' else position + 1
+        data = items[start:start + limit]
+        next_id = data[-1]['id'] if data and start + limit < len(items) else None
+        return jsonify({
+            'pagination': {
+                'ending_before': None,
+                'starting_after': starting_after,
+                'limit': limit,
+                'order': order,
+                'previous_uri': None,
+                'next_uri': f'{path}?limit={limit}&order={order}&starting_after={next_id}' if next_id else None,
+                'next_starting_after': next_id,
+            },
+            'data': data,
+        })
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'rate_limited': self.rate_limited}
+
+
+def _error(status, error_id, message):
+    return jsonify({'errors': [{'id': error_id, 'message': message}]}), status
+
+
+def create_fake_coinbase(state):
+    app = Flask(__name__)
+
+    @app.before_request
+    def gate():
+        key = request.headers.get('CB-ACCESS-KEY')
+        if not key:
+            return _error(401, 'authentication_error', 'missing API key')
+        state.sleep()
+        if not state.allow(key):
+            return _error(429, 'rate_limit_exceeded', 'Too many requests')
+
+    @app.route('/v2/accounts')
+    def accounts():
+        items = state.account_list(request.headers['CB-ACCESS-KEY'])
+        return state.page(items, {item['id']: i for i, item in enumerate(items)}, request.path)
+
+    @app.route('/v2/accounts/<account_id>/transactions')
+    def transactions(account_id):
+        key = request.headers['CB-ACCESS-KEY']
+        prefix = f'{key}-a'
+        if not account_id.startswith(prefix) or not account_id[len(prefix):].isdigit():
+            return _error(404, 'not_found', 'Account not found')
+        account_index = int(account_id[len(prefix):])
+        if account_index >= state.accounts:
+            return _error(404, 'not_found', 'Account not found')
+        items, index = state.transaction_list(key, account_index)
+        return state.page(items, index, request.path)
+
+    return app
+
+
+def serve(state, host='127.0.0.1', port=0):
+    """Serve the fake API on a background thread; returns (server, base URL)."""
+    server = make_server(host, port, create_fake_coinbase(state), threaded=True)
+    threading.Thread(target=server.serve_forever, name='fake-coinbase', daemon=True).start()
+    return server, f'http://{host}:{server.server_port}/'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local fake Coinbase API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--transactions', type=int, default=200, help='Per account.')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response.')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='Requests per second per API key.')
+    args = parser.parse_args()
+    state = FakeCoinbase(args.accounts, args.transactions, args.page_size, args.latency, args.jitter,
+                         args.rate_limit)
+    make_server(args.host, args.port, create_fake_coinbase(state), threaded=True).serve_forever()
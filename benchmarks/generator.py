@@ -0,0 +1,141 @@
+# Seeded synthetic datasets in the real import formats: Coinbase statement
+# CSVs (with Convert rows) and Fidelity history CSVs. The same seed always
+# produces the same files, so benchmark runs are comparable.
+#   python -m benchmarks.generator --users 50 --transactions 1000000 --out data/
+from datetime import datetime, timedelta
+import argparse
+import csv
+import os
+import random
+
+# (asset, typical price); a Zipf-like weight makes the first few dominate
+CRYPTO_ASSETS = (
+    ('BTC', 40000), ('ETH', 2500), ('SOL', 100), ('USDC', 1), ('ADA', 0.5), ('DOGE', 0.1),
+    ('LTC', 80), ('DOT', 7), ('LINK', 15), ('XLM', 0.12), ('AVAX', 30), ('MATIC', 0.8),
+    ('ATOM', 9), ('UNI', 6), ('ALGO', 0.2), ('XTZ', 1), ('AAVE', 90), ('SHIB', 0.00001),
+)
+STOCKS = (
+    ('AAPL', 180), ('MSFT', 400), ('VTI', 240), ('VOO', 450), ('GOOGL', 140), ('AMZN', 170),
+    ('NVDA', 800), ('TSLA', 200), ('FXAIX', 180), ('SPAXX', 1), ('BND', 72), ('KO', 60),
+)
+COINBASE_TYPES = (('Buy', 50), ('Sell', 15), ('Send', 8), ('Receive', 12), ('Convert', 8),
+                  ('Rewards Income', 5), ('Staking Income', 2))
+FIDELITY_ACTIONS = (('YOU BOUGHT', 60), ('YOU SOLD', 20), ('REINVESTMENT', 15), ('DIVIDEND RECEIVED', 5))
+
+COINBASE_COLUMNS = ('ID', 'Timestamp', 'Transaction Type', 'Asset', 'Quantity Transacted',
+                    'Price at Transaction', 'Total (inclusive of fees)', 'Notes')
+FIDELITY_COLUMNS = ('Run Date', 'Action', 'Symbol', 'Quantity', 'Price')
+
+START = datetime(2016, 1, 1)
+SPAN = timedelta(days=365 * 9)
+
+
+def zipf_weights(count, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def user_sizes(users, transactions, rnd):
+    """Split ``transactions`` over ``users`` with a heavy tail (a few big accounts)."""
+    weights = [rnd.paretovariate(1.2) for _ in range(users)]
+    total = sum(weights)
+    sizes = [max(1, int(transactions * weight / total)) for weight in weights]
+    sizes[sizes.index(max(sizes))] += transactions - sum(sizes)
+    return sorted(sizes, reverse=True)
+
+
+def _timestamps(count, rnd):
+    # Sorted, with bursts: most users trade in clusters rather than uniformly
+    step = SPAN / max(count, 1)
+    current = START + timedelta(seconds=rnd.uniform(0, 86400))
+    for _ in range(count):
+        current += step * rnd.expovariate(1)
+        yield min(current, START + SPAN)
+
+
+def coinbase_statement_rows(user_index, count, rnd):
+    assets = [asset for asset, _ in CRYPTO_ASSETS]
+    prices = dict(CRYPTO_ASSETS)
+    asset_weights = zipf_weights(len(assets))
+    types = [name for name, _ in COINBASE_TYPES]
+    type_weights = [weight for _, weight in COINBASE_TYPES]
+    for i, timestamp in enumerate(_timestamps(count, rnd)):
+        asset = rnd.choices(assets, asset_weights)[0]
+        tx_type = rnd.choices(types, type_weights)[0]
+        price = prices[asset] * rnd.uniform(0.3, 1.8)
+        quantity = rnd.lognormvariate(0, 1.2) * 100 / prices[asset]
+        notes = ''
+        if tx_type == 'Convert':
+            target = rnd.choices(assets, asset_weights)[0]
+            target_quantity = quantity * price / (prices[target] * rnd.uniform(0.3, 1.8))
+            notes = f'Converted {quantity:.8f} {asset} to {target_quantity:.8f} {target}'
+        yield (
+            f'cb-{user_index}-{i:08d}',
+            timestamp.strftime('%Y-%m-%d %H:%M:%S UTC'),
+            tx_type,
+            asset,
+            f'{quantity:.8f}',
+            f'${price:,.2f}',
+            f'${quantity * price:,.2f}',
+            notes,
+        )
+
+
+def fidelity_history_rows(count, rnd):
+    symbols = [symbol for symbol, _ in STOCKS]
+    prices = dict(STOCKS)
+    symbol_weights = zipf_weights(len(symbols))
+    actions = [name for name, _ in FIDELITY_ACTIONS]
+    action_weights = [weight for _, weight in FIDELITY_ACTIONS]
+    for timestamp in _timestamps(count, rnd):
+        symbol = rnd.choices(symbols, symbol_weights)[0]
+        action = rnd.choices(actions, action_weights)[0]
+        yield (
+            timestamp.strftime('%m/%d/%Y'),
+            action,
+            symbol,
+            round(rnd.lognormvariate(1, 1), 3),
+            round(prices[symbol] * rnd.uniform(0.5, 1.5), 2),
+        )
+
+
+def write_csv(path, columns, rows):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    return path
+
+
+def generate(out_dir, users=10, transactions=100000, fidelity_share=0.2, seed=0):
+    """Write one Coinbase statement and one Fidelity history CSV per user.
+
+    Returns a list of ``{'user': n, 'coinbase': path, 'fidelity': path,
+    'coinbase_rows': n, 'fidelity_rows': n}`` dicts, biggest user first.
+    """
+    rnd = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    datasets = []
+    for user_index, size in enumerate(user_sizes(users, transactions, rnd)):
+        fidelity_rows = int(size * fidelity_share)
+        coinbase_rows = size - fidelity_rows
+        datasets.append({
+            'user': user_index,
+            'coinbase': write_csv(os.path.join(out_dir, f'user{user_index}_coinbase.csv'), COINBASE_COLUMNS,
+                                  coinbase_statement_rows(user_index, coinbase_rows, rnd)),
+            'fidelity': write_csv(os.path.join(out_dir, f'user{user_index}_fidelity.csv'), FIDELITY_COLUMNS,
+                                  fidelity_history_rows(fidelity_rows, rnd)),
+            'coinbase_rows': coinbase_rows,
+            'fidelity_rows': fidelity_rows,
+        })
+    return datasets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write seeded Coinbase and Fidelity import CSVs.')
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--transactions', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for dataset in generate(args.out, args.users, args.transactions, seed=args.seed):
+        print(f"user {dataset['user']}: {dataset['coinbase_rows']} Coinbase, {dataset['fidelity_rows']} Fidelity rows")
@@ -0,0 +1,285 @@
+# End-to-end benchmark of the hot paths against a seeded dataset:
+#   python -m benchmarks.suite --users 20 --transactions 200000 --out results.json
+#   python -m benchmarks.suite ... --baseline results.json   # compare, exit 1 on regressions
+#
+# Every scenario goes through the real routes with the test client (imports run
+# inline), so the numbers include routing, templates and the query layer.
+from datetime import datetime, timezone
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import generate
+
+PASSWORD = 'benchmark'
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _summary(timings):
+    ordered = sorted(timings)
+    return {
+        'runs': len(ordered),
+        'median_s': statistics.median(ordered),
+        'min_s': ordered[0],
+        'max_s': ordered[-1],
+    }
+
+
+class Bench:
+    def __init__(self, workdir, datasets):
+        from app import create_app
+        self.workdir = workdir
+        self.datasets = datasets
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            'JOB_WORKERS': 0,
+            'LOG_FILE': os.path.join(workdir, 'bench.log'),
+        })
+        self.clients = []
+
+    def client(self, user_index):
+        return self.clients[user_index]
+
+    def _check(self, response, expected=(200,)):
+        if response.status_code not in expected:
+            raise RuntimeError(f'{response.request.path} returned {response.status_code}')
+        return response
+
+    def upload(self, client, url, field, data, filename):
+        return self._check(client.post(url, data={field: (io.BytesIO(data), filename)},
+                                       content_type='multipart/form-data'), (200, 302))
+
+    def seed(self):
+        """Register every user and import their generated CSVs through the import routes."""
+        timings = {}
+        for dataset in self.datasets:
+            client = self.app.test_client()
+            name = f"bench{dataset['user']}"
+            client.post('/auth/register', data={'username': name, 'email': f'{name}@example.com', 'password': PASSWORD})
+            self._check(client.post('/auth/login', data={'username': name, 'password': PASSWORD}), (200, 302))
+            self.clients.append(client)
+            for source, url in (('coinbase', '/coinbase/import_transactions'),
+                                ('fidelity', '/fidelity/import_transactions')):
+                with open(dataset[source], 'rb') as file:
+                    data = file.read()
+                started = time.perf_counter()
+                self.upload(client, url, 'csv_file', data, os.path.basename(dataset[source]))
+                timings.setdefault(source, []).append(time.perf_counter() - started)
+        return timings
+
+    def stored_rows(self):
+        from database.models import Transaction
+        with self.app.app_context():
+            return Transaction.query.count()
+
+    def heaviest_user_id(self):
+        from database.models import User
+        with self.app.app_context():
+            return User.query.filter_by(username='bench0').one().id
+
+    def scenarios(self):
+        # name -> (callable, setup) ; setup runs untimed before each repetition
+        from app.charts import RESOLUTIONS, chart_data
+        from app.pagination import encode_token
+        from database.models import Transaction
+
+        client = self.client(0)
+        user_id = self.heaviest_user_id()
+        deep = {}
+        with self.app.app_context():
+            total = Transaction.query.filter_by(user_id=user_id, source='coinbase').count()
+            row = (Transaction.query.filter_by(user_id=user_id, source='coinbase')
+                   .order_by(Transaction.timestamp.desc(), Transaction.id.desc())
+                   .offset(int(total * 0.9)).first())
+            if row is not None:
+                deep['coinbase'] = encode_token(row)
+
+        def get(url):
+            return lambda: self._check(client.get(url))
+
+        def chart(resolution):
+            def build():
+                with self.app.app_context():
+                    chart_data(user_id, 'coinbase', None, resolution)
+            return build
+
+        def export(url, **form):
+            return lambda: self._check(client.post(url, data=form)).get_data()
+
+        backups = {}
+
+        def take_backup(name, url, **form):
+            backups[name] = self._check(client.post(url, data=form)).get_data()
+
+        def restore(name, url, filename):
+            return lambda: self.upload(client, url, 'backup_file', backups[name], filename)
+
+        def clear(url):
+            return lambda: self._check(client.post(url), (200, 302))
+
+        with open(self.datasets[0]['coinbase'], 'rb') as file:
+            coinbase_csv = file.read()
+        with open(self.datasets[0]['fidelity'], 'rb') as file:
+            fidelity_csv = file.read()
+
+        scenarios = {
+            'dashboard': (get('/'), None),
+            'coinbase.transactions first page': (get('/coinbase/transactions'), None),
+            'coinbase.transactions first page (BTC)': (get('/coinbase/transactions?currency=BTC'), None),
+            'fidelity.transactions first page': (get('/fidelity/transactions'), None),
+        }
+        if 'coinbase' in deep:
+            scenarios['coinbase.transactions deep page (90%)'] = (
+                get(f"/coinbase/transactions?after={deep['coinbase']}"), None)
+        for resolution in RESOLUTIONS:
+            scenarios[f'chart {resolution}'] = (chart(resolution), None)
+        scenarios.update({
+            'api holdings': (get('/api/coinbase/holdings'), None),
+            'api transactions first page': (get('/api/coinbase/transactions?per_page=100'), None),
+            'api transactions (2 fields)': (get('/api/coinbase/transactions?per_page=100&fields=timestamp,amount'),
+                                            None),
+            'api charts all currencies': (get('/api/coinbase/charts'), None),
+        })
+        scenarios.update({
+            'export coinbase csv': (export('/export_transactions', format='csv'), None),
+            'export coinbase csv.gz': (export('/export_transactions', format='csv', compress='1'), None),
+            'export coinbase npz': (export('/export_transactions', format='npz'), None),
+            'export fidelity csv': (export('/export_fidelity_transactions', format='csv'), None),
+        })
+        take_backup('coinbase csv', '/export_transactions', format='csv')
+        take_backup('coinbase csv.gz', '/export_transactions', format='csv', compress='1')
+        take_backup('coinbase npz', '/export_transactions', format='npz')
+        take_backup('fidelity csv', '/export_fidelity_transactions', format='csv')
+
+        clear_coinbase = clear('/clear_transactions')
+        clear_fidelity = clear('/clear_fidelity_transactions')
+        scenarios.update({
+            'clear coinbase': (clear_coinbase, lambda: self.upload(client, '/import_transactions', 'backup_file',
+                                                                   backups['coinbase npz'], 'b.npz')),
+            'clear fidelity': (clear_fidelity, lambda: self.upload(client, '/import_fidelity_transactions',
+                                                                   'backup_file', backups['fidelity csv'], 'b.csv')),
+            'import coinbase statement': (
+                lambda: self.upload(client, '/coinbase/import_transactions', 'csv_file', coinbase_csv, 's.csv'),
+                clear_coinbase),
+            'import fidelity history': (
+                lambda: self.upload(client, '/fidelity/import_transactions', 'csv_file', fidelity_csv, 'h.csv'),
+                clear_fidelity),
+            'restore coinbase csv': (restore('coinbase csv', '/import_transactions', 'b.csv'), clear_coinbase),
+            'restore coinbase csv.gz': (restore('coinbase csv.gz', '/import_transactions', 'b.csv.gz'),
+                                        clear_coinbase),
+            'restore coinbase npz': (restore('coinbase npz', '/import_transactions', 'b.npz'), clear_coinbase),
+            'restore fidelity csv': (restore('fidelity csv', '/import_fidelity_transactions', 'b.csv'),
+                                     clear_fidelity),
+        })
+        return scenarios
+
+    def run(self, repeat, selected=None):
+        results = {}
+        for name, (func, setup) in self.scenarios().items():
+            if selected and not any(pattern in name for pattern in selected):
+                continue
+            timings = []
+            # Read scenarios get one untimed warm-up run; write scenarios start from their setup
+            if setup is None:
+                func()
+            for _ in range(repeat):
+                if setup is not None:
+                    setup()
+                started = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - started)
+            results[name] = _summary(timings)
+            print(f"{name:<45} {results[name]['median_s'] * 1000:>10.1f} ms", file=sys.stderr)
+        return results
+
+
+def compare(results, baseline, threshold):
+    """Print median ratios against a baseline run; return the regressed scenarios."""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            print(f'{name:<45} {"new":>10}')
+            continue
+        ratio = current['median_s'] / before['median_s'] if before['median_s'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        print(f"{name:<45} {before['median_s'] * 1000:>9.1f} -> {current['median_s'] * 1000:>9.1f} ms "
+              f"({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark dashboard, pagination, charts, imports, exports.')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--transactions', type=int, default=100000, help='Total rows over all users.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', action='append', help='Run scenarios whose name contains this text.')
+    parser.add_argument('--out', help='Write results as JSON to this file.')
+    parser.add_argument('--baseline', help='Compare against a previous JSON result.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Median slowdown ratio that counts as a regression.')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    started = time.perf_counter()
+    datasets = generate(os.path.join(workdir, 'data'), args.users, args.transactions, seed=args.seed)
+    generate_seconds = time.perf_counter() - started
+    bench = Bench(workdir, datasets)
+    seed_timings = bench.seed()
+
+    results = {
+        'meta': {
+            'revision': _git_revision(),
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'users': args.users,
+            'transactions': args.transactions,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'heaviest_user_rows': datasets[0]['coinbase_rows'] + datasets[0]['fidelity_rows'],
+        },
+        'setup': {
+            'generate_s': generate_seconds,
+            'seed_coinbase_s': sum(seed_timings['coinbase']),
+            'seed_fidelity_s': sum(seed_timings['fidelity']),
+            'stored_rows': bench.stored_rows(),
+        },
+        'scenarios': bench.run(args.repeat, args.only),
+    }
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline['meta'].get('transactions') != args.transactions or baseline['meta'].get('seed') != args.seed:
+            print('warning: baseline was run on a different dataset', file=sys.stderr)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# Load test of the Coinbase sync against the local fake API: many users sync
+# at once through the job runner, then sync again incrementally.
+#   python -m benchmarks.sync_load --users 50 --accounts 5 --transactions 500 --latency 0.05
+#
+# The fake API runs in this process unless --url points at one started with
+# python -m benchmarks.fake_coinbase, which keeps its CPU off the app's GIL.
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+from benchmarks.fake_coinbase import FakeCoinbase, serve
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def create_users(app, count):
+    from database.models import db, User
+    with app.app_context():
+        users = []
+        for i in range(count):
+            user = User(username=f'load{i}', email=f'load{i}@example.com', password='-')
+            # The API key doubles as the fake API's tenant, so every user gets distinct data
+            user.set_coinbase_api_key(f'loadkey{i}')
+            user.set_coinbase_api_secret('secret')
+            db.session.add(user)
+            users.append(user)
+        db.session.commit()
+        return [user.id for user in users]
+
+
+def run_round(app, user_ids, full=False, timeout=3600):
+    """Submit one sync job per user and wait for all of them; returns per-round stats."""
+    from app.coinbase_sync import sync_transactions
+    from database.engine import write_queue
+    from database.models import db, Job
+
+    write_queue.reset_stats()
+    started = time.perf_counter()
+    with app.app_context():
+        runner = app.extensions['jobs']
+        job_ids = [runner.submit(user_id, 'coinbase_sync', sync_transactions, user_id, full).id
+                   for user_id in user_ids]
+        while True:
+            db.session.expire_all()
+            pending = Job.query.filter(Job.id.in_(job_ids), Job.finished_at.is_(None)).count()
+            if not pending:
+                break
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError(f'{pending} sync jobs still running after {timeout}s')
+            time.sleep(0.05)
+        wall = time.perf_counter() - started
+        jobs = Job.query.filter(Job.id.in_(job_ids)).all()
+
+    sync_seconds = [(job.finished_at - job.started_at).total_seconds() for job in jobs if job.started_at]
+    queued_seconds = [(job.started_at - job.created_at).total_seconds() for job in jobs if job.started_at]
+    inserted = sum(job.inserted or 0 for job in jobs)
+    fetched = sum(job.rows_parsed or 0 for job in jobs)
+    return {
+        'users': len(jobs),
+        'wall_s': wall,
+        'fetched': fetched,
+        'inserted': inserted,
+        'throughput_tx_per_s': fetched / wall if wall else None,
+        'sync_p50_s': percentile(sync_seconds, 0.5),
+        'sync_p99_s': percentile(sync_seconds, 0.99),
+        'sync_max_s': max(sync_seconds, default=None),
+        'queued_p50_s': percentile(queued_seconds, 0.5),
+        'failed_jobs': sum(job.status != 'succeeded' for job in jobs),
+        'jobs_with_account_errors': sum('accounts failed' in (job.message or '') for job in jobs),
+        'write_queue': write_queue.stats(),
+        'errors': sorted({job.message for job in jobs if job.status != 'succeeded'})[:5],
+    }
+
+
+def print_round(name, result, api):
+    queue = result['write_queue']
+    print(f"== {name}: {result['users']} users in {result['wall_s']:.2f}s")
+    print(f"   fetched {result['fetched']}, inserted {result['inserted']} "
+          f"({result['throughput_tx_per_s']:.0f} tx/s)")
+    print(f"   sync p50 {result['sync_p50_s']:.3f}s  p99 {result['sync_p99_s']:.3f}s  "
+          f"max {result['sync_max_s']:.3f}s  queued p50 {result['queued_p50_s']:.3f}s")
+    print(f"   writer: {queue['holds']} holds, {queue['contended']} contended, "
+          f"waited {queue['total_wait_s']:.2f}s total, {queue['max_wait_s']:.3f}s max")
+    if api:
+        print(f"   api: {api['requests']} requests, {api['rate_limited']} rate limited")
+    if result['failed_jobs'] or result['jobs_with_account_errors']:
+        print(f"   {result['failed_jobs']} failed jobs, {result['jobs_with_account_errors']} with account errors: "
+              f"{result['errors']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test concurrent Coinbase syncs against a fake API.')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--transactions', type=int, default=200, help='Per account.')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds added to every API response.')
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='API requests per second per user.')
+    parser.add_argument('--workers', type=int, default=8, help='JOB_WORKERS: users syncing at once.')
+    parser.add_argument('--concurrency', type=int, default=4, help='COINBASE_SYNC_CONCURRENCY per user.')
+    parser.add_argument('--grow', type=int, default=10, help='New transactions per account before the second round.')
+    parser.add_argument('--url', help='Use an already running fake API instead of an in-process one.')
+    parser.add_argument('--out', help='Write results as JSON to this file.')
+    args = parser.parse_args(argv)
+
+    from app import create_app
+
+    # The fake API is plain http on localhost
+    warnings.filterwarnings('ignore', message='WARNING: this client is sending a request to an insecure',
+                            category=UserWarning)
+    state = None
+    server = None
+    url = args.url
+    if url is None:
+        state = FakeCoinbase(args.accounts, args.transactions, args.page_size, args.latency, args.jitter,
+                             args.rate_limit)
+        server, url = serve(state)
+
+    workdir = tempfile.mkdtemp(prefix='sync_load_')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        'LOG_FILE': os.path.join(workdir, 'load.log'),
+        'JOB_WORKERS': args.workers,
+        'COINBASE_API_URL': url,
+        'COINBASE_SYNC_CONCURRENCY': args.concurrency,
+        'COINBASE_PAGE_LIMIT': args.page_size,
+        'COINBASE_CLIENT_POOL_SIZE': args.workers * args.concurrency,
+    })
+    user_ids = create_users(app, args.users)
+
+    results = {'settings': vars(args), 'rounds': {}}
+    try:
+        for name, before in (('full sync', None), ('incremental sync', args.grow)):
+            if before and state is not None:
+                state.grow(before)
+            api_before = state.stats() if state else None
+            result = run_round(app, user_ids)
+            api = None
+            if state is not None:
+                api = {key: value - api_before[key] for key, value in state.stats().items()}
+                result['api'] = api
+            results['rounds'][name] = result
+            print_round(name, result, api)
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent=2, default=str)
+    failed = sum(result['failed_jobs'] for result in results['rounds'].values())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,5 +4,17 @@
 # Fernet encryption key for Coinbase API credentials
 ENCRYPTION_KEY = 'NE7PJQDZ98iKP2n-69mjgccj6DkOZmv_j3xq84WcvhM='  # Replace with a secure Fernet key
 
+# Previous Fernet keys, still accepted for decryption while credentials are
+# re-encrypted with ENCRYPTION_KEY (flask --app run rotate-credentials)
+OLD_ENCRYPTION_KEYS = []
+
+# Database URI; relative sqlite paths live in the instance folder
+SQLALCHEMY_DATABASE_URI = 'sqlite:///crypto.db'
+
+# Logging: rotating log file (empty to leave logging unconfigured); the level
+# defaults to DEBUG in debug mode and INFO otherwise
+# LOG_FILE = 'log.txt'
+# LOG_LEVEL = 'INFO'
+
 # Flask secret key for session security
 SECRET_KEY = 'your_secret_key'  # Replace with a secure random key
\ No newline at end of file
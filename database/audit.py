@@ -0,0 +1,197 @@
+# Opt-in query auditor for development and CI (QUERY_AUDIT = True).
+#
+# Every request and job gets an audit that counts its statements by shape
+# (the SQL with literals and IN/VALUES lists collapsed). A shape repeated
+# more than QUERY_AUDIT_MAX_REPEATS times is the signature of a per-row
+# query loop and is logged, or raised with QUERY_AUDIT_RAISE. Statements
+# slower than QUERY_AUDIT_SLOW_MS are logged with their query plan.
+#
+# Tests can bound the queries of a route:
+#     with assert_max_queries(6):
+#         client.get('/coinbase/transactions')
+from collections import Counter
+from contextlib import contextmanager
+from flask import current_app, g, request
+from sqlalchemy import event
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+_PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_SHAPE_RULES = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(rf'\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)'), '(?)'),
+    (re.compile(r'\(\?\)(?:\s*,\s*\(\?\))+'), '(?)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def statement_shape(statement):
+    for pattern, replacement in _SHAPE_RULES:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+class QueryAudit:
+    def __init__(self, label, max_repeats=None, slow_seconds=None, raise_errors=False):
+        self.label = label
+        self.max_repeats = max_repeats
+        self.slow_seconds = slow_seconds
+        self.raise_errors = raise_errors
+        self.shapes = Counter()
+        self.count = 0
+        self.seconds = 0.0
+        self.slow = []
+
+    def record(self, statement, elapsed, plan):
+        shape = statement_shape(statement)
+        self.shapes[shape] += 1
+        self.count += 1
+        self.seconds += elapsed
+        if plan is not None:
+            self.slow.append((elapsed, statement, plan))
+            logger.warning(f"{self.label}: slow statement ({elapsed * 1000:.0f} ms): {statement}\n"
+                           f"plan: {'; '.join(plan) if plan else 'unavailable'}")
+        if self.max_repeats is not None and self.shapes[shape] == self.max_repeats + 1:
+            message = f"{self.label}: statement repeated more than {self.max_repeats} times: {shape}"
+            if self.raise_errors:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    def repeated(self):
+        return [(shape, count) for shape, count in self.shapes.most_common()
+                if self.max_repeats is not None and count > self.max_repeats]
+
+    def report(self):
+        lines = [f"{self.label}: {self.count} statements in {self.seconds * 1000:.1f} ms"]
+        lines.extend(f"  {count} x {shape}" for shape, count in self.shapes.most_common())
+        return '\n'.join(lines)
+
+
+def _active():
+    if not hasattr(_local, 'audits'):
+        _local.audits = []
+    return _local.audits
+
+
+def _explain(connection, statement, parameters):
+    # Straight on the DBAPI connection, so the plan query is not audited itself
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.dialect.name == 'sqlite' else 'EXPLAIN '
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [str(row[-1]) for row in cursor.fetchall()]
+    except Exception as e:
+        logger.debug(f"Could not explain slow statement: {e}")
+        return []
+    finally:
+        cursor.close()
+
+
+def install_auditor(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _active():
+            conn.info['audit_started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('audit_started', None)
+        audits = _active()
+        if started is None or not audits:
+            return
+        elapsed = time.perf_counter() - started
+        plan = None
+        if any(audit.slow_seconds is not None and elapsed > audit.slow_seconds for audit in audits):
+            plan = [] if executemany else _explain(conn, statement, parameters)
+        for audit in list(audits):
+            slow = audit.slow_seconds is not None and elapsed > audit.slow_seconds
+            audit.record(statement, elapsed, plan if slow else None)
+
+
+def new_audit(label, max_repeats=None, slow_ms=None, raise_errors=None):
+    # Thresholds default to the QUERY_AUDIT_* settings of the current app
+    config = current_app.config
+    max_repeats = config['QUERY_AUDIT_MAX_REPEATS'] if max_repeats is None else max_repeats
+    slow_ms = config['QUERY_AUDIT_SLOW_MS'] if slow_ms is None else slow_ms
+    raise_errors = config['QUERY_AUDIT_RAISE'] if raise_errors is None else raise_errors
+    return QueryAudit(label, max_repeats, slow_ms / 1000 if slow_ms is not None else None, raise_errors)
+
+
+@contextmanager
+def audit_queries(label, **thresholds):
+    """Audit the statements run by this thread inside the block.
+
+    Audits nest; every open audit sees each statement.
+    """
+    audit = new_audit(label, **thresholds)
+    _active().append(audit)
+    try:
+        yield audit
+    finally:
+        _active().remove(audit)
+
+
+@contextmanager
+def assert_max_queries(limit, label='assert_max_queries'):
+    if not current_app.extensions.get('query_audit'):
+        raise RuntimeError('assert_max_queries needs QUERY_AUDIT = True')
+    with audit_queries(label) as audit:
+        yield audit
+    if audit.count > limit:
+        raise AssertionError(f"expected at most {limit} statements, got {audit.count}\n{audit.report()}")
+
+
+@contextmanager
+def audit_job(label):
+    if not current_app.extensions.get('query_audit'):
+        yield None
+        return
+    # A job run inline (JOB_WORKERS = 0) is audited on its own, not as part of the request
+    outer = _active()
+    _local.audits = []
+    try:
+        with audit_queries(label, max_repeats=current_app.config['QUERY_AUDIT_JOB_MAX_REPEATS']) as audit:
+            yield audit
+    finally:
+        _local.audits = outer
+    logger.debug(audit.report())
+
+
+def _start_request_audit():
+    g.query_audit = new_audit(f'{request.method} {request.path}')
+    _active().append(g.query_audit)
+
+
+def _end_request_audit(exc):
+    # Runs after streamed bodies finish, so their statements are included
+    audit = g.pop('query_audit', None)
+    if audit is not None:
+        _active().remove(audit)
+        logger.debug(audit.report())
+
+
+def init_app(app, db):
+    app.config.setdefault('QUERY_AUDIT', False)
+    app.config.setdefault('QUERY_AUDIT_MAX_REPEATS', 20)
+    # Jobs legitimately repeat their batch statements, so only flag real row loops
+    app.config.setdefault('QUERY_AUDIT_JOB_MAX_REPEATS', 1000)
+    app.config.setdefault('QUERY_AUDIT_SLOW_MS', 200)
+    app.config.setdefault('QUERY_AUDIT_RAISE', False)
+    app.extensions['query_audit'] = app.config['QUERY_AUDIT']
+    if not app.config['QUERY_AUDIT']:
+        return
+    with app.app_context():
+        install_auditor(db.engine)
+    app.before_request(_start_request_audit)
+    app.teardown_request(_end_request_audit)
@@ -0,0 +1,56 @@
+# Re-encrypt stored Coinbase credentials after rotating ENCRYPTION_KEY:
+#   1. set ENCRYPTION_KEY to the new key and move the old one to OLD_ENCRYPTION_KEYS
+#   2. flask --app run rotate-credentials
+#   3. drop the old key from OLD_ENCRYPTION_KEYS once every process has restarted
+from database.models import db, credential_cipher, User
+from sqlalchemy import bindparam, select
+import click
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def rotate_credentials(batch_size=DEFAULT_BATCH_SIZE):
+    """Re-encrypt every user's Coinbase credentials with the primary key.
+
+    Works through the user table in id order, one UPDATE and commit per
+    batch, without loading full User objects. Returns the number of users
+    rewritten.
+    """
+    cipher = credential_cipher()
+    users = User.__table__
+    rotated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(users.c.id, users.c.coinbase_api_key, users.c.coinbase_api_secret)
+            .where(users.c.id > last_id)
+            .where(users.c.coinbase_api_key.is_not(None) | users.c.coinbase_api_secret.is_not(None))
+            .order_by(users.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return rotated
+        updates = [
+            {
+                'user_id': row.id,
+                'api_key': cipher.rotate(row.coinbase_api_key.encode()).decode() if row.coinbase_api_key else None,
+                'api_secret': cipher.rotate(row.coinbase_api_secret.encode()).decode() if row.coinbase_api_secret else None,
+            }
+            for row in rows
+        ]
+        db.session.execute(
+            users.update().where(users.c.id == bindparam('user_id')).values(
+                coinbase_api_key=bindparam('api_key'), coinbase_api_secret=bindparam('api_secret')),
+            updates,
+        )
+        db.session.commit()
+        rotated += len(updates)
+        last_id = rows[-1].id
+
+
+@click.command('rotate-credentials')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True)
+def rotate_credentials_command(batch_size):
+    """Re-encrypt stored Coinbase credentials with the current ENCRYPTION_KEY."""
+    rotated = rotate_credentials(batch_size)
+    click.echo(f'Re-encrypted Coinbase credentials of {rotated} users')
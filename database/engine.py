@@ -0,0 +1,123 @@
+# Database engine tuning and write serialization.
+#
+# SQLite connections get their pragmas on connect (WAL so readers never wait
+# for a writer, a busy timeout instead of immediate "database is locked", and
+# larger page/mmap caches). SQLite still allows one writer at a time, so bulk
+# writers in this process queue up on a FIFO lock instead of racing for it.
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Dialects with a native INSERT ... ON CONFLICT; others write row by row
+UPSERT_DIALECTS = {
+    'sqlite': sqlite_insert,
+    'postgresql': postgresql_insert,
+}
+
+
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 30000,        # ms
+    'cache_size': -64000,         # negative = KiB, i.e. 64 MB
+    'mmap_size': 268435456,       # 256 MB
+    'temp_store': 'MEMORY',
+}
+
+
+def configure_sqlite(engine, pragmas):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+class WriteQueue:
+    """Reentrant FIFO lock that lets one thread write at a time.
+
+    Waiters are served in arrival order, so a long import cannot starve a
+    sync queued behind it. Reentrant for the owning thread, so helpers that
+    serialize their own writes can be called from inside a held section.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+        self._owner = None
+        self._depth = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._condition:
+            self._holds = 0
+            self._contended = 0
+            self._total_wait = 0.0
+            self._max_wait = 0.0
+
+    def stats(self):
+        # Outermost holds only; contended ones found another writer holding the queue
+        with self._condition:
+            return {
+                'holds': self._holds,
+                'contended': self._contended,
+                'total_wait_s': self._total_wait,
+                'max_wait_s': self._max_wait,
+            }
+
+    @contextmanager
+    def hold(self, label='write'):
+        me = threading.get_ident()
+        with self._condition:
+            if self._owner == me:
+                self._depth += 1
+            else:
+                ticket = self._next_ticket
+                self._next_ticket += 1
+                started = time.perf_counter()
+                self._contended += self._serving != ticket
+                while self._serving != ticket:
+                    self._condition.wait()
+                self._owner, self._depth = me, 1
+                waited = time.perf_counter() - started
+                self._holds += 1
+                self._total_wait += waited
+                self._max_wait = max(self._max_wait, waited)
+                if waited > 1:
+                    logger.info(f"{label} waited {waited:.1f}s for the database writer")
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._owner = None
+                    self._serving += 1
+                    self._condition.notify_all()
+
+
+write_queue = WriteQueue()
+
+
+def serialized_write(label='write'):
+    # Hold around a write and its commit: with serialized_write('import'): ...; db.session.commit()
+    return write_queue.hold(label)
+
+
+def init_app(app, db):
+    app.config.setdefault('SQLITE_PRAGMAS', DEFAULT_SQLITE_PRAGMAS)
+    with app.app_context():
+        configure_sqlite(db.engine, app.config['SQLITE_PRAGMAS'])
@@ -0,0 +1,85 @@
+# EXPLAIN QUERY PLAN checks for the hot route queries, run before and after
+# the migration indexes:  flask --app run explain-queries
+from database.models import db, Transaction
+from database.migrations import TRANSACTION_INDEXES
+from datetime import datetime
+from sqlalchemy import create_engine, select, text, tuple_
+import click
+
+
+def route_queries(user_id=1, currency='BTC'):
+    tx = Transaction.__table__.c
+    return {
+        'transactions page': (
+            select(Transaction.__table__)
+            .where(tx.user_id == user_id, tx.source == 'coinbase')
+            .order_by(tx.timestamp.desc(), tx.id.desc())
+            .limit(11)
+        ),
+        'transactions page (keyset, currency filter)': (
+            select(Transaction.__table__)
+            .where(tx.user_id == user_id, tx.source == 'coinbase', tx.currency == currency,
+                   tuple_(tx.timestamp, tx.id) < tuple_(datetime(2024, 1, 1), 1000))
+            .order_by(tx.timestamp.desc(), tx.id.desc())
+            .limit(11)
+        ),
+    }
+
+
+def query_plan(connection, statement):
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    return [row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+
+def is_full_scan(plan):
+    return any(line.startswith('SCAN') and 'transaction' in line and 'USING' not in line
+               for line in plan)
+
+
+def baseline_engine(with_indexes):
+    # In-memory copy of the schema, optionally without the migration indexes
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    if not with_indexes:
+        with engine.begin() as connection:
+            for name in TRANSACTION_INDEXES:
+                connection.execute(text(f'DROP INDEX {name}'))
+    return engine
+
+
+def compare_plans(live_connection=None):
+    results = {}
+    before = baseline_engine(with_indexes=False)
+    after = baseline_engine(with_indexes=True)
+    with before.connect() as before_connection, after.connect() as after_connection:
+        for name, statement in route_queries().items():
+            results[name] = {
+                'before': query_plan(before_connection, statement),
+                'after': query_plan(after_connection, statement),
+            }
+            if live_connection is not None:
+                results[name]['live'] = query_plan(live_connection, statement)
+    return results
+
+
+@click.command('explain-queries')
+@click.option('--live/--no-live', default=True, help='Also explain against the configured database.')
+def explain_queries_command(live):
+    """Print query plans of the route queries with and without the indexes."""
+    connection = db.engine.connect() if live else None
+    try:
+        results = compare_plans(connection)
+    finally:
+        if connection is not None:
+            connection.close()
+
+    regressions = 0
+    for name, plans in results.items():
+        click.echo(f'== {name}')
+        for label, plan in plans.items():
+            marker = 'FULL SCAN' if is_full_scan(plan) else 'indexed'
+            click.echo(f'  {label:<6} [{marker}] ' + ' | '.join(plan))
+        if is_full_scan(plans['after']):
+            regressions += 1
+    if regressions:
+        raise click.ClickException(f'{regressions} route queries still scan the transaction table')
@@ -0,0 +1,110 @@
+# Versioned schema changes for databases created before a model change.
+# db.create_all() only creates missing tables, so anything that alters an
+# existing table (indexes, columns, backfills) is added here as a new
+# version and applied once at startup.
+from database.models import db, DailyHolding, Holding, PricePoint, SchemaMigration, Transaction, SETTLED_STATUS
+from sqlalchemy import case, func, select
+from sqlalchemy.exc import IntegrityError
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_INDEXES = (
+    'ix_transaction_user_source_currency_timestamp',
+    'ix_transaction_user_source_timestamp',
+)
+
+
+def _table_index(table, name):
+    return next(index for index in table.indexes if index.name == name)
+
+
+def add_transaction_indexes(connection):
+    for name in TRANSACTION_INDEXES:
+        _table_index(Transaction.__table__, name).create(connection, checkfirst=True)
+
+
+def holding_totals(user_id=None):
+    # Settled amount, transaction count and settled count per (user, source, currency)
+    tx = Transaction.__table__.c
+    settled = tx.status == SETTLED_STATUS
+    totals = (
+        select(tx.user_id, tx.source, tx.currency, func.coalesce(func.sum(case((settled, tx.amount), else_=0.0)), 0.0),
+               func.count(tx.id), func.count(case((settled, tx.id))))
+        .group_by(tx.user_id, tx.source, tx.currency)
+    )
+    if user_id is not None:
+        totals = totals.where(tx.user_id == user_id)
+    return totals
+
+
+def backfill_holdings(connection):
+    connection.execute(Holding.__table__.delete())
+    connection.execute(Holding.__table__.insert().from_select(
+        ['user_id', 'source', 'currency', 'amount', 'tx_count', 'settled_count'], holding_totals()))
+
+
+def daily_holding_totals(user_id=None):
+    # Net change and end-of-day balance per (user, source, currency, day) of settled transactions
+    tx = Transaction.__table__.c
+    day = func.date(tx.timestamp)
+    series = (tx.user_id, tx.source, tx.currency)
+    totals = select(
+        *series, day, func.sum(tx.amount),
+        func.sum(func.sum(tx.amount)).over(partition_by=series, order_by=day),
+        func.count(tx.id),
+    ).where(tx.status == SETTLED_STATUS).group_by(*series, day)
+    if user_id is not None:
+        totals = totals.where(tx.user_id == user_id)
+    return totals
+
+
+def backfill_daily_holdings(connection):
+    connection.execute(DailyHolding.__table__.delete())
+    connection.execute(DailyHolding.__table__.insert().from_select(
+        ['user_id', 'source', 'currency', 'day', 'net', 'balance', 'tx_count'], daily_holding_totals()))
+
+
+def backfill_prices(connection):
+    # Latest transaction price per user, source, currency and day
+    tx = Transaction.__table__.c
+    day = func.date(tx.timestamp)
+    ranked = select(
+        tx.user_id, tx.source, tx.currency, day.label('day'), tx.price_at_transaction, tx.timestamp,
+        func.row_number().over(partition_by=(tx.user_id, tx.source, tx.currency, day),
+                               order_by=(tx.timestamp.desc(), tx.id.desc()))
+        .label('rank'),
+    ).where(tx.price_at_transaction > 0).subquery()
+    latest = select(ranked.c.user_id, ranked.c.source, ranked.c.currency, ranked.c.day,
+                    ranked.c.price_at_transaction, ranked.c.timestamp).where(ranked.c.rank == 1)
+    connection.execute(PricePoint.__table__.delete().where(PricePoint.user_id.isnot(None)))
+    connection.execute(PricePoint.__table__.insert().from_select(
+        ['user_id', 'source', 'symbol', 'day', 'price', 'observed_at'], latest))
+
+
+MIGRATIONS = [
+    (1, 'Composite indexes on transaction (user_id, source, currency, timestamp)', add_transaction_indexes),
+    (2, 'Backfill holdings from existing transactions', backfill_holdings),
+    (3, 'Backfill daily holdings series from existing transactions', backfill_daily_holdings),
+    (4, 'Backfill price history from existing transaction prices', backfill_prices),
+]
+
+
+def current_version():
+    return db.session.query(db.func.max(SchemaMigration.version)).scalar() or 0
+
+
+def upgrade():
+    applied = current_version()
+    for version, name, migrate in MIGRATIONS:
+        if version <= applied:
+            continue
+        logger.info(f"Applying schema migration {version}: {name}")
+        try:
+            with db.engine.begin() as connection:
+                migrate(connection)
+                connection.execute(SchemaMigration.__table__.insert().values(version=version, name=name))
+        except IntegrityError:
+            # Another process applied this version first
+            logger.info(f"Schema migration {version} already applied")
+    db.session.remove()
@@ -1,9 +1,17 @@
 from flask_sqlalchemy import SQLAlchemy
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
+from datetime import datetime
 import config
+import functools
 
 db = SQLAlchemy()
 
+@functools.lru_cache(maxsize=None)
+def credential_cipher():
+    # ENCRYPTION_KEY encrypts; OLD_ENCRYPTION_KEYS still decrypt while keys are rotated
+    keys = [config.ENCRYPTION_KEY, *getattr(config, 'OLD_ENCRYPTION_KEYS', [])]
+    return MultiFernet([Fernet(key) for key in keys])
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -14,20 +22,20 @@ class User(db.Model):
     totp_secret = db.Column(db.String(100))
 
     def set_coinbase_api_key(self, api_key):
-        f = Fernet(config.ENCRYPTION_KEY)
-        self.coinbase_api_key = f.encrypt(api_key.encode()).decode()
+        self.coinbase_api_key = credential_cipher().encrypt(api_key.encode()).decode()
 
     def get_coinbase_api_key(self):
-        f = Fernet(config.ENCRYPTION_KEY)
-        return f.decrypt(self.coinbase_api_key.encode()).decode()
+        return credential_cipher().decrypt(self.coinbase_api_key.encode()).decode()
 
     def set_coinbase_api_secret(self, api_secret):
-        f = Fernet(config.ENCRYPTION_KEY)
-        self.coinbase_api_secret = f.encrypt(api_secret.encode()).decode()
+        self.coinbase_api_secret = credential_cipher().encrypt(api_secret.encode()).decode()
 
     def get_coinbase_api_secret(self):
-        f = Fernet(config.ENCRYPTION_KEY)
-        return f.decrypt(self.coinbase_api_secret.encode()).decode()
+        return credential_cipher().decrypt(self.coinbase_api_secret.encode()).decode()
+
+# Pending, failed and canceled Coinbase transactions are listed but never
+# count towards balances, charts or cost basis
+SETTLED_STATUS = 'completed'
 
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -39,4 +47,193 @@ class Transaction(db.Model):
     timestamp = db.Column(db.DateTime, nullable=False)
     status = db.Column(db.String(50), nullable=False)
     price_at_transaction = db.Column(db.Float)
-    source = db.Column(db.String(20), nullable=False, default='coinbase')
\ No newline at end of file
+    source = db.Column(db.String(20), nullable=False, default='coinbase')
+
+    __table_args__ = (
+        # Every transaction view filters on user + source (+ currency) and orders by time
+        db.Index('ix_transaction_user_source_currency_timestamp', 'user_id', 'source', 'currency', 'timestamp'),
+        db.Index('ix_transaction_user_source_timestamp', 'user_id', 'source', 'timestamp'),
+    )
+
+class Holding(db.Model):
+    # Running per-currency totals of Transaction.amount, maintained by every
+    # write path (see app/holdings.py) so the dashboard never aggregates raw rows.
+    # Only settled transactions move the amount; tx_count counts every row.
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    source = db.Column(db.String(20), nullable=False)
+    currency = db.Column(db.String(10), nullable=False)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    tx_count = db.Column(db.Integer, nullable=False, default=0)
+    settled_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'source', 'currency', name='uq_holding_user_source_currency'),
+    )
+
+class DailyHolding(db.Model):
+    # End-of-day balance of one currency for each day with settled activity;
+    # the transaction charts read this series instead of replaying the history
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    source = db.Column(db.String(20), nullable=False)
+    currency = db.Column(db.String(10), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    net = db.Column(db.Float, nullable=False, default=0.0)
+    balance = db.Column(db.Float, nullable=False, default=0.0)
+    tx_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'source', 'currency', 'day', name='uq_daily_holding_user_source_currency_day'),
+    )
+
+class CostBasisState(db.Model):
+    # Lot matching of one currency with one method (see app/cost_basis.py), up
+    # to the newest transaction replayed; its open lots are CostBasisLot rows
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    source = db.Column(db.String(20), nullable=False)
+    currency = db.Column(db.String(10), nullable=False)
+    method = db.Column(db.String(10), nullable=False)
+    # Replay watermark: highest Transaction.id, latest timestamp and row count seen
+    max_transaction_id = db.Column(db.Integer, nullable=False, default=0)
+    last_timestamp = db.Column(db.DateTime)
+    tx_count = db.Column(db.Integer, nullable=False, default=0)
+    proceeds = db.Column(db.Float, nullable=False, default=0.0)
+    cost_of_sold = db.Column(db.Float, nullable=False, default=0.0)
+    realized_gain = db.Column(db.Float, nullable=False, default=0.0)
+    # Disposed without enough open lots to match (e.g. history before the first import)
+    unmatched_quantity = db.Column(db.Float, nullable=False, default=0.0)
+    # Latest market price seen in the replayed transactions, for valuing open lots
+    last_price = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'source', 'currency', 'method', name='uq_cost_basis_state_series_method'),
+    )
+
+class CostBasisLot(db.Model):
+    # Remaining quantity of one acquisition after lot matching
+    id = db.Column(db.Integer, primary_key=True)
+    state_id = db.Column(db.Integer, db.ForeignKey('cost_basis_state.id'), nullable=False, index=True)
+    transaction_id = db.Column(db.Integer)
+    acquired_at = db.Column(db.DateTime, nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+    unit_cost = db.Column(db.Float, nullable=False)
+
+class PricePoint(db.Model):
+    # One price per symbol and day for valuing holdings (see app/prices.py).
+    # Symbols are only unique within a source (Fidelity's BTC is a fund), so
+    # every price belongs to one. Prices taken from a user's transactions are
+    # that user's own; prices loaded from CSVs have no user and are shared.
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(20), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    symbol = db.Column(db.String(10), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    # Time of the transaction the price came from, so the day keeps its latest one
+    observed_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('uq_price_point_user_source_symbol_day', 'user_id', 'source', 'symbol', 'day', unique=True,
+                 sqlite_where=db.text('user_id IS NOT NULL'), postgresql_where=db.text('user_id IS NOT NULL')),
+        db.Index('uq_price_point_loaded_source_symbol_day', 'source', 'symbol', 'day', unique=True,
+                 sqlite_where=db.text('user_id IS NULL'), postgresql_where=db.text('user_id IS NULL')),
+    )
+
+class DataVersion(db.Model):
+    # Change counter per data scope ('<source>:<user_id>' or 'prices:<source>'), bumped
+    # in the same transaction as every write; pages derive their ETags from it
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(50), nullable=False, unique=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ImportCheckpoint(db.Model):
+    # Progress of a chunked CSV import, kept until the import finishes so a
+    # failed run can resume after the last committed chunk
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    source = db.Column(db.String(20), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    file_digest = db.Column(db.String(64), nullable=False)
+    rows_committed = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'kind', 'file_digest'),
+    )
+
+class CoinbaseSyncCursor(db.Model):
+    # Newest transaction already ingested per Coinbase account; later syncs
+    # only ask Coinbase for what came after it
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    account_id = db.Column(db.String(100), nullable=False)
+    last_tx_id = db.Column(db.String(100))
+    last_created_at = db.Column(db.DateTime)
+    last_synced_at = db.Column(db.DateTime)
+    last_fetched = db.Column(db.Integer, nullable=False, default=0)
+    last_new = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'account_id'),
+    )
+
+JOB_ACTIVE_STATUSES = ('queued', 'running')
+
+class Job(db.Model):
+    # Background import/sync work and its progress, polled through /jobs
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    rows_parsed = db.Column(db.Integer, nullable=False, default=0)
+    inserted = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.String(500))
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        # At most one queued/running job of each kind per user
+        db.Index(
+            'ix_job_active_user_kind', 'user_id', 'kind', unique=True,
+            sqlite_where=db.text("status IN ('queued', 'running')"),
+            postgresql_where=db.text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    @property
+    def is_active(self):
+        return self.status in JOB_ACTIVE_STATUSES
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'rows_parsed': self.rows_parsed,
+            'inserted': self.inserted,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'message': self.message,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+class SchemaMigration(db.Model):
+    # Applied versions from database/migrations.py
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
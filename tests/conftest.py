@@ -0,0 +1,42 @@
+from app import create_app
+from database.models import db, User
+import pytest
+
+
+@pytest.fixture
+def app_config():
+    # Extra config for create_app; override in a test module to change it
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'LOG_FILE': '',
+        'JOB_WORKERS': 0,
+        'QUERY_AUDIT': True,
+        'QUERY_AUDIT_SLOW_MS': None,
+        **app_config,
+    })
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def user(app):
+    user = User(username='alice', email='alice@example.com', password='unused')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def client(app, user):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+    return client
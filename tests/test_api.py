@@ -0,0 +1,83 @@
+from datetime import datetime
+from app.importers import bulk_insert_transactions, transaction_row
+from database.models import db
+import pytest
+
+
+@pytest.fixture
+def transactions(user):
+    bulk_insert_transactions([
+        transaction_row('btc-1', user.id, 'buy', 1.0, 'BTC', datetime(2024, 1, 1, 9), 'coinbase', price=100.0),
+        transaction_row('eth-1', user.id, 'buy', 2.0, 'ETH', datetime(2024, 1, 2, 9), 'coinbase', price=10.0),
+        transaction_row('btc-2', user.id, 'sell', -0.5, 'BTC', datetime(2024, 1, 2, 18), 'coinbase', price=120.0),
+        transaction_row('sol-1', user.id, 'buy', 3.0, 'SOL', datetime(2024, 1, 3, 9), 'coinbase', price=5.0),
+    ])
+    db.session.commit()
+
+
+def _get(client, query=''):
+    response = client.get(f'/api/coinbase/transactions{query}')
+    assert response.status_code == 200, response.json
+    return response.json
+
+
+def _tx_ids(body):
+    return [item['tx_id'] for item in body['items']]
+
+
+def test_fields_selects_the_returned_keys(client, transactions):
+    body = _get(client, '?fields=tx_id,amount')
+    assert body['items'][0] == {'tx_id': 'sol-1', 'amount': 3.0}
+    assert body['total'] == 4
+
+    item = _get(client)['items'][0]
+    assert set(item) == {'id', 'tx_id', 'type', 'amount', 'currency', 'timestamp', 'status', 'price'}
+    assert item['timestamp'] == '2024-01-03T09:00:00'
+
+
+def test_unknown_field_is_a_bad_request(client, transactions):
+    response = client.get('/api/coinbase/transactions?fields=tx_id,secret')
+    assert response.status_code == 400
+    assert "['secret']" in response.json['error']
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('?currency=BTC', ['btc-2', 'btc-1']),
+    ('?currency=BTC, ETH', ['btc-2', 'eth-1', 'btc-1']),
+    ('?currency=DOGE', []),
+    ('?type=sell', ['btc-2']),
+    ('?since=2024-01-02', ['sol-1', 'btc-2', 'eth-1']),
+    ('?since=2024-01-02T12:00:00', ['sol-1', 'btc-2']),
+    # A bare until date covers the whole day, a datetime stops at that instant
+    ('?until=2024-01-02', ['btc-2', 'eth-1', 'btc-1']),
+    ('?until=2024-01-02T12:00:00', ['eth-1', 'btc-1']),
+    ('?currency=BTC&since=2024-01-02', ['btc-2']),
+])
+def test_filters(client, transactions, query, expected):
+    assert _tx_ids(_get(client, query)) == expected
+
+
+def test_total_only_comes_from_currency_filters(client, transactions):
+    assert _get(client, '?currency=BTC')['total'] == 2
+    assert _get(client, '?currency=BTC,ETH')['total'] is None
+    assert _get(client, '?since=2024-01-02')['total'] is None
+
+
+def test_bad_date_is_a_bad_request(client, transactions):
+    response = client.get('/api/coinbase/transactions?since=yesterday')
+    assert response.status_code == 400
+    assert 'since must be an ISO date' in response.json['error']
+
+
+def test_pages_keep_the_filters(client, transactions):
+    first = _get(client, '?currency=BTC,ETH&per_page=2')
+    assert _tx_ids(first) == ['btc-2', 'eth-1']
+    second = _get(client, f"?currency=BTC,ETH&per_page=2&after={first['next']}")
+    assert _tx_ids(second) == ['btc-1']
+    assert second['next'] is None and second['prev'] is not None
+
+
+def test_unknown_source_and_anonymous_requests(app, client, transactions):
+    response = client.get('/api/kraken/transactions')
+    assert (response.status_code, response.json) == (404, {'error': 'Not found.'})
+    assert app.test_client().get('/api/coinbase/transactions').status_code == 401
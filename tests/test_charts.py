@@ -0,0 +1,48 @@
+from datetime import date, timedelta
+from app.charts import downsample, last_per_bucket, lttb
+import math
+import pytest
+
+START = date(2020, 1, 6)
+
+
+def _rows(count):
+    return [(START + timedelta(days=i), math.sin(i / 7) * 10 + i / 50) for i in range(count)]
+
+
+@pytest.mark.parametrize('count, threshold', [(1000, 100), (1000, 3), (101, 100), (50, 7)])
+def test_lttb_keeps_the_endpoints_and_exactly_threshold_points(count, threshold):
+    rows = _rows(count)
+    sampled = lttb(rows, threshold)
+
+    assert len(sampled) == threshold
+    assert sampled[0] == rows[0] and sampled[-1] == rows[-1]
+    assert sampled == sorted(sampled)
+    assert set(sampled) <= set(rows)
+
+
+def test_lttb_keeps_a_lone_peak():
+    rows = [(START + timedelta(days=i), 0.0) for i in range(500)]
+    rows[250] = (rows[250][0], 100.0)
+    assert rows[250] in lttb(rows, 20)
+
+
+@pytest.mark.parametrize('threshold', [2, 10, 11])
+def test_lttb_returns_short_series_unchanged(threshold):
+    rows = _rows(10)
+    assert lttb(rows, threshold) == rows
+
+
+def test_last_per_bucket_keeps_the_closing_balance():
+    rows = _rows(14)
+    weekly = last_per_bucket(rows, 'week')
+    # START is a Monday, so two ISO weeks end on the Sundays
+    assert weekly == [rows[6], rows[13]]
+
+
+def test_auto_resolution_picks_the_finest_that_fits():
+    rows = _rows(400)
+    assert downsample(rows, max_points=400) == rows
+    assert downsample(rows, max_points=100) == last_per_bucket(rows, 'week')
+    assert downsample(rows, max_points=5) == lttb(last_per_bucket(rows, 'month'), 5)
+    assert len(downsample(rows, 'day', max_points=50)) == 50
@@ -0,0 +1,123 @@
+from app.coinbase_sync import sync_transactions
+from benchmarks.fake_coinbase import FakeCoinbase, serve
+from database.models import db, CoinbaseSyncCursor, Holding, Transaction
+import pytest
+
+# The fake API is plain http on localhost
+pytestmark = pytest.mark.filterwarnings('ignore:.*sending a request to an insecure:UserWarning')
+
+ACCOUNT = 'key-a0'
+
+
+class Progress:
+    def update(self, **counts):
+        self.counts = counts
+
+
+@pytest.fixture
+def fake():
+    state = FakeCoinbase(accounts=1, transactions=10, page_size=4)
+    server, state.url = serve(state)
+    yield state
+    server.shutdown()
+
+
+@pytest.fixture
+def app_config(fake):
+    return {'COINBASE_API_URL': fake.url, 'COINBASE_PAGE_LIMIT': 4, 'COINBASE_SYNC_CONCURRENCY': 2}
+
+
+@pytest.fixture
+def coinbase_user(user):
+    # The API key picks the fake API's tenant, so transaction ids start with it
+    user.set_coinbase_api_key('key')
+    user.set_coinbase_api_secret('secret')
+    db.session.commit()
+    return user
+
+
+def _tx_id(index, account=ACCOUNT):
+    return f'{account}-t{index:07d}'
+
+
+def _sync(user, full=False):
+    progress = Progress()
+    message = sync_transactions(progress, user.id, full)
+    return message, progress.counts
+
+
+def _stored(user):
+    return {tx.coinbase_tx_id: tx.status for tx in Transaction.query.filter_by(user_id=user.id)}
+
+
+def _cursor(user, account=ACCOUNT):
+    return CoinbaseSyncCursor.query.filter_by(user_id=user.id, account_id=account).one().last_tx_id
+
+
+def test_sync_follows_pages_of_every_account(coinbase_user, fake):
+    fake.accounts = 2
+    _, counts = _sync(coinbase_user)
+
+    assert counts['inserted'] == 20
+    assert set(_stored(coinbase_user)) == {_tx_id(i, account) for account in ('key-a0', 'key-a1') for i in range(10)}
+    # One accounts page, then 4 + 4 + 2 transactions per account
+    assert fake.stats()['requests'] == 1 + 2 * 3
+    assert _cursor(coinbase_user, 'key-a0') == _tx_id(9, 'key-a0')
+    assert _cursor(coinbase_user, 'key-a1') == _tx_id(9, 'key-a1')
+
+
+def test_sync_resumes_from_the_stored_cursor(coinbase_user, fake):
+    db.session.add(CoinbaseSyncCursor(user_id=coinbase_user.id, account_id=ACCOUNT, last_tx_id=_tx_id(5)))
+    db.session.commit()
+
+    _, counts = _sync(coinbase_user)
+    assert counts['inserted'] == 4
+    assert set(_stored(coinbase_user)) == {_tx_id(i) for i in range(6, 10)}
+    assert _cursor(coinbase_user) == _tx_id(9)
+
+    fake.grow(3)
+    _, counts = _sync(coinbase_user)
+    assert (counts['rows_parsed'], counts['inserted']) == (3, 3)
+    assert _cursor(coinbase_user) == _tx_id(12)
+
+
+def test_up_to_date_sync_costs_one_page_per_account(coinbase_user, fake):
+    _sync(coinbase_user)
+    requests = fake.stats()['requests']
+
+    _, counts = _sync(coinbase_user)
+    assert (counts['rows_parsed'], counts['inserted']) == (0, 0)
+    assert fake.stats()['requests'] - requests == 2
+
+
+def test_pending_transactions_are_refetched_until_they_settle(coinbase_user, fake):
+    fake.pending = 2
+    _sync(coinbase_user)
+    assert [_stored(coinbase_user)[_tx_id(i)] for i in (7, 8, 9)] == ['completed', 'pending', 'pending']
+    assert _cursor(coinbase_user) == _tx_id(7)
+    assert Holding.query.filter_by(user_id=coinbase_user.id).one().settled_count == 8
+
+    fake.settle()
+    _, counts = _sync(coinbase_user)
+    assert (counts['rows_parsed'], counts['inserted']) == (2, 0)
+    assert set(_stored(coinbase_user).values()) == {'completed'}
+    assert _cursor(coinbase_user) == _tx_id(9)
+    assert Holding.query.filter_by(user_id=coinbase_user.id).one().settled_count == 10
+
+
+def test_full_sync_ignores_the_cursors(coinbase_user, fake):
+    _sync(coinbase_user)
+
+    message, counts = _sync(coinbase_user, full=True)
+    assert (counts['rows_parsed'], counts['inserted'], counts['skipped']) == (10, 0, 10)
+    assert 'imported 0 new of 10 fetched' in message
+    assert _cursor(coinbase_user) == _tx_id(9)
+
+
+def test_rejected_cursor_falls_back_to_a_full_fetch(coinbase_user, fake):
+    db.session.add(CoinbaseSyncCursor(user_id=coinbase_user.id, account_id=ACCOUNT, last_tx_id='gone'))
+    db.session.commit()
+
+    _, counts = _sync(coinbase_user)
+    assert counts['inserted'] == 10
+    assert _cursor(coinbase_user) == _tx_id(9)
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+from app.cost_basis import METHODS, clear_cost_basis, cost_basis_summary, match_lots, refresh_cost_basis
+from app.importers import bulk_insert_transactions, transaction_row
+from database.models import db
+import numpy as np
+import pytest
+
+
+def _match(method, quantity, costs, opening=()):
+    quantity = np.array(quantity, dtype='float64')
+    buys = quantity > 0
+    lot_qty = np.concatenate(([qty for qty, _ in opening], quantity[buys]))
+    lot_cost = np.concatenate(([cost for _, cost in opening], np.array(costs, dtype='float64')[buys]))
+    return match_lots(method, lot_qty, lot_cost, quantity)
+
+
+@pytest.mark.parametrize('method, sold_cost, remaining', [
+    ('fifo', 100.0 + 0.5 * 300.0, [0.0, 0.5, 1.0]),
+    ('lifo', 200.0 + 0.5 * 300.0, [1.0, 0.5, 0.0]),
+    ('hifo', 300.0 + 0.5 * 200.0, [1.0, 0.0, 0.5]),
+])
+def test_match_lots_methods(method, sold_cost, remaining):
+    cost, unmatched, left = _match(method, [1.0, 1.0, 1.0, -1.5], [100.0, 300.0, 200.0, 0.0])
+    assert cost.tolist() == pytest.approx([0.0, 0.0, 0.0, sold_cost])
+    assert unmatched.tolist() == [0.0] * 4
+    assert left.tolist() == pytest.approx(remaining)
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_disposals_beyond_the_open_lots_stay_unmatched(method):
+    # The second sell has nothing to match; the later buy is not used retroactively
+    cost, unmatched, left = _match(method, [1.0, -1.0, -1.0, 2.0], [100.0, 0.0, 0.0, 50.0])
+    assert cost.tolist() == pytest.approx([0.0, 100.0, 0.0, 0.0])
+    assert unmatched.tolist() == pytest.approx([0.0, 0.0, 1.0, 0.0])
+    assert left.tolist() == pytest.approx([0.0, 2.0])
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_open_lots_are_matched_before_new_ones(method):
+    cost, unmatched, left = _match(method, [-1.0, 1.0], [0.0, 500.0], opening=[(2.0, 10.0)])
+    assert cost.tolist() == pytest.approx([10.0, 0.0])
+    assert left.tolist() == pytest.approx([1.0, 1.0])
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        _match('average', [1.0], [1.0])
+
+
+def _trade(user, index, quantity, price, day):
+    tx_type = 'buy' if quantity > 0 else 'sell'
+    return transaction_row(f'tx-{index}', user.id, tx_type, quantity, 'BTC',
+                           datetime(2024, 1, 1) + timedelta(days=day), 'coinbase', price=price)
+
+
+def _summary(user, **kwargs):
+    refresh_cost_basis(user.id, 'coinbase')
+    return {row['currency']: row for row in cost_basis_summary(user.id, 'coinbase', **kwargs)}
+
+
+def test_no_unrealized_gain_without_a_market_price(app, user):
+    # The buy half of a Convert has a cost but no price of its own
+    bulk_insert_transactions([
+        transaction_row('c1_sell', user.id, 'sell', -0.1, 'BTC', datetime(2024, 1, 1), 'coinbase', price=40000.0),
+        transaction_row('c1_buy', user.id, 'buy', 2.0, 'ETH', datetime(2024, 1, 1), 'coinbase'),
+    ])
+    db.session.commit()
+
+    eth = _summary(user)['ETH']
+    assert eth['cost_basis'] == 4000.0
+    assert eth['price'] is None
+    assert eth['market_value'] is None
+    assert eth['unrealized_gain'] is None
+
+    assert _summary(user, prices={})['ETH']['unrealized_gain'] is None
+    assert _summary(user, prices={'ETH': 2500.0})['ETH']['unrealized_gain'] == 1000.0
+
+
+@pytest.mark.parametrize('method', METHODS)
+def test_appended_and_backdated_imports_match_a_full_replay(app, user, method):
+    trades = [(1.0, 100.0, 0), (2.0, 150.0, 2), (-1.5, 200.0, 4), (1.0, 120.0, 6), (-2.0, 250.0, 8), (0.5, 90.0, 1)]
+    bulk_insert_transactions([_trade(user, i, *trade) for i, trade in enumerate(trades[:3])])
+    db.session.commit()
+    assert refresh_cost_basis(user.id, 'coinbase', method) == {'BTC': 'replayed'}
+
+    bulk_insert_transactions([_trade(user, i, *trade) for i, trade in enumerate(trades[:5]) if i >= 3])
+    db.session.commit()
+    assert refresh_cost_basis(user.id, 'coinbase', method) == {'BTC': 'appended'}
+
+    # Day 1 lands before the replayed history
+    bulk_insert_transactions([_trade(user, 5, *trades[5])])
+    db.session.commit()
+    assert refresh_cost_basis(user.id, 'coinbase', method) == {'BTC': 'replayed'}
+    incremental = cost_basis_summary(user.id, 'coinbase', method)
+
+    clear_cost_basis(user.id, 'coinbase', method)
+    db.session.commit()
+    refresh_cost_basis(user.id, 'coinbase', method)
+    assert cost_basis_summary(user.id, 'coinbase', method) == incremental
+    assert incremental[0]['quantity'] == pytest.approx(1.0)
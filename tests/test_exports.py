@@ -0,0 +1,114 @@
+from datetime import datetime
+from app.exports import csv_lines, gzipped
+from app.holdings import clear_holdings
+from app.importers import (
+    COINBASE_BACKUP, FIDELITY_BACKUP, ColumnarFormatError, bulk_insert_transactions, columnar_bytes,
+    restore_columnar, stream_import, transaction_row,
+)
+from database.models import db, Holding, Transaction
+import gzip
+import io
+import numpy as np
+import pytest
+
+
+def _import(user):
+    bulk_insert_transactions([
+        transaction_row('tx-1', user.id, 'buy', 2.0, 'BTC', datetime(2024, 1, 1, 12), 'coinbase', price=100.0),
+        transaction_row('tx-2', user.id, 'buy', 1.0, 'BTC', datetime(2024, 1, 2, 12), 'coinbase', status='pending',
+                        price=200.0),
+        transaction_row('tx-3', user.id, 'send', -0.5, 'ETH', datetime(2024, 1, 3, 12, 30, 15, 250), 'coinbase'),
+    ])
+    db.session.commit()
+
+
+def _statuses(user):
+    return dict(db.session.query(Transaction.coinbase_tx_id, Transaction.status).filter_by(user_id=user.id))
+
+
+def _transactions(user):
+    return sorted(db.session.query(
+        Transaction.coinbase_tx_id, Transaction.timestamp, Transaction.type, Transaction.currency,
+        Transaction.status, Transaction.amount, Transaction.price_at_transaction,
+    ).filter_by(user_id=user.id).all())
+
+
+def _clear(user):
+    Transaction.query.filter_by(user_id=user.id).delete()
+    clear_holdings(user.id, 'coinbase')
+    db.session.commit()
+
+
+def test_csv_backup_round_trips_statuses(app, user):
+    _import(user)
+    backup = b''.join(csv_lines(user.id, COINBASE_BACKUP, extra_columns=('Notes',)))
+    assert backup.splitlines()[0] == (b'ID,Timestamp,Transaction Type,Asset,Quantity Transacted,'
+                                      b'Price at Transaction,Status,Notes')
+
+    _clear(user)
+    result = stream_import(io.BytesIO(backup), user.id, COINBASE_BACKUP)
+
+    assert result.inserted == 3
+    assert _statuses(user) == {'tx-1': 'completed', 'tx-2': 'pending', 'tx-3': 'completed'}
+    holding = Holding.query.filter_by(user_id=user.id, currency='BTC').one()
+    assert (holding.amount, holding.tx_count, holding.settled_count) == (2.0, 2, 1)
+
+
+def test_backups_without_a_status_column_are_settled(app, user):
+    backup = (b'ID,Run Date,Action,Symbol,Quantity,Price\n'
+              b'fid-1,2024-01-02T00:00:00,Buy,AAPL,1,150\n'
+              b'fid-2,2024-01-03T00:00:00,Buy,AAPL,1,151\n')
+    stream_import(io.BytesIO(backup), user.id, FIDELITY_BACKUP)
+    assert _statuses(user) == {'fid-1': 'completed', 'fid-2': 'completed'}
+
+
+def test_gzip_export_matches_the_plain_csv(client, user):
+    _import(user)
+    plain = b''.join(csv_lines(user.id, COINBASE_BACKUP, extra_columns=('Notes',)))
+    response = client.post('/export_transactions', data={'format': 'csv', 'compress': '1'})
+
+    assert response.mimetype == 'application/gzip'
+    assert gzip.decompress(response.data) == plain
+    assert gzip.decompress(b''.join(gzipped(iter([plain[:10], b'', plain[10:]])))) == plain
+
+
+def test_columnar_backup_round_trips(app, user):
+    _import(user)
+    before = _transactions(user)
+    backup = columnar_bytes(user.id, 'coinbase')
+
+    _clear(user)
+    result = restore_columnar(io.BytesIO(backup), user.id, 'coinbase')
+
+    assert result.inserted == 3
+    assert _transactions(user) == before
+    holding = Holding.query.filter_by(user_id=user.id, currency='BTC').one()
+    assert (holding.amount, holding.tx_count, holding.settled_count) == (2.0, 2, 1)
+
+
+def _archive(**overrides):
+    arrays = dict(np.load(io.BytesIO(overrides.pop('backup')), allow_pickle=False))
+    arrays.update(overrides)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'format_version': np.array(2)}, 'version 2 is newer'),
+    ({'source': np.array('fidelity')}, 'fidelity backup, not coinbase'),
+])
+def test_columnar_restore_rejects_unsupported_backups(app, user, overrides, message):
+    _import(user)
+    backup = _archive(backup=columnar_bytes(user.id, 'coinbase'), **overrides)
+    _clear(user)
+
+    with pytest.raises(ColumnarFormatError, match=message):
+        restore_columnar(backup, user.id, 'coinbase')
+    assert not _statuses(user)
+
+
+def test_columnar_restore_rejects_other_files(app, user):
+    with pytest.raises(ColumnarFormatError, match='Not a columnar backup'):
+        restore_columnar(io.BytesIO(b'ID,Timestamp\n'), user.id, 'coinbase')
@@ -0,0 +1,102 @@
+from datetime import datetime
+from app.coinbase_sync import AccountSync, _advance_cursor
+from app.cost_basis import cost_basis_summary, refresh_cost_basis
+from app.holdings import rebuild_daily_holdings, rebuild_holdings
+from app.importers import bulk_insert_transactions, transaction_row, update_statuses
+from database.models import db, CoinbaseSyncCursor, DailyHolding, Holding
+
+
+def _rows(user, status):
+    return [
+        transaction_row('tx-1', user.id, 'buy', 2.0, 'BTC', datetime(2024, 1, 1, 12), 'coinbase', price=100.0),
+        transaction_row('tx-2', user.id, 'buy', 1.0, 'BTC', datetime(2024, 1, 2, 12), 'coinbase', status=status,
+                        price=200.0),
+    ]
+
+
+def _holding(user):
+    holding = Holding.query.filter_by(user_id=user.id, source='coinbase', currency='BTC').one()
+    return holding.amount, holding.tx_count, holding.settled_count
+
+
+def _series(user):
+    rows = DailyHolding.query.filter_by(user_id=user.id).order_by(DailyHolding.day)
+    return [(str(row.day), row.balance) for row in rows]
+
+
+def _open_quantity(user):
+    refresh_cost_basis(user.id, 'coinbase')
+    return cost_basis_summary(user.id, 'coinbase')[0]['quantity']
+
+
+def _no_drift(user):
+    return not rebuild_holdings(user.id, repair=False) and not rebuild_daily_holdings(user.id, repair=False)
+
+
+def test_pending_transactions_do_not_move_balances(app, user):
+    bulk_insert_transactions(_rows(user, 'pending'))
+    db.session.commit()
+
+    assert _holding(user) == (2.0, 2, 1)
+    assert _series(user) == [('2024-01-01', 2.0)]
+    assert _open_quantity(user) == 2.0
+    assert _no_drift(user)
+
+
+def test_status_changes_settle_and_unsettle(app, user):
+    bulk_insert_transactions(_rows(user, 'pending'))
+    db.session.commit()
+
+    assert update_statuses(_rows(user, 'completed')) == 1
+    db.session.commit()
+    assert _holding(user) == (3.0, 2, 2)
+    assert _series(user) == [('2024-01-01', 2.0), ('2024-01-02', 3.0)]
+    assert _open_quantity(user) == 3.0
+    assert _no_drift(user)
+
+    assert update_statuses(_rows(user, 'failed')) == 1
+    db.session.commit()
+    assert _holding(user) == (2.0, 2, 1)
+    assert _series(user) == [('2024-01-01', 2.0)]
+    assert _open_quantity(user) == 2.0
+    assert _no_drift(user)
+
+    assert update_statuses(_rows(user, 'failed')) == 0
+
+
+def test_sync_cursor_stops_before_pending_transactions(app, user):
+    transactions = [
+        {'id': 'a', 'status': 'completed', 'created_at': '2024-01-01T00:00:00Z'},
+        {'id': 'b', 'status': 'pending', 'created_at': '2024-01-02T00:00:00Z'},
+        {'id': 'c', 'status': 'completed', 'created_at': '2024-01-03T00:00:00Z'},
+    ]
+    _advance_cursor({}, user.id, AccountSync(account_id='acct', name='BTC Wallet'), transactions)
+    assert CoinbaseSyncCursor.query.filter_by(user_id=user.id).one().last_tx_id == 'a'
+
+
+def test_status_change_without_balance_change_changes_the_etag(client, user):
+    bulk_insert_transactions(_rows(user, 'pending'))
+    db.session.commit()
+    before = client.get('/api/coinbase/transactions').headers['ETag']
+
+    assert update_statuses(_rows(user, 'failed')) == 1
+    db.session.commit()
+    response = client.get('/api/coinbase/transactions', headers={'If-None-Match': before})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != before
+    assert _holding(user) == (2.0, 2, 1)
+
+
+def test_settle_and_unsettle_in_one_sync_replays_cost_basis(app, user):
+    bulk_insert_transactions(_rows(user, 'pending'))
+    db.session.commit()
+    assert _open_quantity(user) == 2.0
+
+    swapped = _rows(user, 'completed')
+    swapped[0]['status'] = 'pending'
+    assert update_statuses(swapped) == 2
+    db.session.commit()
+    assert _holding(user) == (1.0, 2, 1)
+    assert refresh_cost_basis(user.id, 'coinbase') == {'BTC': 'replayed'}
+    assert _open_quantity(user) == 1.0
+    assert _no_drift(user)
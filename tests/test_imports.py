@@ -0,0 +1,112 @@
+from datetime import datetime
+from app.importers import COINBASE_STATEMENT, FIDELITY_HISTORY, ImportInterrupted, parse_frame, stream_import
+from database.models import db, Holding, ImportCheckpoint, Transaction
+import io
+import pandas as pd
+import pytest
+
+COINBASE_CSV = b"""ID,Timestamp,Transaction Type,Asset,Quantity Transacted,Price at Transaction,Total,Notes
+a1,2024-01-01 00:00:00 UTC,Buy,BTC,"1,500.5","$40,000.00",60000,
+a2,2024-01-02 00:00:00 UTC,Sell,BTC,0.5,$41000,20500,
+a3,2024-01-03 00:00:00 UTC,Convert,BTC,0.1,$42000,4200,Converted 0.1 BTC to 2.05 ETH
+a4,not a date,Buy,BTC,1,$1,1,
+a5,2024-01-05 00:00:00 UTC,Buy,BTC,lots,$1,1,
+,2024-01-06 00:00:00 UTC,Buy,BTC,1,$1,1,
+a7,2024-01-07 00:00:00 UTC,Convert,BTC,1,$1,1,swapped
+a8,2024-01-08T09:30:00Z,Send,ETH,0.25,,,
+"""
+
+FIDELITY_CSV = b"""Run Date,Action,Symbol,Quantity,Price
+01/02/2024,Buy,AAPL,1,150
+01/03/2024,Buy,AAPL,1,151
+01/04/2024,Buy,AAPL,1,152
+01/05/2024,Buy,AAPL,1,153
+01/08/2024,Buy,AAPL,1,154
+01/09/2024,Buy,AAPL,1,155
+01/10/2024,Buy,AAPL,1,156
+01/11/2024,Buy,AAPL,1,157
+"""
+
+
+def _parse(schema, data):
+    frame = pd.read_csv(io.BytesIO(data), dtype=schema.dtypes, usecols=lambda column: column in schema.csv_columns)
+    return parse_frame(schema, frame, 1)
+
+
+def test_coinbase_statement_rows():
+    rows = _parse(COINBASE_STATEMENT, COINBASE_CSV).rows
+    assert rows['coinbase_tx_id'].tolist() == ['a1', 'a2', 'a3_sell', 'a3_buy', 'a8']
+    assert rows['type'].tolist() == ['Buy', 'Sell', 'sell', 'buy', 'Send']
+    assert rows['currency'].tolist() == ['BTC', 'BTC', 'BTC', 'ETH', 'ETH']
+    assert rows['amount'].tolist() == [1500.5, -0.5, -0.1, 2.05, -0.25]
+    assert rows['price_at_transaction'].tolist() == [40000.0, 41000.0, 42000.0, None, None]
+    # The known format first, then inference for the rows it missed
+    assert rows['timestamp'].tolist()[-1] == datetime(2024, 1, 8, 9, 30)
+    assert set(rows['status']) == {'completed'}
+
+
+def test_coinbase_statement_rejects():
+    rejects = _parse(COINBASE_STATEMENT, COINBASE_CSV).rejects
+    assert rejects.to_dict('records') == [
+        {'row': 3, 'reason': 'invalid timestamp'},
+        {'row': 4, 'reason': 'invalid quantity'},
+        {'row': 5, 'reason': 'missing ID'},
+        {'row': 6, 'reason': 'unparseable Convert notes'},
+    ]
+
+
+def test_fidelity_sells_are_negative_and_ids_use_the_row():
+    parsed = _parse(FIDELITY_HISTORY, b"Run Date,Action,Symbol,Quantity,Price\n"
+                                      b"01/02/2024,Buy,AAPL,10,150\n01/03/2024,Sell,AAPL,4,$155.50\n")
+    assert parsed.rows['amount'].tolist() == [10.0, -4.0]
+    assert parsed.rows['price_at_transaction'].tolist() == [150.0, 155.5]
+    assert parsed.rows['coinbase_tx_id'].tolist() == ['fidelity_0_01/02/2024_AAPL', 'fidelity_1_01/03/2024_AAPL']
+    assert parsed.rejects.empty
+
+
+def _ids(user):
+    return sorted(tx_id for tx_id, in db.session.query(Transaction.coinbase_tx_id).filter_by(user_id=user.id))
+
+
+def _aapl(user):
+    return Holding.query.filter_by(user_id=user.id, source='fidelity', currency='AAPL').one().amount
+
+
+def test_fidelity_ids_number_rows_from_zero(app, user):
+    stream_import(io.BytesIO(FIDELITY_CSV), user.id, FIDELITY_HISTORY, chunk_size=3)
+    assert [tx_id.split('_')[1] for tx_id in _ids(user)] == [str(row) for row in range(8)]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 100])
+def test_chunk_size_does_not_change_ids(app, user, chunk_size):
+    whole = stream_import(io.BytesIO(FIDELITY_CSV), user.id, FIDELITY_HISTORY, chunk_size=100)
+    expected = _ids(user)
+    assert whole.inserted == 8
+
+    # Re-importing the same file in chunks finds every row already present
+    again = stream_import(io.BytesIO(FIDELITY_CSV), user.id, FIDELITY_HISTORY, chunk_size=chunk_size)
+    assert again.inserted == 0
+    assert _ids(user) == expected
+    assert _aapl(user) == 8.0
+
+
+def test_resumed_import_matches_fresh_import(app, user):
+    def stop_after_first_chunk(rows, result):
+        raise RuntimeError('connection lost')
+
+    with pytest.raises(ImportInterrupted) as interrupted:
+        stream_import(io.BytesIO(FIDELITY_CSV), user.id, FIDELITY_HISTORY, chunk_size=3,
+                      progress=stop_after_first_chunk)
+    assert interrupted.value.rows_committed == 3
+    assert ImportCheckpoint.query.one().rows_committed == 3
+
+    result = stream_import(io.BytesIO(FIDELITY_CSV), user.id, FIDELITY_HISTORY, chunk_size=3)
+    assert result.inserted == 8
+    assert ImportCheckpoint.query.count() == 0
+    resumed = _ids(user)
+
+    fresh = stream_import(io.BytesIO(FIDELITY_CSV), user.id, FIDELITY_HISTORY, chunk_size=100)
+    assert fresh.inserted == 0
+    assert _ids(user) == resumed
+    assert len(resumed) == 8
+    assert _aapl(user) == 8.0
@@ -0,0 +1,93 @@
+from app.coinbase_clients import client_pool, credentials_for
+from app.lru import LRUCache
+from database.models import db
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_the_ttl():
+    clock = Clock()
+    cache = LRUCache(maxsize=4, ttl=10, clock=clock)
+    cache.put('a', 1)
+    clock.now = 10
+    assert cache.get('a') == 1
+
+    cache.put('b', 2)
+    clock.now = 10.5
+    assert cache.get('a') is None
+    assert cache.take(lambda key: key == 'a') is None
+    assert cache.expire() == []
+    clock.now = 21
+    assert cache.expire() == [2]
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = LRUCache(maxsize=2, ttl=60)
+    assert cache.put('a', 1) == []
+    cache.put('b', 2)
+    cache.get('a')
+    assert cache.put('c', 3) == [2]
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_get_loads_and_stores_missing_values():
+    loaded = []
+    cache = LRUCache(maxsize=2, ttl=60)
+
+    def load(key):
+        loaded.append(key)
+        return key.upper()
+
+    assert cache.get('a', load) == 'A'
+    assert cache.get('a', load) == 'A'
+    assert loaded == ['a']
+
+
+def test_explicit_invalidation():
+    cache = LRUCache(maxsize=8, ttl=60)
+    for key in [('u1', 'BTC'), ('u1', 'ETH'), ('u2', 'BTC')]:
+        cache.put(key, key[1])
+
+    assert cache.pop(('u1', 'ETH')) == 'ETH'
+    assert cache.pop(('u1', 'ETH')) is None
+    assert cache.discard(lambda key: key[1] == 'BTC') == ['BTC', 'BTC']
+    assert len(cache) == 0
+
+
+def test_take_returns_the_most_recent_match():
+    cache = LRUCache(maxsize=8, ttl=60)
+    cache.put(('u1', 0), 'first')
+    cache.put(('u2', 1), 'other')
+    cache.put(('u1', 2), 'second')
+    assert cache.take(lambda key: key[0] == 'u1') == 'second'
+    assert cache.take(lambda key: key[0] == 'u1') == 'first'
+    assert cache.take(lambda key: key[0] == 'u1') is None
+
+
+def test_credential_change_drops_pooled_clients(client, user):
+    user.set_coinbase_api_key('old-key')
+    user.set_coinbase_api_secret('old-secret')
+    db.session.commit()
+    pool = client_pool()
+    old = credentials_for(user)
+    with pool.client(old) as pooled:
+        pass
+    with pool.client(old) as reused:
+        assert reused is pooled
+
+    client.post('/update_coinbase_credentials', data={'api_key': 'new-key', 'api_secret': 'new-secret'})
+    db.session.refresh(user)
+
+    with pool.client(old) as after_change:
+        assert after_change is not pooled
+    with pool.client(credentials_for(user)) as fresh:
+        assert fresh.session.auth.api_key == 'new-key'
@@ -0,0 +1,49 @@
+from app.metrics import Counter, Histogram, Metrics
+
+
+def test_counter_text():
+    counter = Counter('jobs_total', 'Jobs run.', ('kind',))
+    counter.inc('sync')
+    counter.inc('sync', amount=2)
+    counter.inc('import "csv"\n')
+    assert list(counter.samples()) == [
+        'jobs_total{kind="import \\"csv\\"\\n"} 1',
+        'jobs_total{kind="sync"} 3',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('job_seconds', 'Job time.', ('kind',), buckets=(1, 0.5))
+    for value in (0.2, 0.5, 0.7, 3):
+        histogram.observe('sync', value=value)
+    assert list(histogram.samples()) == [
+        'job_seconds_bucket{kind="sync",le="0.5"} 2',
+        'job_seconds_bucket{kind="sync",le="1"} 3',
+        'job_seconds_bucket{kind="sync",le="+Inf"} 4',
+        'job_seconds_sum{kind="sync"} 4.4',
+        'job_seconds_count{kind="sync"} 4',
+    ]
+
+
+def test_render_lists_every_metric_with_help_and_type():
+    registry = Metrics()
+    registry.record_import('coinbase_csv', 'succeeded', 2.0, inserted=5, skipped=1)
+    text = registry.render()
+
+    assert text.endswith('\n')
+    for metric in registry.all():
+        assert f'# HELP {metric.name} {metric.documentation}\n# TYPE {metric.name} {metric.type}\n' in text
+    assert 'import_rows_total{kind="coinbase_csv",outcome="inserted"} 5\n' in text
+    assert 'import_rows_total{kind="coinbase_csv",outcome="failed"}' not in text
+    assert 'import_duration_seconds_count{kind="coinbase_csv",status="succeeded"} 1\n' in text
+
+
+def test_requests_show_up_on_the_endpoint(client):
+    client.get('/api/coinbase/holdings')
+    response = client.get('/metrics')
+
+    assert response.content_type == 'text/plain; version=0.0.4; charset=utf-8'
+    text = response.get_data(as_text=True)
+    assert 'http_requests_total{endpoint="api.holdings",method="GET",status="200"} 1\n' in text
+    assert 'http_request_duration_seconds_count{endpoint="api.holdings",method="GET"} 1\n' in text
+    assert 'sql_statements_total{context="request"}' in text
@@ -0,0 +1,75 @@
+from datetime import datetime
+from app.importers import bulk_insert_transactions, transaction_row
+from app.pagination import decode_token, encode_token, keyset_paginate
+from database.models import db, Transaction
+import base64
+import pytest
+
+# Three rows share a timestamp, so pages must break ties on the id
+TIMESTAMPS = [datetime(2024, 1, 1), datetime(2024, 1, 2), datetime(2024, 1, 2), datetime(2024, 1, 2),
+              datetime(2024, 1, 3)]
+
+
+@pytest.fixture
+def transactions(app, user):
+    bulk_insert_transactions([
+        transaction_row(f'tx-{i}', user.id, 'buy', 1.0, 'BTC', timestamp, 'coinbase', price=100.0)
+        for i, timestamp in enumerate(TIMESTAMPS)
+    ])
+    db.session.commit()
+    return Transaction.query.filter_by(user_id=user.id)
+
+
+def _ids(page):
+    return [tx.id for tx in page.items]
+
+
+def _newest_first(transactions):
+    return [tx.id for tx in transactions.order_by(Transaction.timestamp.desc(), Transaction.id.desc())]
+
+
+def _encode(raw):
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def test_token_round_trip(transactions):
+    tx = transactions.first()
+    assert decode_token(encode_token(tx)) == (tx.timestamp, tx.id)
+
+
+@pytest.mark.parametrize('token', [
+    None, '', '!!!', _encode('no separator'), _encode('2024-01-01T00:00:00|abc'), _encode('yesterday|3'),
+])
+def test_bad_tokens_decode_to_none(token):
+    assert decode_token(token) is None
+
+
+def test_bad_token_starts_from_the_newest_page(transactions):
+    page = keyset_paginate(transactions, 2, after='!!!')
+    assert _ids(page) == _newest_first(transactions)[:2]
+    assert not page.has_prev
+
+
+def test_pages_walk_through_equal_timestamps(transactions):
+    expected = _newest_first(transactions)
+    pages = [keyset_paginate(transactions, 2)]
+    while pages[-1].has_next:
+        pages.append(keyset_paginate(transactions, 2, after=pages[-1].next_token))
+
+    assert [_ids(page) for page in pages] == [expected[0:2], expected[2:4], expected[4:]]
+    assert not pages[0].has_prev and pages[0].has_next
+    assert pages[1].has_prev and pages[1].has_next
+    assert pages[-1].has_prev and not pages[-1].has_next
+
+    back = keyset_paginate(transactions, 2, before=pages[-1].prev_token)
+    assert _ids(back) == _ids(pages[1])
+    assert back.has_prev and back.has_next
+    first = keyset_paginate(transactions, 2, before=back.prev_token)
+    assert _ids(first) == _ids(pages[0])
+    assert not first.has_prev and first.has_next
+
+
+def test_single_page_has_no_neighbours(transactions):
+    page = keyset_paginate(transactions, 10)
+    assert _ids(page) == _newest_first(transactions)
+    assert not page.has_prev and not page.has_next
@@ -0,0 +1,56 @@
+from datetime import datetime
+from app.importers import bulk_insert_transactions, transaction_row
+from app.prices import latest_prices, load_price_csv, price_series
+from database.models import db, User
+import io
+
+
+def _buy(tx_id, user_id, currency, source, price, day=1):
+    return transaction_row(tx_id, user_id, 'buy', 1.0, currency, datetime(2024, 1, day, 12), source, price=price)
+
+
+def test_transaction_prices_are_kept_per_user_and_source(app, user):
+    other = User(username='bob', email='bob@example.com', password='unused')
+    db.session.add(other)
+    db.session.commit()
+    bulk_insert_transactions([
+        _buy('cb-1', user.id, 'BTC', 'coinbase', 40000.0),
+        _buy('fid-1', user.id, 'BTC', 'fidelity', 40.0),
+        _buy('cb-2', other.id, 'BTC', 'coinbase', 1.0, day=2),
+    ])
+    db.session.commit()
+
+    assert latest_prices(user.id, 'coinbase', ['BTC']) == {'BTC': 40000.0}
+    assert latest_prices(user.id, 'fidelity', ['BTC']) == {'BTC': 40.0}
+    assert latest_prices(other.id, 'coinbase', ['BTC']) == {'BTC': 1.0}
+    assert latest_prices(other.id, 'fidelity', ['BTC']) == {}
+
+
+def test_loaded_prices_are_shared_within_their_source(app, user):
+    bulk_insert_transactions([_buy('cb-1', user.id, 'BTC', 'coinbase', 40000.0, day=3)])
+    db.session.commit()
+    load_price_csv(io.StringIO('date,close\n2024-01-03,42000\n2024-01-04,43000\n'), 'coinbase', 'BTC')
+
+    # A loaded price wins over the user's transaction price of the same day
+    assert price_series(user.id, 'coinbase', 'BTC').prices.tolist() == [42000.0, 43000.0]
+    assert latest_prices(None, 'coinbase', ['BTC']) == {'BTC': 43000.0}
+    assert latest_prices(user.id, 'fidelity', ['BTC']) == {}
+
+
+def test_only_inserted_rows_record_prices(app, user):
+    other = User(username='bob', email='bob@example.com', password='unused')
+    db.session.add(other)
+    db.session.commit()
+    bulk_insert_transactions([_buy('cb-1', user.id, 'BTC', 'coinbase', 40000.0)])
+    db.session.commit()
+
+    # A re-import of the same ID, even by another user, is skipped and records nothing
+    result = bulk_insert_transactions([
+        _buy('cb-1', user.id, 'BTC', 'coinbase', 1.0),
+        _buy('cb-1', other.id, 'BTC', 'coinbase', 2.0),
+    ])
+    db.session.commit()
+
+    assert (result.inserted, result.skipped) == (0, 2)
+    assert latest_prices(user.id, 'coinbase', ['BTC']) == {'BTC': 40000.0}
+    assert latest_prices(other.id, 'coinbase', ['BTC']) == {}
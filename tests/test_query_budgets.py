@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from app.importers import bulk_insert_transactions, transaction_row
+from database.audit import assert_max_queries
+from database.models import db
+import pytest
+
+# Statements per request once the user, price and cost basis caches are warm.
+# The counts must not grow with the number of transactions.
+BUDGETS = [
+    ('/', 9),
+    ('/coinbase/transactions', 7),
+    ('/coinbase/transactions?currency=BTC', 6),
+    ('/fidelity/transactions', 7),
+    ('/api/coinbase/holdings', 2),
+    ('/api/fidelity/holdings', 2),
+    ('/api/coinbase/transactions', 3),
+    ('/api/coinbase/transactions?currency=BTC&type=buy&since=2024-02-01', 2),
+    ('/api/coinbase/charts?currency=BTC,ETH', 2),
+    ('/api/fidelity/charts', 2),
+]
+
+
+def _seed(user, count):
+    start = datetime(2024, 1, 1)
+    rows = []
+    for i in range(count):
+        sell = i % 3 == 0
+        rows.append(transaction_row(
+            f'cb-{i}', user.id, 'sell' if sell else 'buy', -0.5 if sell else 1.0, ('BTC', 'ETH', 'SOL')[i % 3],
+            start + timedelta(hours=7 * i), 'coinbase', price=100.0 + i))
+        rows.append(transaction_row(
+            f'fid-{i}', user.id, 'Buy', 1.0, ('AAPL', 'MSFT')[i % 2],
+            start + timedelta(hours=9 * i), 'fidelity', price=50.0 + i))
+    bulk_insert_transactions(rows)
+    db.session.commit()
+
+
+@pytest.mark.parametrize('count', [30, 300])
+@pytest.mark.parametrize('path, budget', BUDGETS)
+def test_route_query_budget(client, user, path, budget, count):
+    _seed(user, count)
+    assert client.get(path).status_code == 200
+    with assert_max_queries(budget, label=path):
+        assert client.get(path).status_code == 200
+
+
+@pytest.mark.parametrize('path', [path for path, _ in BUDGETS])
+def test_not_modified_costs_one_query(client, user, path):
+    _seed(user, 30)
+    etag = client.get(path).headers['ETag']
+    with assert_max_queries(1, label=path):
+        assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
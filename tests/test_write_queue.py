@@ -0,0 +1,63 @@
+from database.engine import WriteQueue
+import pytest
+import threading
+import time
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def test_waiters_are_served_in_arrival_order():
+    queue = WriteQueue()
+    order = []
+
+    def write(label):
+        with queue.hold(label):
+            order.append(label)
+
+    threads = []
+    with queue.hold('first'):
+        for i in range(5):
+            thread = threading.Thread(target=write, args=(i,))
+            thread.start()
+            threads.append(thread)
+            # Each writer takes its ticket before the next one starts
+            _wait_for(lambda: queue.stats()['contended'] == i + 1)
+        order.append('first')
+    for thread in threads:
+        thread.join()
+
+    assert order == ['first', 0, 1, 2, 3, 4]
+    assert queue.stats()['holds'] == 6
+
+
+def test_holds_are_reentrant_for_the_owner():
+    queue = WriteQueue()
+    with queue.hold('outer'):
+        with queue.hold('inner'):
+            pass
+    assert queue.stats()['holds'] == 1
+
+
+def test_exceptions_propagate_and_release_the_queue():
+    queue = WriteQueue()
+    with pytest.raises(RuntimeError, match='write failed'):
+        with queue.hold('outer'):
+            with queue.hold('inner'):
+                raise RuntimeError('write failed')
+
+    acquired = []
+
+    def write():
+        with queue.hold('next'):
+            acquired.append(True)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    thread.join(timeout=5)
+    assert acquired == [True]
+    assert queue.stats()['holds'] == 2